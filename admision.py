@@ -0,0 +1,127 @@
+"""
+Control de admisión de las solicitudes que procesan CSV.
+
+Waitress atiende todas las solicitudes con unos pocos hilos. Las que leen y
+procesan archivos ocupan un hilo durante segundos o minutos, así que se
+limitan de dos formas: cuántas pueden ejecutarse a la vez (dejando hilos
+libres para el inicio de sesión, los archivos estáticos y las consultas de
+estado) y cuántas filas estimadas pueden procesarse a la vez. Cuando no hay
+capacidad, la solicitud se rechaza de inmediato con 429 y Retry-After en
+lugar de quedar esperando un hilo.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from metricas import incrementar, registrar_indicador
+
+# =============================================================================
+# CONFIGURACIÓN DE LA ADMISIÓN
+# =============================================================================
+
+load_dotenv()
+
+# Hilos de Waitress; los de la vía rápida quedan reservados para el resto
+HILOS_SERVIDOR = int(os.getenv('HILOS_SERVIDOR') or '4')
+HILOS_VIA_RAPIDA = int(os.getenv('HILOS_VIA_RAPIDA') or '1')
+MAX_SOLICITUDES_PESADAS = max(1, HILOS_SERVIDOR - HILOS_VIA_RAPIDA)
+
+# Filas estimadas que se procesan a la vez dentro de las solicitudes y que
+# pueden quedar en cola en los trabajos en segundo plano
+MAX_FILAS_EN_PROCESO = int(os.getenv('MAX_FILAS_EN_PROCESO') or '2000000')
+MAX_FILAS_EN_COLA = int(os.getenv('MAX_FILAS_EN_COLA') or '20000000')
+
+REINTENTAR_DESPUES = int(os.getenv('REINTENTAR_DESPUES_SEGUNDOS') or '15')
+
+# =============================================================================
+# CONTROL DE CAPACIDAD
+# =============================================================================
+
+
+class ServidorOcupado(Exception):
+    """No hay capacidad para admitir la solicitud; ``reintentar`` en segundos."""
+
+    def __init__(self, mensaje, reintentar=REINTENTAR_DESPUES):
+        super().__init__(mensaje)
+        self.reintentar = reintentar
+
+
+class ControlAdmision:
+    """Reserva cupos de solicitudes y de filas sin bloquear al que llama.
+
+    Una solicitud cuyo costo supera la capacidad total se admite solo si no
+    hay otra en proceso, para que los archivos grandes no queden rechazados
+    para siempre.
+    """
+
+    def __init__(self, max_solicitudes, max_costo):
+        self.max_solicitudes = max_solicitudes
+        self.max_costo = max_costo
+        self.solicitudes = 0
+        self.costo = 0
+        self._bloqueo = threading.Lock()
+
+    def reservar_solicitud(self):
+        """Ocupa un cupo de solicitud pesada o lanza ServidorOcupado."""
+        with self._bloqueo:
+            if self.solicitudes >= self.max_solicitudes:
+                incrementar('admision_rechazos_total', motivo='solicitudes')
+                raise ServidorOcupado('El servidor está procesando otros archivos')
+            self.solicitudes += 1
+
+    def liberar_solicitud(self):
+        """Devuelve el cupo de solicitud pesada."""
+        with self._bloqueo:
+            self.solicitudes -= 1
+
+    def reservar_costo(self, costo):
+        """Reserva ``costo`` filas estimadas o lanza ServidorOcupado."""
+        with self._bloqueo:
+            if self.costo and self.costo + costo > self.max_costo:
+                incrementar('admision_rechazos_total', motivo='filas')
+                raise ServidorOcupado('El servidor está procesando demasiados datos')
+            self.costo += costo
+
+    def liberar_costo(self, costo):
+        """Devuelve las filas reservadas."""
+        with self._bloqueo:
+            self.costo -= costo
+
+    @contextmanager
+    def solicitud(self):
+        """Cupo de solicitud pesada durante el bloque."""
+        self.reservar_solicitud()
+        try:
+            yield
+        finally:
+            self.liberar_solicitud()
+
+    @contextmanager
+    def procesamiento(self, costo):
+        """Filas estimadas reservadas durante el bloque."""
+        self.reservar_costo(costo)
+        try:
+            yield
+        finally:
+            self.liberar_costo(costo)
+
+
+control = ControlAdmision(MAX_SOLICITUDES_PESADAS, MAX_FILAS_EN_PROCESO)
+
+registrar_indicador('admision_solicitudes_pesadas', lambda: control.solicitudes,
+                    'Solicitudes que están procesando archivos')
+registrar_indicador('admision_filas_en_proceso', lambda: control.costo,
+                    'Filas estimadas en proceso dentro de las solicitudes')
+
+
+def verificar_cola(costo, costo_pendiente):
+    """Lanza ServidorOcupado si encolar ``costo`` filas excede MAX_FILAS_EN_COLA.
+
+    Igual que en ControlAdmision, un trabajo grande se admite si la cola
+    está vacía.
+    """
+    if costo_pendiente and costo_pendiente + costo > MAX_FILAS_EN_COLA:
+        incrementar('admision_rechazos_total', motivo='cola')
+        raise ServidorOcupado('Hay demasiados reportes en cola', REINTENTAR_DESPUES * 4)
@@ -5,18 +5,47 @@ Este módulo contiene una aplicación web que permite a los usuarios
 autenticarse y procesar archivos CSV de reportes de impresión,
 generando archivos Excel con tablas dinámicas y filtros aplicados.
 """
-import os
+import hashlib
+import hmac
 import io
+import os
 import sys
-import tempfile
-from flask import Flask, render_template, request, redirect, url_for, session, send_file, flash
+import threading
+import time
+import zipfile
+from flask import (Flask, render_template, request, redirect, url_for, session,
+                   send_file, flash, jsonify, Response)
 import mysql.connector
+from mysql.connector import pooling
 import pandas as pd
-import chardet
-import xlwings as xw
 from dotenv import load_dotenv
-from openpyxl.worksheet.table import Table, TableStyleInfo
-from openpyxl.styles import Font
+from procesamiento import (
+    MAX_ARCHIVOS_LOTE, MODO_EXCEL, TIPO_REPORTE_DETALLADO, TIPO_REPORTE_RESUMEN,
+    TIPOS_REPORTE, detectar_encoding, extraer_csvs_zip, generar_reporte_combinado,
+    estimar_filas_csv, guardar_archivo_temporal, leer_encabezados_csv,
+    leer_y_procesar_csvs, validar_encabezados_csv
+)
+from admision import ServidorOcupado, control
+from cache_reportes import cache_habilitada, calcular_clave, estadisticas_cache
+from exportacion import (
+    FILAS_POR_PAGINA, FORMATO_CSV, FORMATO_JSON, FORMATOS_EXPORTACION, HOJA_GENERAL,
+    TIPOS_ACEPTADOS, exportar_csv_gz, exportar_parquet, formatos_disponibles,
+    hojas_disponibles, pagina_json, seleccionar_hoja
+)
+from historial import (
+    DIMENSIONES_CUBO, HISTORIAL_HABILITADO, actualizar_historial,
+    leer_cubos, leer_historial
+)
+from resumen import calcular_totales_cubo, resumir
+from metricas import (
+    exponer_metricas, medir_etapa, memoria_actual_bytes, memoria_pico_bytes, registrar_etapa,
+    registrar_indicador
+)
+from trabajos import (
+    ESTADO_COMPLETADO, crear_trabajo, crear_trabajo_historial, describir_trabajo,
+    finalizar_descarga, guardar_datos_api, iniciar_descarga, leer_datos_api,
+    memoria_pico_trabajos, obtener_trabajo
+)
 
 # =============================================================================
 # CONFIGURACIÓN DE LA APLICACIÓN
@@ -53,37 +82,68 @@ if missing_vars:
     print("Por favor, configura tu archivo .env")
     sys.exit(1)
 
-# Configuración de filtros para reportes
-FILTROS_CONFIG = {
-    'SURCO - HP': {
-        'impresora': 'HP LJ300-400 color M351-M451 PCL 6',
-        'solo_impresora': True
-    },
-    'SURCO - XEROX': {
-        'impresora': 'Xerox WorkCentre 3225',
-        'solo_impresora': True
-    },
-    'SAN ISIDRO - EPSON': {
-        'impresora': 'L4260 Series(Network)',
-        'solo_impresora': True
-    }
-}
+# Pool de conexiones y caché de credenciales verificadas
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE') or '5')
+TTL_CACHE_CREDENCIALES = int(os.getenv('TTL_CACHE_CREDENCIALES') or '300')  # Segundos
+
+# CSV de hasta este tamaño se procesan en la misma solicitud y el Excel se
+# arma en memoria, sin encolar un trabajo (0 = siempre en segundo plano)
+REPORTE_EN_MEMORIA_MAX_KB = int(os.getenv('REPORTE_EN_MEMORIA_MAX_KB') or '1024')
+
+NOMBRE_DESCARGA = "Reporte de Impresiones.xlsx"
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
-# Encabezados requeridos para el CSV
-ENCABEZADOS_REQUERIDOS = [
-    'Hora', 'Usuario', 'Páginas', 'Copias', 'Impresora',
-    'Nombre Documento', 'Cliente', 'Formato Papel', 'Idioma',
-    'Altura', 'Anchura', 'Frente/reverso', 'Escala de grises', 'Formato'
-]
+# Tamaño máximo de cada solicitud; Werkzeug la rechaza con 413 antes de
+# leer el cuerpo (los servidores usan el mismo límite al recibirla)
+MAX_SUBIDA_MB = int(os.getenv('MAX_SUBIDA_MB') or '512')
+MAX_SUBIDA_BYTES = MAX_SUBIDA_MB * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_SUBIDA_BYTES
+
+# Token opcional para leer /metrics (Authorization: Bearer <token>)
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN')
 
 # =============================================================================
 # FUNCIONES DE BASE DE DATOS - MEJORADAS
 # =============================================================================
 
+_pool_db = None
+_bloqueo_pool = threading.Lock()
+
+# Caché en memoria: usuario -> (huella de la contraseña, vencimiento)
+_cache_credenciales = {}
+_bloqueo_cache = threading.Lock()
+_clave_cache = os.urandom(32)
+
+
+def obtener_pool_db():
+    """Devuelve el pool de conexiones MySQL, creándolo la primera vez."""
+    global _pool_db
+    with _bloqueo_pool:
+        if _pool_db is None:
+            _pool_db = pooling.MySQLConnectionPool(
+                pool_name='reportes_impresiones',
+                pool_size=DB_POOL_SIZE,
+                pool_reset_session=True,
+                **DB_CONFIG
+            )
+        return _pool_db
+
+
 def conectar_db():
-    """Establece conexión con la base de datos MySQL."""
+    """Obtiene una conexión del pool, verificando que siga activa.
+
+    Al cerrar la conexión obtenida, esta vuelve al pool. Si el pool está
+    agotado se abre una conexión directa para no rechazar el inicio de sesión.
+    """
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        try:
+            connection = obtener_pool_db().get_connection()
+        except mysql.connector.errors.PoolError as error:
+            print(f"Pool de conexiones agotado, usando conexión directa: {error}")
+            connection = mysql.connector.connect(**DB_CONFIG)
+
+        # Reconecta si el servidor cerró la conexión inactiva
+        connection.ping(reconnect=True, attempts=1, delay=0)
         if connection.is_connected():
             return connection
         return None
@@ -92,8 +152,47 @@ def conectar_db():
         return None
 
 
+def _huella_password(password):
+    """Huella HMAC de la contraseña; la caché nunca guarda el texto original."""
+    return hmac.new(_clave_cache, password.encode('utf-8'), hashlib.sha256).digest()
+
+
+def credenciales_en_cache(usuario, password):
+    """Indica si las credenciales se verificaron hace menos de TTL_CACHE_CREDENCIALES."""
+    with _bloqueo_cache:
+        entrada = _cache_credenciales.get(usuario)
+        if entrada is None:
+            return False
+        huella, vencimiento = entrada
+        if vencimiento < time.monotonic():
+            del _cache_credenciales[usuario]
+            return False
+    return hmac.compare_digest(huella, _huella_password(password))
+
+
+def guardar_credenciales_en_cache(usuario, password):
+    """Guarda la huella de credenciales verificadas y descarta las vencidas."""
+    if TTL_CACHE_CREDENCIALES <= 0:
+        return
+    ahora = time.monotonic()
+    with _bloqueo_cache:
+        vencidos = [nombre for nombre, (_, vencimiento) in _cache_credenciales.items()
+                    if vencimiento < ahora]
+        for nombre in vencidos:
+            del _cache_credenciales[nombre]
+        _cache_credenciales[usuario] = (_huella_password(password),
+                                        ahora + TTL_CACHE_CREDENCIALES)
+
+
 def validar_credenciales(usuario, password):
-    """Valida las credenciales del usuario contra la base de datos."""
+    """Valida las credenciales del usuario contra la base de datos.
+
+    Las credenciales verificadas recientemente se validan desde la caché
+    sin consultar la base de datos.
+    """
+    if credenciales_en_cache(usuario, password):
+        return True
+
     conexion = None
     cursor = None
 
@@ -110,7 +209,9 @@ def validar_credenciales(usuario, password):
 
         if resultado:
             contraseña_en_bd = resultado[0]
-            return contraseña_en_bd == password
+            if contraseña_en_bd == password:
+                guardar_credenciales_en_cache(usuario, password)
+                return True
         return False
 
     except mysql.connector.InterfaceError as e:
@@ -126,284 +227,12 @@ def validar_credenciales(usuario, password):
         flash('Error inesperado. Por favor, contacta al administrador.', 'danger')
         return False
     finally:
-        # Cerrar cursor y conexión para evitar memory leaks
+        # Cerrar cursor y devolver la conexión al pool
         if cursor:
             cursor.close()
         if conexion and conexion.is_connected():
             conexion.close()
 
-# =============================================================================
-# FUNCIONES DE PROCESAMIENTO DE DATOS
-# =============================================================================
-
-
-def normalizar_encabezado(header):
-    """Normaliza encabezados eliminando espacios y convirtiendo a minúsculas."""
-    return str(header).strip().lower()
-
-
-def validar_encabezados_csv(df):
-    """Valida que el DataFrame contenga todos los encabezados requeridos."""
-    encabezados_encontrados = [
-        normalizar_encabezado(col)
-        for col in df.columns.tolist()
-    ]
-    encabezados_requeridos_norm = [
-        normalizar_encabezado(header)
-        for header in ENCABEZADOS_REQUERIDOS
-    ]
-
-    encabezados_faltantes = [
-        ENCABEZADOS_REQUERIDOS[i]
-        for i, header_norm in enumerate(
-            encabezados_requeridos_norm
-        )
-        if header_norm not in encabezados_encontrados
-    ]
-
-    return encabezados_faltantes
-
-
-def procesar_dataframe(df):
-    """Procesa el DataFrame agregando columnas de Mes y Año por separado,
-     columna de impresiones y eliminando columnas innecesarias."""
-    
-    # Agregar columnas de Mes y Año basadas en la columna A
-    if len(df.columns) >= 1:
-        # Convertir la columna A a datetime
-        fechas = pd.to_datetime(df.iloc[:, 0], errors='coerce')
-        
-        # Diccionario para traducir meses al español
-        meses_es = {
-            1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
-            5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
-            9: 'Setiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-        }
-        
-        # Extraer mes y año por separado
-        meses = fechas.apply(lambda x: meses_es[x.month] if pd.notna(x) else "")
-        años = fechas.apply(lambda x: str(x.year) if pd.notna(x) else "")
-        
-        # Insertar la columna "Mes" en la posición B (índice 1)
-        df.insert(1, 'Mes', meses)
-        
-        # Insertar la columna "Año" en la posición C (índice 2)
-        df.insert(2, 'Año', años)
-    
-    # Agregar la columna "Impresiones" después de las nuevas columnas
-    # Ahora las columnas C y D originales están en posiciones 4 y 5
-    if len(df.columns) >= 6:  # Ahora necesitamos al menos 6 columnas (A, Mes, Año, B, C, D)
-        # Las columnas C y D originales ahora están en índices 4 y 5
-        columna_c = pd.to_numeric(df.iloc[:, 4], errors='coerce').fillna(0)
-        columna_d = pd.to_numeric(df.iloc[:, 5], errors='coerce').fillna(0)
-        
-        # Calcular las impresiones (C * D)
-        impresiones = columna_c * columna_d
-        
-        # Insertar la columna "Impresiones" en la posición 7 (después de las 6 columnas existentes)
-        df.insert(6, 'Impresiones', impresiones)
-    
-    # Eliminar las columnas I, J, K, L (ahora serían índices más altos debido a las nuevas columnas)
-    # Las columnas originales I, J, K, L ahora están en posiciones 11, 12, 13, 14
-    columnas_a_eliminar = [i for i in [11, 12, 13, 14] if i < len(df.columns)]
-    
-    # Eliminar las columnas de forma descendente
-    for indice in reversed(columnas_a_eliminar):
-        df = df.drop(df.columns[indice], axis=1)
-    
-    return df
-
-def filtrar_dataframe(df, config):
-    """Filtra el DataFrame según la configuración proporcionada."""
-    if config.get('solo_impresora', True):
-        return df[df['Impresora'] == config['impresora']]
-    return df[
-        (df['Impresora'].str.contains(config['impresora'],
-                                      case=False, na=False)) &
-        (df['Cliente'].str.contains(config['cliente'],
-                                    case=False, na=False))
-    ]
-
-# =============================================================================
-# FUNCIONES DE EXCEL
-# =============================================================================
-
-def ajustar_ancho_columnas(sheet):
-    """Ajusta automáticamente el ancho de las columnas en una hoja de Excel."""
-    for column in sheet.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-
-        for cell in column:
-            try:
-                if cell.value:
-                    length = len(str(cell.value))
-                    max_length = max(max_length, length)
-            except (TypeError, AttributeError):
-                pass
-
-        adjusted_width = max_length + 2
-        sheet.column_dimensions[column_letter].width = adjusted_width
-
-
-def convertir_a_tabla(sheet, dataframe, nombre_tabla):
-    """Convierte un rango de datos en una tabla de Excel con formato."""
-    if dataframe.shape[0] == 0:
-        return None
-
-    max_row = dataframe.shape[0] + 1
-    max_col = dataframe.shape[1]
-
-    # Calcular la letra de la columna final
-    if max_col <= 26:
-        end_col = chr(64 + max_col)
-    else:
-        end_col = (chr(64 + (max_col - 1) // 26) +
-                   chr(65 + (max_col - 1) % 26))
-
-    rango_tabla = f"A1:{end_col}{max_row}"
-
-    # Crear tabla con estilo
-    tabla = Table(displayName=nombre_tabla, ref=rango_tabla)
-    style = TableStyleInfo(
-        name="TableStyleLight9",
-        showFirstColumn=False,
-        showLastColumn=False,
-        showRowStripes=True,
-        showColumnStripes=False
-    )
-    tabla.tableStyleInfo = style
-    sheet.add_table(tabla)
-
-    # Aplicar fuente Calibri 14
-    for row in range(1, max_row + 1):
-        for col in range(1, max_col + 1):
-            cell = sheet.cell(row=row, column=col)
-            cell.font = Font(name="Calibri", size=14)
-
-    # Autoajustar columnas
-    ajustar_ancho_columnas(sheet)
-
-    # Autoajustar altura de filas
-    for row in sheet.iter_rows():
-        sheet.row_dimensions[row[0].row].height = None
-
-    return True
-
-
-def crear_tabla_dinamica(wb, sheet_datos):
-    """Crea una tabla dinámica en el libro de Excel."""
-    try:
-        # Crear nueva hoja para tabla dinámica
-        sheet_pivot = wb.sheets.add('TABLA DINAMICA')
-
-        # Obtener el rango de datos
-        data_range = sheet_datos.range('A1').expand()
-        sheet_name = sheet_datos.name
-        source_data = f"'{sheet_name}'!{data_range.address}"
-
-        # Crear PivotCache y PivotTable
-        pivot_cache = wb.api.PivotCaches().Create(
-            SourceType=1,  # xlDatabase
-            SourceData=source_data
-        )
-
-        pivot_table = pivot_cache.CreatePivotTable(
-            TableDestination=sheet_pivot.range('C3').api,
-            TableName='TablaDinamica1'
-        )
-
-        # Aplicar formato
-        pivot_range = pivot_table.TableRange2
-        pivot_range.Font.Name = "Calibri"
-        pivot_range.Font.Size = 14
-        pivot_table.TableStyle2 = "PivotStyleLight9"
-
-        # Autoajustar columnas y filas
-        pivot_range.Columns.AutoFit()
-        pivot_range.Rows.AutoFit()
-
-        # Configurar campos de COLUMNAS (AÑO y MES)
-        pivot_table.PivotFields('Año').Orientation = 2  # xlColumnField
-        pivot_table.PivotFields('Año').Position = 1
-
-        pivot_table.PivotFields('Mes').Orientation = 2  # xlColumnField
-        pivot_table.PivotFields('Mes').Position = 2
-
-        # Configurar campos de FILAS (Impresora y Usuario)
-        pivot_table.PivotFields('Impresora').Orientation = 1  # xlRowField
-        pivot_table.PivotFields('Impresora').Position = 1
-
-        pivot_table.PivotFields('Usuario').Orientation = 1  # xlRowField
-        pivot_table.PivotFields('Usuario').Position = 2
-
-        # Agregar campo de valor
-        data_field = pivot_table.AddDataField(
-            pivot_table.PivotFields('Impresiones'),
-            'Suma de Impresiones',
-            -4157  # xlSum
-        )
-        data_field.NumberFormat = "#,##0"
-
-        # Expandir campos
-        pivot_table.PivotFields('Impresora').ShowDetail = True
-        pivot_table.PivotFields('AÑO').ShowDetail = True
-
-        return True
-    except (AttributeError, KeyError, ValueError) as e:
-        print(f"Error al crear tabla dinámica: {e}")
-        return False
-
-
-def generar_excel(df):
-    """Genera el archivo Excel completo con todas las hojas y formatos."""
-    with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as temp_file:
-        temp_path = temp_file.name
-
-    # Crear archivo Excel básico con pandas
-    with pd.ExcelWriter(temp_path, engine='openpyxl') as writer:
-        # Hoja general
-        df.to_excel(writer, index=False, sheet_name='GENERAL')
-
-        # Hojas filtradas
-        dataframes_filtrados = {}
-        for nombre_hoja, config in FILTROS_CONFIG.items():
-            df_filtrado = filtrar_dataframe(df, config)
-            df_filtrado.to_excel(writer, index=False, sheet_name=nombre_hoja)
-            dataframes_filtrados[nombre_hoja] = df_filtrado
-
-        # Aplicar formato a todas las hojas
-        workbook = writer.book
-
-        # Formatear hoja general
-        convertir_a_tabla(workbook['GENERAL'], df, "TablaGeneral")
-
-        # Formatear hojas filtradas
-        for nombre_hoja, df_filtrado in dataframes_filtrados.items():
-            nombre_tabla = nombre_hoja.replace(' ', '_').replace('-', '_')
-            convertir_a_tabla(workbook[nombre_hoja], df_filtrado,
-                               f"Tabla{nombre_tabla}")
-
-    # Crear tabla dinámica con xlwings
-    try:
-        app_xw = xw.App(visible=False)
-        wb = app_xw.books.open(temp_path)
-
-        try:
-            sheet_datos = wb.sheets['GENERAL']
-            crear_tabla_dinamica(wb, sheet_datos)
-            wb.save()
-        except (AttributeError, KeyError) as e:
-            print(f"Error al crear tabla dinámica: {e}")
-        finally:
-            wb.close()
-            app_xw.quit()
-
-    except (ImportError, OSError) as e:
-        print(f"Error con xlwings: {e}")
-
-    return temp_path
-
 # =============================================================================
 # DECORADORES
 # =============================================================================
@@ -418,6 +247,48 @@ def login_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+
+def solicitud_pesada(*metodos):
+    """Decorador para rutas que procesan archivos con los métodos indicados.
+
+    Cada solicitud ocupa un cupo de la vía pesada mientras se ejecuta; sin
+    cupo se responde 429, así los hilos restantes quedan para las rutas
+    livianas (inicio de sesión, estáticos, estado de los trabajos).
+    """
+    def decorador(f):
+        def decorated_function(*args, **kwargs):
+            if request.method not in metodos:
+                return f(*args, **kwargs)
+            with control.solicitud():
+                return f(*args, **kwargs)
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorador
+
+# =============================================================================
+# MANEJO DE ERRORES
+# =============================================================================
+
+
+@app.errorhandler(413)
+def solicitud_demasiado_grande(_error):
+    """Respuesta cuando la subida supera MAX_SUBIDA_MB."""
+    return jsonify({
+        'error': f'Los archivos superan el tamaño máximo permitido ({MAX_SUBIDA_MB} MB)'
+    }), 413
+
+
+@app.errorhandler(ServidorOcupado)
+def servidor_ocupado(error):
+    """Respuesta 429 con Retry-After cuando no hay capacidad de procesamiento."""
+    respuesta = jsonify({
+        'error': f'{error}. Intenta nuevamente en {error.reintentar} segundos.',
+        'reintentar': error.reintentar
+    })
+    respuesta.status_code = 429
+    respuesta.headers['Retry-After'] = str(error.reintentar)
+    return respuesta
+
 # =============================================================================
 # RUTAS DE LA APLICACIÓN
 # =============================================================================
@@ -456,75 +327,476 @@ def logout():
 @login_required
 def reportes():
     """Ruta principal de reportes."""
-    return render_template('reportes.html')
+    return render_template('reportes.html', max_subida=MAX_SUBIDA_BYTES)
+
+
+def _eliminar_archivos(rutas):
+    """Elimina los CSV temporales de una subida rechazada."""
+    for _, ruta in rutas:
+        try:
+            os.unlink(ruta)
+        except OSError:
+            pass
+
+
+def _guardar_subida(archivos_subidos):
+    """Guarda los CSV subidos y los extraídos de cada ZIP; devuelve (nombre, ruta)."""
+    rutas = []
+    try:
+        for archivo in archivos_subidos:
+            if archivo.filename.lower().endswith('.zip'):
+                ruta_zip = guardar_archivo_temporal(archivo, sufijo='.zip')
+                try:
+                    rutas += extraer_csvs_zip(ruta_zip)
+                finally:
+                    os.unlink(ruta_zip)
+            else:
+                rutas.append((archivo.filename, guardar_archivo_temporal(archivo)))
+    except Exception:
+        _eliminar_archivos(rutas)
+        raise
+    return rutas
+
+
+def _preparar_subida():
+    """Guarda y valida los CSV (o ZIP) de la solicitud.
+
+    Devuelve ((archivos, tamaño total, duración de la decodificación), None)
+    con ``archivos`` como lista de (ruta, encoding, columnas), o
+    (None, respuesta de error) si la subida no es válida.
+    """
+    archivos_subidos = [archivo for archivo in request.files.getlist('archivo')
+                        if archivo and archivo.filename]
+
+    # Validaciones básicas
+    if not archivos_subidos:
+        return None, (jsonify({'error': 'Por favor, selecciona un archivo CSV antes de continuar'}), 400)
+
+    if any(not archivo.filename.lower().endswith(('.csv', '.zip'))
+           for archivo in archivos_subidos):
+        return None, (jsonify({'error': 'Por favor selecciona archivos CSV (.csv) o ZIP (.zip) válidos'}), 400)
+
+    # Guardar los archivos en disco para no mantenerlos completos en memoria
+    inicio_subida = time.time()
+    try:
+        rutas = _guardar_subida(archivos_subidos)
+    except (zipfile.BadZipFile, ValueError) as e:
+        print(f"Error al extraer el ZIP: {e}")
+        mensaje = str(e) if isinstance(e, ValueError) else 'El archivo ZIP no es válido'
+        return None, (jsonify({'error': mensaje}), 400)
+
+    if not rutas:
+        return None, (jsonify({'error': 'El archivo ZIP no contiene archivos CSV'}), 400)
+    if len(rutas) > MAX_ARCHIVOS_LOTE:
+        _eliminar_archivos(rutas)
+        return None, (jsonify({'error': f'Se pueden combinar hasta {MAX_ARCHIVOS_LOTE} archivos CSV'}), 400)
+
+    tamaño_csv = sum(os.path.getsize(ruta) for _, ruta in rutas)
+    registrar_etapa('subida', time.time() - inicio_subida, bytes_=tamaño_csv,
+                    memoria_residente=memoria_actual_bytes())
+
+    # Detectar encoding y validar encabezados de cada CSV antes de procesarlos
+    inicio_decodificacion = time.time()
+    archivos = []
+    for nombre, ruta_csv in rutas:
+        # En lotes, los errores indican qué archivo los produjo
+        prefijo = f"{nombre}: " if len(rutas) > 1 else ''
+        try:
+            encoding = detectar_encoding(ruta_csv)
+            encabezados = leer_encabezados_csv(ruta_csv, encoding)
+        except (pd.errors.EmptyDataError, pd.errors.ParserError,
+                UnicodeDecodeError) as e:
+            print(f"Error al procesar archivo {nombre}: {e}")
+            _eliminar_archivos(rutas)
+            return None, (jsonify({'error': f'{prefijo}Archivo CSV inválido o formato incorrecto'}), 400)
+
+        encabezados_faltantes = validar_encabezados_csv(encabezados)
+        if encabezados_faltantes:
+            _eliminar_archivos(rutas)
+            return None, (jsonify({
+                'error': f'{prefijo}El archivo CSV no contiene los encabezados requeridos: '
+                         f"{', '.join(encabezados_faltantes)}"
+            }), 422)
+        archivos.append((ruta_csv, encoding, list(encabezados.columns)))
+
+    duracion_decodificacion = round(time.time() - inicio_decodificacion, 3)
+    registrar_etapa('decodificacion', duracion_decodificacion, bytes_=tamaño_csv,
+                    memoria_residente=memoria_actual_bytes())
+    return (archivos, tamaño_csv, duracion_decodificacion), None
 
 
 @app.route('/subir_csv', methods=['GET', 'POST'])
 @login_required
+@solicitud_pesada('POST')
 def subir_csv():
-    """Ruta para subir y procesar archivos CSV."""
+    """Ruta para subir y procesar uno o varios archivos CSV (o un ZIP con ellos)."""
     if request.method == 'GET':
-        return render_template('reportes.html')
+        return render_template('reportes.html', max_subida=MAX_SUBIDA_BYTES)
 
     # POST method handling
-    archivo = request.files.get('archivo')
+    tipo_reporte = request.form.get('tipo_reporte') or TIPO_REPORTE_DETALLADO
+    if tipo_reporte not in TIPOS_REPORTE:
+        return jsonify({'error': 'Tipo de reporte no válido'}), 400
+
+    subida, error = _preparar_subida()
+    if error:
+        return error
+    archivos, tamaño_csv, duracion_decodificacion = subida
+    filas_estimadas = sum(estimar_filas_csv(ruta) for ruta, _, _ in archivos)
+
+    # Reportes pequeños: generar en memoria y responder directamente
+    # (el resumen no depende del modo de Excel)
+    if ((MODO_EXCEL != 'completo' or tipo_reporte == TIPO_REPORTE_RESUMEN) and
+            tamaño_csv <= REPORTE_EN_MEMORIA_MAX_KB * 1024):
+        return _reporte_en_memoria(archivos, tipo_reporte, filas_estimadas)
+
+    # Huella de los archivos para reutilizar reportes ya generados
+    clave_cache = (calcular_clave(*[ruta for ruta, _, _ in archivos],
+                                  tipo_reporte=tipo_reporte)
+                   if cache_habilitada() else None)
+
+    # El trabajo se encarga de eliminar los CSV temporales al terminar (o
+    # al rechazarse con 429 si la cola está llena)
+    id_trabajo = crear_trabajo(session['usuario'], archivos,
+                               {'decodificacion': duracion_decodificacion},
+                               clave_cache, tipo_reporte, filas_estimadas)
+    return jsonify(_respuesta_trabajo(obtener_trabajo(id_trabajo,
+                                                      session['usuario']))), 202
+
+
+def _reporte_en_memoria(archivos, tipo_reporte=TIPO_REPORTE_DETALLADO, filas_estimadas=0):
+    """Genera un reporte pequeño dentro de la solicitud y lo envía sin tocar disco."""
+    salida = io.BytesIO()
+    try:
+        tamaño = sum(os.path.getsize(ruta) for ruta, _, _ in archivos)
+        with control.procesamiento(filas_estimadas), \
+                medir_etapa('en_memoria', bytes=tamaño):
+            # Los lotes pequeños se leen en secuencia, sin procesos adicionales
+            generar_reporte_combinado(
+                archivos,
+                al_procesar=actualizar_historial if HISTORIAL_HABILITADO else None,
+                destino=salida, max_procesos=1, tipo=tipo_reporte
+            )
+    except ServidorOcupado:
+        raise
+    except Exception as e:  # pylint: disable=broad-except
+        print(f"Error al generar el reporte en memoria: {e}")
+        return jsonify({
+            'error': 'No se pudo generar el reporte. Verifica el formato de tu archivo CSV.'
+        }), 500
+    finally:
+        for ruta_csv, _, _ in archivos:
+            os.unlink(ruta_csv)
 
-    # Validaciones básicas
-    if not archivo or not archivo.filename:
-        return render_template('reportes.html')
+    salida.seek(0)
+    return send_file(salida, download_name=NOMBRE_DESCARGA, as_attachment=True,
+                     mimetype=TIPO_XLSX)
 
-    if not archivo.filename.lower().endswith('.csv'):
-        return render_template('reportes.html')
 
+class ArchivoEnvio(io.FileIO):
+    """Archivo de una descarga que registra la etapa de envío al cerrarse.
+
+    El servidor cierra el archivo después de enviar el último byte, así que
+    la duración incluye la transferencia completa al cliente. ``al_cerrar``
+    permite liberar el resultado recién entonces.
+    """
+
+    def __init__(self, ruta, al_cerrar=None):
+        super().__init__(ruta, 'rb')
+        self.inicio = time.time()
+        self.tamaño = os.fstat(self.fileno()).st_size
+        self.al_cerrar = al_cerrar
+
+    def close(self):
+        if not self.closed:
+            registrar_etapa('envio', time.time() - self.inicio, bytes_=self.tamaño)
+            if self.al_cerrar is not None:
+                self.al_cerrar()
+        super().close()
+
+
+def _respuesta_trabajo(trabajo):
+    """Descripción del trabajo con las URLs de estado y descarga."""
+    respuesta = describir_trabajo(trabajo)
+    respuesta['url_estado'] = url_for('estado_trabajo', id_trabajo=trabajo['id'])
+    respuesta['url_descarga'] = url_for('descargar_trabajo',
+                                        id_trabajo=trabajo['id'])
+    return respuesta
+
+
+@app.route('/jobs/<id_trabajo>')
+@login_required
+def estado_trabajo(id_trabajo):
+    """Ruta para consultar el estado de un trabajo de generación de reporte."""
+    trabajo = obtener_trabajo(id_trabajo, session['usuario'])
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(_respuesta_trabajo(trabajo))
+
+
+@app.route('/jobs/<id_trabajo>/download')
+@login_required
+def descargar_trabajo(id_trabajo):
+    """Ruta para descargar el reporte generado por un trabajo."""
+    trabajo = obtener_trabajo(id_trabajo, session['usuario'])
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if trabajo['estado'] != ESTADO_COMPLETADO:
+        return jsonify(_respuesta_trabajo(trabajo)), 409
+
+    # El archivo se envía directamente desde disco (wsgi.file_wrapper en
+    # Waitress) y la limpieza lo conserva hasta que la respuesta se cierra
     try:
-        # Detectar encoding del archivo
-        data = archivo.read()
-        result = chardet.detect(data)
-        encoding = result['encoding']
-        archivo.seek(0)
-
-        # Leer CSV
-        df = pd.read_csv(
-            archivo,
-            encoding=encoding or 'latin1',
-            sep=',',
-            skiprows=1,
-            on_bad_lines='skip',
-            index_col=False
-        )
-
-        # Validar encabezados
-        encabezados_faltantes = validar_encabezados_csv(df)
-        if encabezados_faltantes:
-            return render_template('reportes.html')
+        archivo = ArchivoEnvio(trabajo['ruta_resultado'],
+                               al_cerrar=lambda: finalizar_descarga(id_trabajo))
+    except FileNotFoundError:
+        return jsonify({'error': 'El reporte ya no está disponible'}), 410
+    iniciar_descarga(id_trabajo)
 
-        # Procesar DataFrame
-        df = procesar_dataframe(df)
+    respuesta = send_file(archivo, download_name=NOMBRE_DESCARGA, as_attachment=True,
+                          mimetype=TIPO_XLSX)
+    respuesta.content_length = archivo.tamaño
+    return respuesta
 
-        # Generar archivo Excel
-        temp_path = generar_excel(df)
 
-        # Leer y devolver archivo
-        with open(temp_path, 'rb') as f:
-            output_data = f.read()
+def _leer_periodo(valor):
+    """Convierte un periodo 'AAAA-MM' en la tupla (año, mes); vacío es None."""
+    if not valor:
+        return None
+    año, mes = (int(parte) for parte in valor.split('-'))
+    if not 1 <= mes <= 12:
+        raise ValueError(f"Mes fuera de rango: {valor}")
+    return año, mes
 
-        output = io.BytesIO(output_data)
-        output.seek(0)
 
-        # Limpiar archivo temporal
-        os.unlink(temp_path)
+@app.route('/reportes/historial', methods=['POST'])
+@login_required
+def reporte_historial():
+    """Encola un reporte de un rango de meses leído desde el historial."""
+    if not HISTORIAL_HABILITADO:
+        return jsonify({'error': 'El historial de impresiones no está habilitado'}), 503
+
+    tipo_reporte = request.values.get('tipo_reporte') or TIPO_REPORTE_DETALLADO
+    if tipo_reporte not in TIPOS_REPORTE:
+        return jsonify({'error': 'Tipo de reporte no válido'}), 400
+
+    try:
+        desde = _leer_periodo(request.values.get('desde'))
+        hasta = _leer_periodo(request.values.get('hasta'))
+    except ValueError:
+        return jsonify({'error': 'Los periodos deben tener el formato AAAA-MM'}), 400
 
-        return send_file(
-            output,
-            download_name="Reporte de Impresiones.xlsx",
-            as_attachment=True,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+    if desde and hasta and desde > hasta:
+        return jsonify({'error': 'El periodo inicial es posterior al final'}), 400
 
-    except (pd.errors.EmptyDataError, pd.errors.ParserError,
-            UnicodeDecodeError) as e:
-        print(f"Error al procesar archivo: {e}")
-        return render_template('reportes.html')
+    id_trabajo = crear_trabajo_historial(session['usuario'], desde, hasta, tipo_reporte)
+    return jsonify(_respuesta_trabajo(obtener_trabajo(id_trabajo,
+                                                      session['usuario']))), 202
+
+
+def _formato_solicitado():
+    """Formato pedido con el parámetro 'formato' o, si falta, con el encabezado Accept."""
+    formato = request.args.get('formato')
+    if formato:
+        return formato.lower()
+    tipos = [tipo for tipo, formato in TIPOS_ACEPTADOS.items()
+             if formato in formatos_disponibles()]
+    return TIPOS_ACEPTADOS.get(request.accept_mimetypes.best_match(tipos), FORMATO_JSON)
+
+
+def _datos_api():
+    """DataFrame procesado de la solicitud a la API, o una respuesta de error.
+
+    Con POST se procesan los CSV subidos; con GET se lee el historial entre
+    los periodos 'desde' y 'hasta'.
+    """
+    if request.method == 'POST':
+        subida, error = _preparar_subida()
+        if error:
+            return None, error
+        archivos, tamaño_csv, _ = subida
+        try:
+            filas_estimadas = sum(estimar_filas_csv(ruta) for ruta, _, _ in archivos)
+            with control.procesamiento(filas_estimadas), \
+                    medir_etapa('api_lectura', bytes=tamaño_csv) as datos:
+                # Igual que los reportes en memoria, sin procesos adicionales
+                df = leer_y_procesar_csvs(
+                    archivos, max_procesos=1,
+                    al_procesar=actualizar_historial if HISTORIAL_HABILITADO else None
+                )
+                datos['filas'] = len(df)
+        finally:
+            for ruta_csv, _, _ in archivos:
+                os.unlink(ruta_csv)
+        return df, None
+
+    if not HISTORIAL_HABILITADO:
+        return None, (jsonify({'error': 'El historial de impresiones no está habilitado'}), 503)
+    try:
+        desde = _leer_periodo(request.args.get('desde'))
+        hasta = _leer_periodo(request.args.get('hasta'))
+    except ValueError:
+        return None, (jsonify({'error': 'Los periodos deben tener el formato AAAA-MM'}), 400)
+    with medir_etapa('api_lectura') as datos:
+        df = leer_historial(desde, hasta)
+        datos['filas'] = len(df)
+    return df, None
+
+
+def _parametros_api():
+    """Formato, hoja y paginación de la solicitud a la API, o una respuesta de error."""
+    formato = _formato_solicitado()
+    if formato not in formatos_disponibles():
+        return None, (jsonify({'error': 'Formato no disponible. Opciones: '
+                                        f"{', '.join(formatos_disponibles())}"}), 400)
+
+    hoja = request.args.get('hoja') or HOJA_GENERAL
+    if hoja not in hojas_disponibles():
+        return None, (jsonify({'error': 'Hoja no válida. Opciones: '
+                                        f"{', '.join(hojas_disponibles())}"}), 400)
+
+    try:
+        pagina = int(request.args.get('pagina') or 1)
+        por_pagina = int(request.args.get('por_pagina') or FILAS_POR_PAGINA)
+    except ValueError:
+        return None, (jsonify({'error': 'La página y las filas por página deben ser '
+                                        'números'}), 400)
+    return (formato, hoja, pagina, por_pagina), None
+
+
+def _responder_api(df, parametros, id_datos=None):
+    """Exporta la hoja pedida de ``df``; en JSON agrega la URL de la página siguiente.
+
+    Con ``id_datos`` (datos de un POST ya procesados) las páginas se piden a
+    /api/reportes/<id_datos>; sin él, a la misma consulta del historial.
+    """
+    formato, hoja, pagina, por_pagina = parametros
+    try:
+        with medir_etapa('exportacion') as datos:
+            df = seleccionar_hoja(df, hoja)
+            datos['filas'] = len(df)
+            if formato == FORMATO_JSON:
+                respuesta = pagina_json(df, pagina, por_pagina)
+                argumentos = dict(request.args, hoja=hoja, formato=formato,
+                                  por_pagina=respuesta['por_pagina'])
+                if id_datos is not None:
+                    respuesta['id_datos'] = id_datos
+                    respuesta['url_datos'] = url_for('api_datos', id_datos=id_datos)
+                if respuesta['pagina'] < respuesta['total_paginas']:
+                    argumentos['pagina'] = respuesta['pagina'] + 1
+                    respuesta['siguiente'] = (
+                        url_for('api_datos', id_datos=id_datos, **argumentos)
+                        if id_datos is not None else url_for('api_reportes', **argumentos)
+                    )
+                return jsonify(respuesta)
+            salida = (exportar_csv_gz if formato == FORMATO_CSV else exportar_parquet)(df)
+            datos['bytes'] = salida.getbuffer().nbytes
+    except Exception as e:  # pylint: disable=broad-except
+        print(f"Error al exportar los datos: {e}")
+        return jsonify({'error': 'No se pudieron exportar los datos'}), 500
+
+    tipo, extension = FORMATOS_EXPORTACION[formato]
+    return send_file(salida, download_name=f"{hoja}{extension}", as_attachment=True,
+                     mimetype=tipo)
+
+
+@app.route('/api/reportes', methods=['GET', 'POST'])
+@login_required
+@solicitud_pesada('GET', 'POST')
+def api_reportes():
+    """Datos procesados en CSV comprimido, Parquet o JSON paginado, sin Excel.
+
+    Parámetros: 'formato' (json, csv o parquet; también se acepta el
+    encabezado Accept), 'hoja' (GENERAL o una hoja filtrada) y, en JSON,
+    'pagina' y 'por_pagina'. En JSON, los datos de un POST se guardan una
+    sola vez y la respuesta indica 'id_datos' y la URL de la página
+    'siguiente', que se lee sin volver a subir el archivo.
+    """
+    parametros, error = _parametros_api()
+    if error:
+        return error
+
+    df, error = _datos_api()
+    if error:
+        return error
+
+    id_datos = None
+    if request.method == 'POST' and parametros[0] == FORMATO_JSON:
+        id_datos = guardar_datos_api(session['usuario'], df)
+    return _responder_api(df, parametros, id_datos)
+
+
+@app.route('/api/reportes/<id_datos>')
+@login_required
+def api_datos(id_datos):
+    """Otra página u otro formato de los datos ya procesados de un POST a /api/reportes."""
+    parametros, error = _parametros_api()
+    if error:
+        return error
+
+    with medir_etapa('api_lectura') as datos:
+        df = leer_datos_api(id_datos, session['usuario'])
+        if df is None:
+            return jsonify({'error': 'Datos no encontrados o vencidos'}), 404
+        datos['filas'] = len(df)
+    return _responder_api(df, parametros, id_datos)
+
+
+@app.route('/api/resumen')
+@login_required
+def api_resumen():
+    """Totales del historial agrupados por las dimensiones indicadas, en JSON paginado.
+
+    Se leen de los cubos mensuales, sin recorrer los registros. Parámetros:
+    'por' (dimensiones separadas por comas, por defecto Impresora), 'desde',
+    'hasta', 'pagina' y 'por_pagina'.
+    """
+    if not HISTORIAL_HABILITADO:
+        return jsonify({'error': 'El historial de impresiones no está habilitado'}), 503
+
+    dimensiones_validas = ['Año', 'Mes'] + DIMENSIONES_CUBO
+    por = [d.strip() for d in (request.args.get('por') or 'Impresora').split(',') if d.strip()]
+    if not por or any(dimension not in dimensiones_validas for dimension in por):
+        return jsonify({'error': 'Dimensión no válida. Opciones: '
+                                 f"{', '.join(dimensiones_validas)}"}), 400
+    try:
+        desde = _leer_periodo(request.args.get('desde'))
+        hasta = _leer_periodo(request.args.get('hasta'))
+        pagina = int(request.args.get('pagina') or 1)
+        por_pagina = int(request.args.get('por_pagina') or FILAS_POR_PAGINA)
+    except ValueError:
+        return jsonify({'error': 'Los periodos deben tener el formato AAAA-MM y la '
+                                 'paginación debe ser numérica'}), 400
+
+    with medir_etapa('api_resumen') as datos:
+        cubo = leer_cubos(desde, hasta)
+        datos['filas'] = len(cubo)
+        totales = resumir(cubo, calcular_totales_cubo(cubo), list(dict.fromkeys(por)))
+    return jsonify(pagina_json(totales, pagina, por_pagina))
+
+
+@app.route('/cache/estadisticas')
+@login_required
+def estadisticas_cache_reportes():
+    """Ruta con los contadores de aciertos y fallos de la caché de reportes."""
+    return jsonify(estadisticas_cache())
+
+
+# Picos de memoria de toda la vida de los procesos (no de una etapa)
+registrar_indicador('proceso_memoria_pico_bytes', memoria_pico_bytes,
+                    'Pico de memoria residente del proceso web desde que inició')
+registrar_indicador('trabajos_memoria_pico_bytes', memoria_pico_trabajos,
+                    'Mayor pico de memoria residente informado por los procesos de trabajo')
+
+
+@app.route('/metrics')
+def metricas():
+    """Ruta con las métricas de rendimiento en formato de Prometheus."""
+    if METRICAS_TOKEN and not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f"Bearer {METRICAS_TOKEN}"):
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    return Response(exponer_metricas(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 # =============================================================================
 # PUNTO DE ENTRADA
@@ -0,0 +1 @@
+"""Benchmarks del generador de reportes de impresiones."""
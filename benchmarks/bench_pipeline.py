@@ -0,0 +1,367 @@
+"""
+Benchmark del flujo completo de generación de reportes.
+
+Para cada tamaño y encoding genera (o reutiliza) un CSV sintético y mide por
+separado cada etapa: detección de encoding, lectura, procesar_dataframe,
+filtrar_dataframe, convertir_a_tabla y generar_excel, además de una subida
+completa a /subir_csv con el cliente de pruebas de Flask. De cada etapa se
+registra el tiempo y el pico de RSS del proceso (y, con --tracemalloc, el
+pico de memoria asignada por Python, a costa de tiempos bastante mayores);
+los resultados se escriben en JSON para compararlos entre commits.
+
+Ejecuta: python benchmarks/bench_pipeline.py [--filas 10000 100000]
+             [--encodings utf-8 latin-1] [--salida resultados.json]
+             [--comparar base.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.utils.dataframe import dataframe_to_rows
+
+# resource solo existe en sistemas tipo Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DIRECTORIO_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIRECTORIO_RAIZ)
+
+from benchmarks.generador import ENCODINGS, obtener_csv  # noqa: E402
+from filtros import obtener_filtros  # noqa: E402
+from procesamiento import (  # noqa: E402
+    MODO_EXCEL, convertir_a_tabla, detectar_encoding, filtrar_dataframe,
+    generar_excel, leer_csv_por_bloques, leer_encabezados_csv, procesar_dataframe
+)
+
+# =============================================================================
+# CONFIGURACIÓN DEL BENCHMARK
+# =============================================================================
+
+FILAS_POR_DEFECTO = [10_000, 100_000, 1_000_000, 5_000_000]
+DIRECTORIO_DATOS = os.path.join(DIRECTORIO_RAIZ, 'benchmarks', 'datos')
+
+# convertir_a_tabla recorre todas las celdas de un libro normal; por encima
+# de este tamaño tarda demasiado para correrlo en cada comparación
+LIMITE_FILAS_CONVERTIR_TABLA = 100_000
+
+INTERVALO_SONDEO = 0.2  # Segundos entre consultas del estado del trabajo
+ESPERA_MAXIMA_TRABAJO = 3600  # Segundos antes de abandonar la subida completa
+
+# =============================================================================
+# MEDICIÓN
+# =============================================================================
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB y macOS bytes
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class RegistroSubetapas:
+    """Callable de progreso que acumula la duración de cada etapa notificada."""
+
+    def __init__(self):
+        self.duraciones = {}
+        self._actual = None
+        self._inicio = None
+
+    def __call__(self, etapa, **datos):
+        nombre = f"{etapa}:{datos['hoja']}" if etapa == 'hoja' else etapa
+        if nombre != self._actual:
+            self.cerrar()
+            self._actual = nombre
+            self._inicio = time.perf_counter()
+
+    def cerrar(self):
+        """Registra la duración de la etapa en curso."""
+        if self._actual is not None:
+            self.duraciones[self._actual] = round(
+                self.duraciones.get(self._actual, 0) +
+                time.perf_counter() - self._inicio, 4
+            )
+            self._actual = None
+
+
+def medir(etapa, funcion, usar_tracemalloc=False):
+    """Ejecuta ``funcion`` y devuelve (resultado, medición de la etapa)."""
+    if usar_tracemalloc:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion()
+        segundos = time.perf_counter() - inicio
+        memoria_pico = (tracemalloc.get_traced_memory()[1]
+                        if usar_tracemalloc else None)
+    finally:
+        if usar_tracemalloc:
+            tracemalloc.stop()
+
+    medicion = {
+        'etapa': etapa,
+        'segundos': round(segundos, 4),
+        'memoria_pico_mb': (round(memoria_pico / (1024 * 1024), 1)
+                            if memoria_pico is not None else None),
+        'rss_pico_mb': rss_pico_mb(),
+    }
+    return resultado, medicion
+
+
+def omitida(etapa, motivo):
+    """Medición de una etapa que no se ejecutó."""
+    return {'etapa': etapa, 'omitida': motivo}
+
+# =============================================================================
+# ETAPAS
+# =============================================================================
+
+
+def _libro_con_datos(df):
+    """Libro normal de openpyxl con el DataFrame escrito (preparación no medida)."""
+    workbook = Workbook()
+    sheet = workbook.active
+    datos = df.astype(object).where(df.notna(), None)
+    for fila in dataframe_to_rows(datos, index=False, header=True):
+        sheet.append(fila)
+    return sheet
+
+
+def medir_etapas(ruta_csv, filas, usar_tracemalloc=False,
+                 max_filas_tabla=LIMITE_FILAS_CONVERTIR_TABLA):
+    """Mide cada etapa del flujo por separado sobre un CSV."""
+    mediciones = []
+
+    def registrar(etapa, funcion):
+        resultado, medicion = medir(etapa, funcion, usar_tracemalloc)
+        mediciones.append(medicion)
+        return resultado
+
+    encoding = registrar('detectar_encoding', lambda: detectar_encoding(ruta_csv))
+    encabezados = registrar('leer_encabezados_csv',
+                            lambda: leer_encabezados_csv(ruta_csv, encoding))
+    df = registrar('leer_csv_por_bloques', lambda: leer_csv_por_bloques(
+        ruta_csv, encoding, encabezados.columns))
+    df = registrar('procesar_dataframe', lambda: procesar_dataframe(df))
+    registrar('filtrar_dataframe', lambda: [
+        filtrar_dataframe(df, config) for config in obtener_filtros().config.values()
+    ])
+
+    if filas > max_filas_tabla:
+        mediciones.append(omitida('convertir_a_tabla',
+                                  f'más de {max_filas_tabla} filas (--max-filas-tabla)'))
+    else:
+        sheet = _libro_con_datos(df)
+        registrar('convertir_a_tabla',
+                  lambda: convertir_a_tabla(sheet, df, 'TablaGeneral'))
+        del sheet
+
+    subetapas = RegistroSubetapas()
+    ruta_excel = registrar('generar_excel', lambda: generar_excel(df, subetapas))
+    subetapas.cerrar()
+    mediciones[-1]['subetapas'] = subetapas.duraciones
+    mediciones[-1]['bytes'] = os.path.getsize(ruta_excel)
+    os.unlink(ruta_excel)
+
+    mediciones[0]['encoding_detectado'] = encoding
+    return mediciones
+
+
+def _configurar_entorno_app(directorio):
+    """Variables de entorno para importar la app sin base de datos ni cachés.
+
+    La subida usa una sesión inyectada, por lo que nunca se abre una conexión;
+    la caché de reportes y el historial se deshabilitan para medir siempre
+    el procesamiento completo.
+    """
+    for variable in ('DB_HOST', 'DB_USER', 'DB_PASSWORD', 'DB_NAME'):
+        os.environ.setdefault(variable, 'benchmark')
+    os.environ['CACHE_REPORTES_MB'] = '0'
+    os.environ['HISTORIAL_HABILITADO'] = 'False'
+    os.environ['DIRECTORIO_TRABAJOS'] = directorio
+
+
+def medir_subida(ruta_csv):
+    """Mide una subida completa a /subir_csv hasta descargar el reporte."""
+    from app import app  # pylint: disable=import-outside-toplevel
+
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['usuario'] = 'benchmark'
+
+    inicio = time.perf_counter()
+    with open(ruta_csv, 'rb') as archivo:
+        respuesta = cliente.post(
+            '/subir_csv',
+            data={'archivo': (archivo, os.path.basename(ruta_csv))},
+            content_type='multipart/form-data'
+        )
+    if respuesta.status_code == 200:
+        # Reporte pequeño generado en memoria dentro de la misma solicitud
+        return {
+            'etapa': 'subir_csv',
+            'segundos': round(time.perf_counter() - inicio, 4),
+            'modo': 'en_memoria',
+            'bytes': len(respuesta.data),
+            'memoria_pico_mb': None,
+            'rss_pico_mb': rss_pico_mb(),
+        }
+    if respuesta.status_code != 202:
+        return omitida('subir_csv', f"respuesta {respuesta.status_code}: "
+                                    f"{respuesta.get_json()}")
+    aceptado = time.perf_counter() - inicio
+
+    trabajo = respuesta.get_json()
+    while trabajo['estado'] not in ('completado', 'error'):
+        if time.perf_counter() - inicio > ESPERA_MAXIMA_TRABAJO:
+            return omitida('subir_csv', 'el trabajo no terminó a tiempo')
+        time.sleep(INTERVALO_SONDEO)
+        trabajo = cliente.get(respuesta.get_json()['url_estado']).get_json()
+    if trabajo['estado'] == 'error':
+        return omitida('subir_csv', f"error del trabajo: {trabajo['error']}")
+
+    descarga = cliente.get(respuesta.get_json()['url_descarga'])
+    tamaño = len(descarga.data)
+    descarga.close()
+
+    return {
+        'etapa': 'subir_csv',
+        'segundos': round(time.perf_counter() - inicio, 4),
+        'segundos_hasta_aceptar': round(aceptado, 4),
+        'modo': 'trabajo',
+        'subetapas': trabajo['etapas'],
+        'bytes': tamaño,
+        # El trabajo corre en otro proceso; la memoria se mide en las etapas
+        'memoria_pico_mb': None,
+        'rss_pico_mb': None,
+    }
+
+# =============================================================================
+# RESULTADOS
+# =============================================================================
+
+
+def _commit_actual():
+    """Hash del commit evaluado (None fuera de un repositorio git)."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO_RAIZ,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadatos():
+    """Datos del entorno para interpretar los resultados."""
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit_actual(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'procesadores': os.cpu_count(),
+        'modo_excel': MODO_EXCEL,
+    }
+
+
+def _clave(resultado):
+    """Identifica una medición entre ejecuciones."""
+    return resultado['filas'], resultado['encoding'], resultado['etapa']
+
+
+def comparar(base, actual):
+    """Imprime la variación de tiempo de cada etapa respecto de otra ejecución."""
+    anteriores = {_clave(r): r for r in base['resultados'] if 'segundos' in r}
+    print(f"\nComparación con {base['metadatos'].get('commit')} "
+          f"({base['metadatos'].get('fecha')}):", file=sys.stderr)
+    for resultado in actual['resultados']:
+        anterior = anteriores.get(_clave(resultado))
+        if anterior is None or 'segundos' not in resultado:
+            continue
+        variacion = resultado['segundos'] / anterior['segundos'] if anterior['segundos'] else 0
+        print(f"{resultado['filas']:>10} {resultado['encoding']:>10} "
+              f"{resultado['etapa']:<22} {anterior['segundos']:>9.3f} -> "
+              f"{resultado['segundos']:>9.3f} s ({variacion:.2f}x)", file=sys.stderr)
+
+
+def imprimir_resumen(resultados):
+    """Tabla legible de los resultados (en stderr para no mezclarla con el JSON)."""
+    print(f"{'Filas':>10} {'Encoding':>10} {'Etapa':<22} {'Tiempo (s)':>11} "
+          f"{'tracemalloc (MB)':>17} {'RSS pico (MB)':>14}", file=sys.stderr)
+    for r in resultados:
+        if 'omitida' in r:
+            detalle = f"omitida: {r['omitida']}"
+        else:
+            detalle = (f"{r['segundos']:>11.3f} {str(r['memoria_pico_mb']):>17} "
+                       f"{str(r['rss_pico_mb']):>14}")
+        print(f"{r['filas']:>10} {r['encoding']:>10} {r['etapa']:<22} {detalle}",
+              file=sys.stderr)
+
+
+def main():
+    """Ejecuta el benchmark para cada tamaño y encoding solicitados."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--filas', type=int, nargs='+', default=FILAS_POR_DEFECTO)
+    parser.add_argument('--encodings', nargs='+', default=['utf-8', 'latin-1'],
+                        choices=ENCODINGS)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', help='archivo JSON de resultados (por defecto stdout)')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='medir también la memoria asignada (agrega sobrecarga)')
+    parser.add_argument('--sin-subida', action='store_true',
+                        help='omitir la subida completa con Flask')
+    parser.add_argument('--max-filas-tabla', type=int,
+                        default=LIMITE_FILAS_CONVERTIR_TABLA)
+    argumentos = parser.parse_args()
+
+    directorio_trabajos = tempfile.mkdtemp(prefix='bench_trabajos_')
+    _configurar_entorno_app(directorio_trabajos)
+
+    resultados = []
+    # Los mensajes de la app y de los trabajos no deben mezclarse con el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        for filas in argumentos.filas:
+            for encoding in argumentos.encodings:
+                ruta_csv = obtener_csv(DIRECTORIO_DATOS, filas, encoding,
+                                       argumentos.semilla)
+                mediciones = medir_etapas(ruta_csv, filas, argumentos.tracemalloc,
+                                          argumentos.max_filas_tabla)
+                if not argumentos.sin_subida:
+                    mediciones.append(medir_subida(ruta_csv))
+                for medicion in mediciones:
+                    resultados.append({'filas': filas, 'encoding': encoding,
+                                       **medicion})
+
+    salida = {'metadatos': metadatos(), 'resultados': resultados}
+    imprimir_resumen(resultados)
+
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding='utf-8') as archivo:
+            comparar(json.load(archivo), salida)
+
+    texto = json.dumps(salida, ensure_ascii=False, indent=2)
+    if argumentos.salida:
+        with open(argumentos.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+    else:
+        print(texto)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark comparativo de procesar_dataframe (versión anterior vs. actual).
+
+Ejecuta: python benchmarks/bench_procesar_dataframe.py [filas ...]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generador import generar_dataframe  # noqa: E402
+from procesamiento import procesar_dataframe  # noqa: E402
+
+FILAS_POR_DEFECTO = [10_000, 100_000, 1_000_000]
+REPETICIONES = 3
+
+
+def procesar_dataframe_anterior(df):
+    """Implementación anterior basada en apply, inserciones y drops en bucle."""
+    if len(df.columns) >= 1:
+        fechas = pd.to_datetime(df.iloc[:, 0], errors='coerce')
+        meses_es = {
+            1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril',
+            5: 'Mayo', 6: 'Junio', 7: 'Julio', 8: 'Agosto',
+            9: 'Setiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
+        }
+        meses = fechas.apply(lambda x: meses_es[x.month] if pd.notna(x) else "")
+        años = fechas.apply(lambda x: str(x.year) if pd.notna(x) else "")
+        df.insert(1, 'Mes', meses)
+        df.insert(2, 'Año', años)
+
+    if len(df.columns) >= 6:
+        columna_c = pd.to_numeric(df.iloc[:, 4], errors='coerce').fillna(0)
+        columna_d = pd.to_numeric(df.iloc[:, 5], errors='coerce').fillna(0)
+        df.insert(6, 'Impresiones', columna_c * columna_d)
+
+    columnas_a_eliminar = [i for i in [11, 12, 13, 14] if i < len(df.columns)]
+    for indice in reversed(columnas_a_eliminar):
+        df = df.drop(df.columns[indice], axis=1)
+
+    return df
+
+
+def medir(funcion, df):
+    """Devuelve el mejor tiempo de varias ejecuciones sobre copias del DataFrame."""
+    tiempos = []
+    for _ in range(REPETICIONES):
+        copia = df.copy()
+        inicio = time.perf_counter()
+        funcion(copia)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    """Compara ambas implementaciones para cada tamaño solicitado."""
+    filas_a_medir = [int(valor) for valor in sys.argv[1:]] or FILAS_POR_DEFECTO
+
+    print(f"{'Filas':>10} {'Anterior (s)':>14} {'Actual (s)':>12} {'Mejora':>8}")
+    for filas in filas_a_medir:
+        df = generar_dataframe(filas)
+        anterior = medir(procesar_dataframe_anterior, df)
+        actual = medir(procesar_dataframe, df)
+        print(f"{filas:>10} {anterior:>14.3f} {actual:>12.3f} {anterior / actual:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Generador determinista de registros de impresión sintéticos.
+
+Produce DataFrames y archivos CSV con el mismo formato que exporta PaperCut:
+una primera línea descriptiva que se omite al leer, los encabezados de
+ENCABEZADOS_REQUERIDOS y las impresoras de los filtros predeterminados (más
+una impresora sin hoja propia). Los textos incluyen tildes y eñes para que el
+encoding del archivo sea relevante.
+
+Ejecuta: python benchmarks/generador.py filas salida.csv [--encoding latin-1]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filtros import FILTROS_PREDETERMINADOS  # noqa: E402
+from procesamiento import ENCABEZADOS_REQUERIDOS  # noqa: E402
+
+# =============================================================================
+# CONFIGURACIÓN DEL GENERADOR
+# =============================================================================
+
+PRIMERA_LINEA = 'PaperCut Print Logger : http://www.papercut.com/'
+
+# Impresoras con hoja propia y una que solo aparece en la hoja GENERAL
+IMPRESORAS = [config['impresora'] for config in FILTROS_PREDETERMINADOS.values()] + [
+    'Canon iR-ADV C3525'
+]
+
+NOMBRES = ['josé', 'maría', 'ángel', 'sofía', 'martín', 'lucía', 'raúl', 'inés',
+           'nicolás', 'verónica', 'andrés', 'mónica', 'iñaki', 'begoña', 'óscar']
+APELLIDOS = ['pérez', 'núñez', 'gómez', 'rodríguez', 'muñoz', 'díaz', 'ibáñez',
+             'sánchez', 'martínez', 'fernández', 'castañeda', 'peña', 'avendaño']
+DOCUMENTOS = ['Cotización N° {}.pdf', 'Informe año {}.docx', 'Planilla Señal {}.xlsx',
+              'Acta de reunión {}.pdf', 'Guía de remisión {}.pdf', 'Contraseña {}.txt']
+FORMATOS_PAPEL = ['A4', 'Letter', 'Legal', 'A3']
+IDIOMAS = ['PCL6', 'PostScript', 'PCL5']
+
+TOTAL_USUARIOS = 300
+TOTAL_DOCUMENTOS = 20000
+TOTAL_CLIENTES = 120
+FRACCION_FECHAS_INVALIDAS = 0.001  # Registros con Hora vacía
+FILAS_POR_BLOQUE = 250_000  # Filas generadas y escritas por vez
+
+ENCODINGS = ['utf-8', 'utf-8-sig', 'cp1252', 'latin-1']
+
+# =============================================================================
+# GENERACIÓN
+# =============================================================================
+
+
+def _catalogo(plantilla, cantidad):
+    """Lista determinista de textos numerados a partir de una plantilla."""
+    return [plantilla(i) for i in range(cantidad)]
+
+
+USUARIOS = _catalogo(
+    lambda i: f"{NOMBRES[i % len(NOMBRES)]}.{APELLIDOS[i // len(NOMBRES) % len(APELLIDOS)]}"
+              f"{i // (len(NOMBRES) * len(APELLIDOS)) or ''}",
+    TOTAL_USUARIOS
+)
+NOMBRES_DOCUMENTO = _catalogo(
+    lambda i: DOCUMENTOS[i % len(DOCUMENTOS)].format(i), TOTAL_DOCUMENTOS
+)
+CLIENTES = _catalogo(lambda i: f'PC-{i + 1}', TOTAL_CLIENTES)
+
+
+def generar_dataframe(filas, semilla=0):
+    """Genera un DataFrame sintético con el esquema del CSV de impresiones."""
+    rng = np.random.default_rng(semilla)
+    inicio = np.datetime64('2024-01-01T00:00:00')
+    segundos = rng.integers(0, 365 * 24 * 3600, filas)
+    horas = pd.Series(inicio + segundos.astype('timedelta64[s]')).dt.strftime(
+        '%Y-%m-%d %H:%M:%S'
+    )
+    horas[rng.random(filas) < FRACCION_FECHAS_INVALIDAS] = ''
+
+    paginas = rng.integers(1, 50, filas)
+    datos = {
+        'Hora': horas,
+        'Usuario': rng.choice(USUARIOS, filas),
+        'Páginas': paginas,
+        'Copias': rng.choice([1, 1, 1, 2, 3], filas),
+        'Impresora': rng.choice(IMPRESORAS, filas, p=[0.35, 0.3, 0.25, 0.1]),
+        'Nombre Documento': rng.choice(NOMBRES_DOCUMENTO, filas),
+        'Cliente': rng.choice(CLIENTES, filas),
+        'Formato Papel': rng.choice(FORMATOS_PAPEL, filas, p=[0.8, 0.1, 0.07, 0.03]),
+        'Idioma': rng.choice(IDIOMAS, filas),
+        'Altura': 'Altura: 297mm',
+        'Anchura': 'Anchura: 210mm',
+        'Frente/reverso': rng.choice(['DUPLEX', 'NOT DUPLEX'], filas),
+        'Escala de grises': rng.choice(['GRAYSCALE', 'NOT GRAYSCALE'], filas),
+        'Formato': pd.Series(paginas * rng.integers(20, 400, filas)).astype(str) + ' kb',
+    }
+    return pd.DataFrame(datos, columns=ENCABEZADOS_REQUERIDOS)
+
+
+def escribir_csv(ruta, filas, encoding='utf-8', semilla=0):
+    """Escribe un CSV con el formato de PaperCut generado por bloques.
+
+    Cada bloque usa una semilla derivada de ``semilla``, de modo que el mismo
+    tamaño y semilla producen siempre el mismo archivo sin tener todas las
+    filas en memoria.
+    """
+    with open(ruta, 'w', encoding=encoding, newline='') as archivo:
+        archivo.write(PRIMERA_LINEA + '\r\n')
+        for numero, desde in enumerate(range(0, max(filas, 1), FILAS_POR_BLOQUE)):
+            bloque = generar_dataframe(min(FILAS_POR_BLOQUE, filas - desde),
+                                       semilla=(semilla, numero))
+            bloque.to_csv(archivo, index=False, header=numero == 0,
+                          lineterminator='\r\n')
+    return ruta
+
+
+def obtener_csv(directorio, filas, encoding='utf-8', semilla=0):
+    """Devuelve la ruta de un CSV sintético, generándolo solo si no existe."""
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"impresiones_{filas}_{encoding}_{semilla}.csv")
+    if not os.path.exists(ruta):
+        temporal = f"{ruta}.tmp"
+        escribir_csv(temporal, filas, encoding, semilla)
+        os.replace(temporal, ruta)
+    return ruta
+
+
+def main():
+    """Genera un CSV sintético desde la línea de comandos."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('filas', type=int)
+    parser.add_argument('salida')
+    parser.add_argument('--encoding', default='utf-8', choices=ENCODINGS)
+    parser.add_argument('--semilla', type=int, default=0)
+    argumentos = parser.parse_args()
+
+    escribir_csv(argumentos.salida, argumentos.filas, argumentos.encoding,
+                 argumentos.semilla)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Caché en disco de reportes generados, direccionada por contenido.
+
+La clave de cada reporte es la huella BLAKE2 del CSV subido junto con la
+versión de la configuración que afecta al resultado (filtros, encabezados
+y modo de generación). Los reportes se guardan en un directorio con
+desalojo LRU según el tamaño total.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from filtros import obtener_filtros
+from pivote_excel import USAR_EXCEL_PIVOTE
+from procesamiento import (
+    ENCABEZADOS_REQUERIDOS, MODO_EXCEL, TIPO_REPORTE_DETALLADO, VERSION_REPORTE
+)
+
+# =============================================================================
+# CONFIGURACIÓN DE LA CACHÉ
+# =============================================================================
+
+TAMAÑO_MAXIMO_CACHE = int(os.getenv('CACHE_REPORTES_MB') or '1024') * 1024 * 1024
+DIRECTORIO_CACHE = (os.getenv('DIRECTORIO_CACHE_REPORTES') or
+                    os.path.join(tempfile.gettempdir(), 'reportes_impresiones_cache'))
+TAMAÑO_LECTURA_HUELLA = 1024 * 1024  # Bytes leídos por iteración al calcular la huella
+
+_estadisticas = {'aciertos': 0, 'fallos': 0, 'guardados': 0, 'desalojados': 0}
+_bloqueo = threading.Lock()
+
+
+def _version_configuracion():
+    """Huella de la configuración fija que determina el contenido del reporte.
+
+    Los filtros pueden recargarse en caliente, así que su versión se agrega
+    al calcular cada clave.
+    """
+    configuracion = json.dumps(
+        [VERSION_REPORTE, ENCABEZADOS_REQUERIDOS, MODO_EXCEL, USAR_EXCEL_PIVOTE],
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.blake2b(configuracion.encode('utf-8'), digest_size=16).hexdigest()
+
+
+VERSION_CONFIGURACION = _version_configuracion()
+
+# =============================================================================
+# FUNCIONES DE LA CACHÉ
+# =============================================================================
+
+
+def cache_habilitada():
+    """Indica si la caché de reportes está activa."""
+    return TAMAÑO_MAXIMO_CACHE > 0
+
+
+def calcular_clave(*rutas_csv, tipo_reporte=TIPO_REPORTE_DETALLADO):
+    """Calcula la clave del reporte leyendo los CSV por bloques.
+
+    Con varios archivos la clave depende también de su orden, porque el
+    reporte combinado conserva el orden de las filas. Cada tipo de reporte
+    tiene su propia clave.
+    """
+    huella = hashlib.blake2b(digest_size=32)
+    huella.update(VERSION_CONFIGURACION.encode('ascii'))
+    huella.update(obtener_filtros().version.encode('ascii'))
+    huella.update(tipo_reporte.encode('ascii'))
+    for ruta_csv in rutas_csv:
+        # El tamaño delimita cada archivo dentro de la huella
+        huella.update(os.path.getsize(ruta_csv).to_bytes(8, 'little'))
+        with open(ruta_csv, 'rb') as f:
+            for bloque in iter(lambda: f.read(TAMAÑO_LECTURA_HUELLA), b''):
+                huella.update(bloque)
+    return huella.hexdigest()
+
+
+def _ruta_cache(clave):
+    """Ruta del reporte guardado para una clave."""
+    return os.path.join(DIRECTORIO_CACHE, f"{clave}.xlsx")
+
+
+def _enlazar_o_copiar(origen, destino):
+    """Crea un enlace duro al archivo o, si no es posible, una copia."""
+    try:
+        os.link(origen, destino)
+    except OSError as e:
+        if not os.path.exists(origen):
+            raise FileNotFoundError(origen) from e
+        shutil.copyfile(origen, destino)
+
+
+def obtener_de_cache(clave, ruta_destino):
+    """Coloca en ruta_destino el reporte guardado para la clave, si existe."""
+    if not cache_habilitada():
+        return False
+
+    ruta = _ruta_cache(clave)
+    try:
+        _enlazar_o_copiar(ruta, ruta_destino)
+        # La fecha de modificación marca el último uso para el desalojo LRU
+        os.utime(ruta)
+    except FileNotFoundError:
+        with _bloqueo:
+            _estadisticas['fallos'] += 1
+        return False
+
+    with _bloqueo:
+        _estadisticas['aciertos'] += 1
+    return True
+
+
+def guardar_en_cache(clave, ruta_resultado):
+    """Guarda un reporte generado y desaloja los menos usados si se excede el tamaño."""
+    if not cache_habilitada():
+        return
+
+    try:
+        os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+        ruta = _ruta_cache(clave)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        _enlazar_o_copiar(ruta_resultado, temporal)
+        os.replace(temporal, ruta)
+    except OSError as e:
+        print(f"No se pudo guardar el reporte en caché: {e}")
+        return
+
+    with _bloqueo:
+        _estadisticas['guardados'] += 1
+    desalojar_cache()
+
+
+def _archivos_cache():
+    """Lista (fecha de uso, tamaño, ruta) de los reportes guardados."""
+    archivos = []
+    if not os.path.isdir(DIRECTORIO_CACHE):
+        return archivos
+    for nombre in os.listdir(DIRECTORIO_CACHE):
+        if not nombre.endswith('.xlsx'):
+            continue
+        ruta = os.path.join(DIRECTORIO_CACHE, nombre)
+        try:
+            info = os.stat(ruta)
+        except OSError:
+            continue
+        archivos.append((info.st_mtime, info.st_size, ruta))
+    return archivos
+
+
+def desalojar_cache():
+    """Elimina los reportes usados hace más tiempo hasta respetar el tamaño máximo."""
+    archivos = sorted(_archivos_cache())
+    total = sum(tamaño for _, tamaño, _ in archivos)
+
+    for _, tamaño, ruta in archivos:
+        if total <= TAMAÑO_MAXIMO_CACHE:
+            break
+        try:
+            os.unlink(ruta)
+        except OSError as e:
+            print(f"No se pudo desalojar {ruta}: {e}")
+            continue
+        total -= tamaño
+        with _bloqueo:
+            _estadisticas['desalojados'] += 1
+
+
+def estadisticas_cache():
+    """Contadores de la caché y ocupación actual del directorio."""
+    archivos = _archivos_cache()
+    with _bloqueo:
+        estadisticas = dict(_estadisticas)
+
+    consultas = estadisticas['aciertos'] + estadisticas['fallos']
+    estadisticas['tasa_aciertos'] = (
+        round(estadisticas['aciertos'] / consultas, 3) if consultas else 0
+    )
+    estadisticas['archivos'] = len(archivos)
+    estadisticas['bytes'] = sum(tamaño for _, tamaño, _ in archivos)
+    estadisticas['bytes_maximos'] = TAMAÑO_MAXIMO_CACHE
+    return estadisticas
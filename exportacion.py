@@ -0,0 +1,115 @@
+"""
+Exportación de los datos procesados en formatos livianos.
+
+Para las integraciones que solo necesitan los datos, sin el formato del
+Excel: CSV comprimido con gzip, Parquet y páginas JSON. Cada exportación
+corresponde a la hoja GENERAL (el resultado de procesar_dataframe) o a una
+de las hojas filtradas vigentes.
+"""
+import io
+import json
+import math
+import os
+
+from filtros import obtener_filtros
+from procesamiento import indices_particiones
+
+# pyarrow es opcional: sin él no se ofrece el formato Parquet
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# =============================================================================
+# CONFIGURACIÓN DE LA EXPORTACIÓN
+# =============================================================================
+
+HOJA_GENERAL = 'GENERAL'
+
+FORMATO_CSV = 'csv'
+FORMATO_PARQUET = 'parquet'
+FORMATO_JSON = 'json'
+
+# Formato -> (tipo MIME de la respuesta, extensión del archivo descargado)
+FORMATOS_EXPORTACION = {
+    FORMATO_JSON: ('application/json', None),
+    FORMATO_CSV: ('application/gzip', '.csv.gz'),
+    FORMATO_PARQUET: ('application/vnd.apache.parquet', '.parquet'),
+}
+
+# Tipos del encabezado Accept reconocidos -> formato (JSON primero, es el
+# que se elige con */*)
+TIPOS_ACEPTADOS = {
+    'application/json': FORMATO_JSON,
+    'text/csv': FORMATO_CSV,
+    'application/gzip': FORMATO_CSV,
+    'application/vnd.apache.parquet': FORMATO_PARQUET,
+    'application/x-parquet': FORMATO_PARQUET,
+}
+
+FILAS_POR_PAGINA = int(os.getenv('API_FILAS_POR_PAGINA') or '1000')
+MAX_FILAS_POR_PAGINA = 10000
+
+# =============================================================================
+# FUNCIONES DE EXPORTACIÓN
+# =============================================================================
+
+
+def formatos_disponibles():
+    """Formatos que se pueden generar con las dependencias instaladas."""
+    return [formato for formato in FORMATOS_EXPORTACION
+            if formato != FORMATO_PARQUET or pyarrow is not None]
+
+
+def hojas_disponibles():
+    """Nombres de las hojas exportables: GENERAL y cada filtro configurado."""
+    return [HOJA_GENERAL] + list(obtener_filtros())
+
+
+def seleccionar_hoja(df, hoja):
+    """Filas del DataFrame procesado que corresponden a una hoja del reporte."""
+    if hoja == HOJA_GENERAL:
+        return df
+    filtros = obtener_filtros()
+    if hoja not in filtros:
+        raise KeyError(hoja)
+    return df.iloc[indices_particiones(df, filtros.seleccionar([hoja]))[hoja]]
+
+
+def exportar_csv_gz(df):
+    """Devuelve el DataFrame como CSV UTF-8 comprimido con gzip, en memoria."""
+    salida = io.BytesIO()
+    df.to_csv(salida, index=False, encoding='utf-8', compression='gzip')
+    salida.seek(0)
+    return salida
+
+
+def exportar_parquet(df):
+    """Devuelve el DataFrame como archivo Parquet en memoria."""
+    if pyarrow is None:
+        raise RuntimeError("El formato Parquet requiere pyarrow")
+    salida = io.BytesIO()
+    df.to_parquet(salida, index=False)
+    salida.seek(0)
+    return salida
+
+
+def pagina_json(df, pagina=1, por_pagina=FILAS_POR_PAGINA):
+    """Devuelve una página de filas del DataFrame y los datos de paginación.
+
+    Las páginas empiezan en 1; ``por_pagina`` se limita a MAX_FILAS_POR_PAGINA.
+    """
+    por_pagina = max(1, min(por_pagina, MAX_FILAS_POR_PAGINA))
+    pagina = max(1, pagina)
+    inicio = (pagina - 1) * por_pagina
+    filas = df.iloc[inicio:inicio + por_pagina]
+    return {
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'total_filas': len(df),
+        'total_paginas': math.ceil(len(df) / por_pagina),
+        'columnas': [str(columna) for columna in df.columns],
+        # to_json convierte los tipos de numpy y los valores faltantes (null)
+        'filas': json.loads(filas.to_json(orient='records', force_ascii=False,
+                                          date_format='iso')),
+    }
@@ -0,0 +1,256 @@
+"""
+Filtros de las hojas del reporte de impresiones.
+
+Cada filtro genera una hoja con los registros de una impresora (coincidencia
+exacta) o de las impresoras y clientes que coinciden con un patrón. Los
+filtros se leen de un archivo JSON (ARCHIVO_FILTROS) o, si no se configura,
+se usan los predeterminados. Cada configuración se compila una sola vez y el
+archivo se vuelve a leer cuando cambia, sin reiniciar la aplicación.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+# =============================================================================
+# CONFIGURACIÓN DE LOS FILTROS
+# =============================================================================
+
+load_dotenv()
+
+# Filtros usados cuando no se indica ARCHIVO_FILTROS
+FILTROS_PREDETERMINADOS = {
+    'SURCO - HP': {
+        'impresora': 'HP LJ300-400 color M351-M451 PCL 6',
+        'solo_impresora': True
+    },
+    'SURCO - XEROX': {
+        'impresora': 'Xerox WorkCentre 3225',
+        'solo_impresora': True
+    },
+    'SAN ISIDRO - EPSON': {
+        'impresora': 'L4260 Series(Network)',
+        'solo_impresora': True
+    }
+}
+
+ARCHIVO_FILTROS = os.getenv('ARCHIVO_FILTROS') or None
+INTERVALO_REVISION = float(os.getenv('INTERVALO_REVISION_FILTROS') or '5')  # Segundos
+
+# Nombres de hoja reservados y caracteres que Excel no admite en ellos
+HOJAS_RESERVADAS = {'GENERAL', 'TABLA DINAMICA'}
+CARACTERES_INVALIDOS_HOJA = re.compile(r'[\[\]:*?/\\]')
+LARGO_MAXIMO_HOJA = 31
+TABLA_GENERAL = "TablaGeneral"
+
+# Regla compilada: impresora exacta, o patrones de impresora y cliente
+ReglaFiltro = namedtuple('ReglaFiltro', ['impresora', 'patron_impresora', 'patron_cliente'])
+
+_filtros = None
+_modificacion = None
+_ultima_revision = 0.0
+_bloqueo = threading.Lock()
+
+# =============================================================================
+# COMPILACIÓN DE LOS FILTROS
+# =============================================================================
+
+
+def nombre_tabla(nombre_hoja):
+    """Nombre de la tabla de Excel de una hoja (solo letras, números y '_')."""
+    return "Tabla" + re.sub(r'\W', '_', nombre_hoja)
+
+
+def coincidencias(patron, categorias):
+    """Evalúa un patrón compilado sobre los valores únicos de una columna."""
+    return np.fromiter((patron.search(str(valor)) is not None for valor in categorias),
+                       dtype=bool, count=len(categorias))
+
+
+# Banderas de los patrones de las reglas (y de su expresión combinada)
+BANDERAS_PATRONES = re.compile('', re.IGNORECASE).flags
+
+
+class PatronesCombinados:
+    """Patrones de subcadena de una columna evaluados en una sola expresión.
+
+    Cada patrón va en una búsqueda anticipada opcional con su propio grupo,
+    así que un solo ``match`` por valor indica todos los patrones que
+    aparecen en él (una alternancia solo indicaría el primero). Los
+    patrones con grupos propios, cuyas referencias cambiarían de número,
+    con otras banderas o que no pueden anidarse se evalúan por separado.
+    """
+
+    def __init__(self, patrones):
+        self.patrones = patrones
+        partes = {posicion: self._busqueda(patron) for posicion, patron in enumerate(patrones)}
+        self.combinados = [posicion for posicion, parte in partes.items() if parte is not None]
+        self.separados = [posicion for posicion, parte in partes.items() if parte is None]
+        self.expresion = re.compile(''.join(partes[posicion] for posicion in self.combinados),
+                                    BANDERAS_PATRONES)
+
+    @staticmethod
+    def _busqueda(patron):
+        """Búsqueda anticipada con grupo del patrón, o None si no se combina."""
+        if patron.groups or patron.flags != BANDERAS_PATRONES:
+            return None
+        parte = f"(?=(?s:.*?)({patron.pattern}))?"
+        try:
+            re.compile(parte, BANDERAS_PATRONES)
+        except re.error:
+            # Por ejemplo, banderas globales como (?i) fuera del inicio
+            return None
+        return parte
+
+    def coincidencias(self, categorias):
+        """Matriz valor x patrón que indica qué patrones aparecen en cada valor."""
+        matriz = np.zeros((len(categorias), len(self.patrones)), dtype=bool)
+        if self.combinados:
+            matriz[:, self.combinados] = np.array([
+                [grupo is not None for grupo in self.expresion.match(str(valor)).groups()]
+                for valor in categorias
+            ], dtype=bool).reshape(len(categorias), len(self.combinados))
+        for posicion in self.separados:
+            matriz[:, posicion] = coincidencias(self.patrones[posicion], categorias)
+        return matriz
+
+
+class FiltrosCompilados:
+    """Filtros validados y listos para aplicarse a un DataFrame.
+
+    Las impresoras de las reglas exactas se buscan todas juntas y los
+    patrones de las reglas de subcadena se combinan en una expresión por
+    columna (sin distinguir mayúsculas). Excel no distingue mayúsculas en
+    los nombres de hoja ni de tabla, así que se rechazan las hojas cuyo
+    nombre o tabla repite el de otra. ``version`` identifica el contenido
+    de la configuración.
+    """
+
+    def __init__(self, config):
+        self.config = {}
+        self.reglas = {}
+        hojas_usadas = set(HOJAS_RESERVADAS)
+        tablas_usadas = {TABLA_GENERAL.upper()}
+        for nombre, regla in config.items():
+            if (not isinstance(nombre, str) or not nombre or len(nombre) > LARGO_MAXIMO_HOJA or
+                    CARACTERES_INVALIDOS_HOJA.search(nombre) or
+                    nombre.upper() in HOJAS_RESERVADAS):
+                raise ValueError(f"'{nombre}' no es un nombre de hoja válido")
+            if nombre.upper() in hojas_usadas:
+                raise ValueError(f"La hoja '{nombre}' repite el nombre de otra hoja "
+                                 "(Excel no distingue mayúsculas)")
+            tabla = nombre_tabla(nombre)
+            if tabla.upper() in tablas_usadas:
+                raise ValueError(f"La hoja '{nombre}' genera la tabla '{tabla}', "
+                                 "que ya usa otra hoja")
+            hojas_usadas.add(nombre.upper())
+            tablas_usadas.add(tabla.upper())
+            if not isinstance(regla, dict) or not isinstance(regla.get('impresora'), str):
+                raise ValueError(f"El filtro '{nombre}' debe indicar la impresora")
+            solo_impresora = regla.get('solo_impresora', True)
+            if not solo_impresora and not isinstance(regla.get('cliente'), str):
+                raise ValueError(f"El filtro '{nombre}' debe indicar el patrón de cliente")
+            try:
+                self.reglas[nombre] = ReglaFiltro(
+                    regla['impresora'] if solo_impresora else None,
+                    None if solo_impresora else re.compile(regla['impresora'], re.IGNORECASE),
+                    None if solo_impresora else re.compile(regla['cliente'], re.IGNORECASE)
+                )
+            except re.error as e:
+                raise ValueError(f"Patrón inválido en el filtro '{nombre}': {e}") from e
+            self.config[nombre] = dict(regla)
+
+        self.impresoras_exactas = list(dict.fromkeys(
+            regla.impresora for regla in self.reglas.values() if regla.impresora is not None
+        ))
+        # Reglas de subcadena, con sus patrones combinados por columna
+        self.subcadenas = [nombre for nombre, regla in self.reglas.items()
+                           if regla.impresora is None]
+        self.patrones_impresora = PatronesCombinados(
+            [self.reglas[nombre].patron_impresora for nombre in self.subcadenas])
+        self.patrones_cliente = PatronesCombinados(
+            [self.reglas[nombre].patron_cliente for nombre in self.subcadenas])
+        contenido = json.dumps(self.config, sort_keys=True, ensure_ascii=False)
+        self.version = hashlib.blake2b(contenido.encode('utf-8'), digest_size=16).hexdigest()
+
+    def __len__(self):
+        return len(self.reglas)
+
+    def __iter__(self):
+        return iter(self.reglas)
+
+    def __contains__(self, nombre):
+        return nombre in self.reglas
+
+    def seleccionar(self, nombres):
+        """Filtros compilados con solo las hojas indicadas."""
+        return FiltrosCompilados({nombre: self.config[nombre] for nombre in nombres})
+
+
+def compilar_filtros(filtros):
+    """Devuelve ``filtros`` compilados (acepta un diccionario o filtros ya compilados)."""
+    if isinstance(filtros, FiltrosCompilados):
+        return filtros
+    return FiltrosCompilados(filtros)
+
+
+def _objeto_sin_repetidos(pares):
+    """Arma un objeto JSON rechazando las claves repetidas (json las pisaría)."""
+    objeto = {}
+    for clave, valor in pares:
+        if clave in objeto:
+            raise ValueError(f"La clave '{clave}' está repetida en el archivo de filtros")
+        objeto[clave] = valor
+    return objeto
+
+
+def cargar_filtros(ruta):
+    """Lee y compila los filtros de un archivo JSON nombre de hoja -> regla."""
+    with open(ruta, encoding='utf-8') as archivo:
+        config = json.load(archivo, object_pairs_hook=_objeto_sin_repetidos)
+    if not isinstance(config, dict):
+        raise ValueError("El archivo de filtros debe contener un objeto JSON")
+    return FiltrosCompilados(config)
+
+# =============================================================================
+# RECARGA EN CALIENTE
+# =============================================================================
+
+
+def obtener_filtros():
+    """Devuelve los filtros vigentes, releyendo el archivo si cambió.
+
+    La fecha de modificación se consulta como máximo cada INTERVALO_REVISION
+    segundos. Si el archivo nuevo no es válido se conservan los filtros
+    anteriores.
+    """
+    global _filtros, _modificacion, _ultima_revision
+
+    with _bloqueo:
+        if ARCHIVO_FILTROS is None:
+            if _filtros is None:
+                _filtros = FiltrosCompilados(FILTROS_PREDETERMINADOS)
+            return _filtros
+
+        ahora = time.monotonic()
+        if _filtros is not None and ahora - _ultima_revision < INTERVALO_REVISION:
+            return _filtros
+        _ultima_revision = ahora
+
+        try:
+            modificacion = os.stat(ARCHIVO_FILTROS).st_mtime_ns
+            if modificacion != _modificacion:
+                _filtros = cargar_filtros(ARCHIVO_FILTROS)
+                _modificacion = modificacion
+                print(f"Filtros cargados desde {ARCHIVO_FILTROS}: {len(_filtros)} hojas")
+        except (OSError, ValueError) as e:
+            print(f"Error al cargar los filtros de {ARCHIVO_FILTROS}: {e}")
+            if _filtros is None:
+                _filtros = FiltrosCompilados(FILTROS_PREDETERMINADOS)
+        return _filtros
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Generación de reportes por lotes desde la línea de comandos.
+
+Procesa uno o varios CSV (o ZIP con CSV) y todos los de los directorios
+indicados sin pasar por el servidor web, para programar los reportes
+nocturnos. Cada archivo genera su propio reporte en el directorio de salida
+y los archivos se procesan en paralelo, uno por proceso. Los reportes cuyo
+archivo de origen no cambió (misma fecha de modificación o misma huella del
+contenido) y se generaron con la configuración vigente se omiten.
+
+Ejecuta: python generar_reportes.py ENTRADA [ENTRADA ...] [--salida reportes]
+             [--procesos 4] [--tipo detallado|resumen] [--forzar]
+             [--sin-historial] [--tiempos tiempos.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+# Agregar el directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cache_reportes import VERSION_CONFIGURACION, calcular_clave  # noqa: E402
+from filtros import obtener_filtros  # noqa: E402
+from historial import HISTORIAL_HABILITADO, actualizar_historial  # noqa: E402
+from metricas import memoria_actual_bytes, memoria_pico_bytes  # noqa: E402
+from procesamiento import (  # noqa: E402
+    TIPO_REPORTE_DETALLADO, TIPOS_REPORTE, detectar_encoding, extraer_csvs_zip,
+    generar_reporte_combinado, leer_encabezados_csv, validar_encabezados_csv
+)
+
+# =============================================================================
+# CONFIGURACIÓN DEL PROCESO POR LOTES
+# =============================================================================
+
+EXTENSIONES_ENTRADA = ('.csv', '.zip')
+DIRECTORIO_SALIDA = 'reportes'
+
+# Registro de los reportes generados, dentro del directorio de salida
+ARCHIVO_REGISTRO = '.registro_reportes.json'
+
+# =============================================================================
+# SELECCIÓN DE ARCHIVOS
+# =============================================================================
+
+
+def buscar_entradas(rutas):
+    """Archivos CSV y ZIP indicados directamente o dentro de los directorios."""
+    entradas = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            entradas.extend(
+                os.path.join(ruta, nombre) for nombre in sorted(os.listdir(ruta))
+                if nombre.lower().endswith(EXTENSIONES_ENTRADA) and not nombre.startswith('.')
+            )
+        elif os.path.isfile(ruta):
+            entradas.append(ruta)
+        else:
+            print(f"No existe: {ruta}")
+    # Un archivo indicado dos veces genera un solo reporte
+    return list(dict.fromkeys(os.path.abspath(entrada) for entrada in entradas))
+
+
+def ruta_reporte(entrada, directorio_salida, tipo_reporte):
+    """Ruta del Excel generado para un archivo de entrada."""
+    nombre = os.path.splitext(os.path.basename(entrada))[0]
+    if tipo_reporte != TIPO_REPORTE_DETALLADO:
+        nombre = f"{nombre} ({tipo_reporte})"
+    return os.path.join(directorio_salida, f"{nombre}.xlsx")
+
+
+def leer_registro(directorio_salida):
+    """Registro nombre de reporte -> datos del archivo de origen."""
+    try:
+        with open(os.path.join(directorio_salida, ARCHIVO_REGISTRO), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_registro(directorio_salida, registro):
+    """Escribe el registro de forma atómica."""
+    ruta = os.path.join(directorio_salida, ARCHIVO_REGISTRO)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(registro, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+
+
+def version_vigente(tipo_reporte):
+    """Versión de la configuración que determina el contenido del reporte."""
+    return f"{VERSION_CONFIGURACION}:{obtener_filtros().version}:{tipo_reporte}"
+
+
+def reporte_vigente(entrada, salida, anterior, version, tipo_reporte):
+    """Indica si el reporte ya generado corresponde al archivo de entrada.
+
+    Primero compara tamaño y fecha de modificación; si cambiaron, compara la
+    huella del contenido, así que copiar o volver a exportar el mismo
+    archivo no lo regenera.
+    """
+    if not anterior or anterior.get('version') != version or not os.path.exists(salida):
+        return False
+    estado = os.stat(entrada)
+    if (anterior.get('tamaño') == estado.st_size and
+            anterior.get('modificacion') == estado.st_mtime_ns):
+        return True
+    return calcular_clave(entrada, tipo_reporte=tipo_reporte) == anterior.get('huella')
+
+# =============================================================================
+# GENERACIÓN EN PROCESOS DE TRABAJO
+# =============================================================================
+
+
+class MedidorEtapas:
+    """Función de progreso que acumula la duración de cada etapa del reporte.
+
+    También guarda la memoria residente del proceso al cerrar cada etapa y
+    la del DataFrame cuando la etapa la informa.
+    """
+
+    def __init__(self):
+        self.etapa_actual = None
+        self.inicio_etapa = None
+        self.duraciones = {}
+        self.memoria = {}
+        self.filas = None
+
+    def __call__(self, etapa, **datos):
+        ahora = time.perf_counter()
+        nombre = f"{etapa}:{datos['hoja']}" if 'hoja' in datos else etapa
+        if etapa == 'procesamiento':
+            self.filas = datos.get('filas', self.filas)
+        if datos.get('memoria_datos') is not None:
+            self.memoria.setdefault(nombre, {})['datos'] = datos['memoria_datos']
+        if nombre != self.etapa_actual:
+            self.finalizar(ahora)
+            self.etapa_actual = nombre
+            self.inicio_etapa = ahora
+
+    def finalizar(self, ahora=None):
+        """Cierra la etapa en curso."""
+        if self.etapa_actual is not None:
+            ahora = ahora or time.perf_counter()
+            self.duraciones[self.etapa_actual] = round(
+                self.duraciones.get(self.etapa_actual, 0) + ahora - self.inicio_etapa, 3
+            )
+            self.memoria.setdefault(self.etapa_actual, {})['residente'] = (
+                memoria_actual_bytes()
+            )
+            self.etapa_actual = None
+
+
+def _preparar_archivos(entrada):
+    """Devuelve los (ruta, encoding, columnas) de la entrada y los temporales creados."""
+    if entrada.lower().endswith('.zip'):
+        temporales = [ruta for _, ruta in extraer_csvs_zip(entrada)]
+        if not temporales:
+            raise ValueError("El ZIP no contiene archivos CSV")
+    else:
+        temporales = []
+
+    archivos = []
+    try:
+        for ruta_csv in temporales or [entrada]:
+            try:
+                encoding = detectar_encoding(ruta_csv)
+                encabezados = leer_encabezados_csv(ruta_csv, encoding)
+            except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError) as e:
+                raise ValueError(f"Archivo CSV inválido o formato incorrecto ({e})") from e
+            faltantes = validar_encabezados_csv(encabezados)
+            if faltantes:
+                raise ValueError("El archivo CSV no contiene los encabezados requeridos: "
+                                 f"{', '.join(faltantes)}")
+            archivos.append((ruta_csv, encoding, list(encabezados.columns)))
+    except Exception:
+        for ruta in temporales:
+            os.unlink(ruta)
+        raise
+    return archivos, temporales
+
+
+def generar_un_reporte(entrada, salida, tipo_reporte, con_historial):
+    """Genera el reporte de una entrada en un proceso de trabajo.
+
+    El Excel se escribe en un temporal junto a ``salida`` y se mueve al
+    terminar, así que un reporte interrumpido no reemplaza al anterior.
+    Devuelve las duraciones y la memoria de cada etapa, las filas, el pico
+    de memoria y los datos del archivo de origen para el registro.
+    """
+    inicio = time.perf_counter()
+    estado = os.stat(entrada)
+    huella = calcular_clave(entrada, tipo_reporte=tipo_reporte)
+    medidor = MedidorEtapas()
+    # Con la extensión .xlsx, que pandas exige en el modo completo
+    raiz, extension = os.path.splitext(salida)
+    temporal = f"{raiz}.{os.getpid()}.tmp{extension}"
+    temporales = []
+    try:
+        medidor('decodificacion')
+        archivos, temporales = _preparar_archivos(entrada)
+        generar_reporte_combinado(
+            archivos, medidor,
+            al_procesar=actualizar_historial if con_historial else None,
+            destino=temporal, max_procesos=1, tipo=tipo_reporte
+        )
+        medidor.finalizar()
+        os.replace(temporal, salida)
+    finally:
+        for ruta in temporales:
+            os.unlink(ruta)
+        if os.path.exists(temporal):
+            os.unlink(temporal)
+    return {
+        'segundos': round(time.perf_counter() - inicio, 3),
+        'filas': medidor.filas,
+        'etapas': medidor.duraciones,
+        'memoria_etapas': medidor.memoria,
+        'memoria_pico_proceso_bytes': memoria_pico_bytes(),
+        'origen': {'entrada': entrada, 'tamaño': estado.st_size,
+                   'modificacion': estado.st_mtime_ns, 'huella': huella},
+    }
+
+# =============================================================================
+# EJECUCIÓN DEL LOTE
+# =============================================================================
+
+
+def generar_reportes(entradas, directorio_salida, procesos=None,
+                     tipo_reporte=TIPO_REPORTE_DETALLADO, forzar=False,
+                     con_historial=HISTORIAL_HABILITADO):
+    """Genera los reportes pendientes y devuelve el resultado de cada entrada.
+
+    Cada resultado incluye el estado ('generado', 'vigente' o 'error') y,
+    para los generados, las duraciones por etapa.
+    """
+    os.makedirs(directorio_salida, exist_ok=True)
+    registro = leer_registro(directorio_salida)
+    version = version_vigente(tipo_reporte)
+
+    resultados = {}
+    pendientes = {}
+    for entrada in entradas:
+        salida = ruta_reporte(entrada, directorio_salida, tipo_reporte)
+        nombre = os.path.basename(salida)
+        if nombre in pendientes.values():
+            resultados[entrada] = {'estado': 'error',
+                                   'error': f"Otro archivo genera el mismo reporte {nombre}"}
+            continue
+        if not forzar and reporte_vigente(entrada, salida, registro.get(nombre),
+                                          version, tipo_reporte):
+            # Actualizar la fecha registrada evita volver a calcular la huella
+            estado = os.stat(entrada)
+            registro[nombre].update(tamaño=estado.st_size, modificacion=estado.st_mtime_ns)
+            resultados[entrada] = {'estado': 'vigente', 'reporte': salida}
+        else:
+            pendientes[entrada] = nombre
+            resultados[entrada] = {'estado': 'pendiente', 'reporte': salida}
+
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(pendientes) or 1))
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        futuros = {
+            executor.submit(generar_un_reporte, entrada, resultados[entrada]['reporte'],
+                            tipo_reporte, con_historial): entrada
+            for entrada in pendientes
+        }
+        for futuro in as_completed(futuros):
+            entrada = futuros[futuro]
+            resultado = resultados[entrada]
+            try:
+                resultado.update(futuro.result(), estado='generado')
+            except Exception as e:  # pylint: disable=broad-except
+                resultado.update(estado='error', error=str(e))
+                print(f"Error en {entrada}: {e}")
+                continue
+            registro[pendientes[entrada]] = dict(resultado.pop('origen'), version=version)
+            print(f"Generado {resultado['reporte']} en {resultado['segundos']:.1f} s "
+                  f"({resultado['filas'] or 0:,} filas)")
+
+    guardar_registro(directorio_salida, registro)
+    return resultados
+
+
+def imprimir_resumen(resultados, segundos):
+    """Muestra cuántos reportes se generaron, se omitieron o fallaron."""
+    conteo = {}
+    for resultado in resultados.values():
+        conteo[resultado['estado']] = conteo.get(resultado['estado'], 0) + 1
+    print(f"{len(resultados)} archivos en {segundos:.1f} s: "
+          f"{conteo.get('generado', 0)} generados, {conteo.get('vigente', 0)} vigentes, "
+          f"{conteo.get('error', 0)} con error")
+
+    etapas = {}
+    for resultado in resultados.values():
+        for etapa, duracion in resultado.get('etapas', {}).items():
+            etapa = etapa.partition(':')[0]
+            etapas[etapa] = etapas.get(etapa, 0) + duracion
+    for etapa, duracion in sorted(etapas.items(), key=lambda item: -item[1]):
+        print(f"  {etapa:<16} {duracion:8.2f} s")
+
+
+def main():
+    """Genera los reportes de los archivos y directorios indicados."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('entradas', nargs='+', help='archivos CSV o ZIP, o directorios')
+    parser.add_argument('--salida', default=DIRECTORIO_SALIDA,
+                        help='directorio de los reportes generados')
+    parser.add_argument('--procesos', type=int,
+                        help='archivos procesados a la vez (por defecto, núcleos del equipo)')
+    parser.add_argument('--tipo', default=TIPO_REPORTE_DETALLADO, choices=TIPOS_REPORTE)
+    parser.add_argument('--forzar', action='store_true',
+                        help='regenerar aunque el reporte esté vigente')
+    parser.add_argument('--sin-historial', action='store_true',
+                        help='no agregar los registros al historial')
+    parser.add_argument('--tiempos', help='archivo JSON con los tiempos de cada reporte')
+    argumentos = parser.parse_args()
+
+    entradas = buscar_entradas(argumentos.entradas)
+    if not entradas:
+        print("No se encontraron archivos CSV ni ZIP")
+        return 1
+
+    inicio = time.perf_counter()
+    resultados = generar_reportes(
+        entradas, argumentos.salida, argumentos.procesos, argumentos.tipo,
+        argumentos.forzar, HISTORIAL_HABILITADO and not argumentos.sin_historial
+    )
+    segundos = time.perf_counter() - inicio
+    imprimir_resumen(resultados, segundos)
+
+    if argumentos.tiempos:
+        with open(argumentos.tiempos, 'w', encoding='utf-8') as f:
+            json.dump({'segundos': round(segundos, 3), 'reportes': resultados}, f,
+                      ensure_ascii=False, indent=2)
+    return 1 if any(r['estado'] == 'error' for r in resultados.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""
+Historial columnar de impresiones en formato Parquet.
+
+Cada CSV procesado se agrega a un almacén particionado por año, mes e
+impresora (carpetas estilo Hive), eliminando los registros repetidos. Los
+reportes de cualquier rango de fechas leen solo las particiones necesarias
+y las columnas solicitadas, sin volver a subir los CSV originales.
+
+Además, cada mes tiene un cubo con los totales por impresora, usuario,
+cliente, escala de grises y dúplex. Al agregar un CSV solo se recalculan los
+cubos de los meses con registros nuevos, y los resúmenes y las consultas
+agregadas leen los cubos en lugar de los registros.
+"""
+import glob
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from procesamiento import (
+    COLUMNAS_ENTERAS_PROCESADAS, ENCABEZADOS_REQUERIDOS, MESES_ES, compactar_dataframe,
+    procesar_dataframe
+)
+
+# pyarrow es opcional: sin él, el historial queda deshabilitado
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# =============================================================================
+# CONFIGURACIÓN DEL HISTORIAL
+# =============================================================================
+
+load_dotenv()
+
+HISTORIAL_HABILITADO = (
+    os.getenv('HISTORIAL_HABILITADO', 'True').lower() in ('1', 'true', 'si', 'sí') and
+    pa is not None
+)
+DIRECTORIO_HISTORIAL = (os.getenv('DIRECTORIO_HISTORIAL') or
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'historial'))
+
+# Registros considerados iguales al agregar un CSV ya cargado
+CLAVE_DEDUPLICACION = ['Hora', 'Usuario', 'Impresora', 'Nombre Documento']
+
+# Columnas de partición (nombres ASCII para las carpetas)
+CAMPO_AÑO = 'anio'
+CAMPO_MES = 'mes'
+CAMPO_IMPRESORA = 'impresora'
+
+# Orden de columnas del DataFrame procesado (igual al de procesar_dataframe)
+COLUMNAS_PROCESADAS = list(
+    procesar_dataframe(pd.DataFrame(columns=ENCABEZADOS_REQUERIDOS)).columns
+)
+
+# Indica por registro si se imprimió a doble cara (procesar_dataframe
+# descarta Frente/reverso, así que se guarda aparte)
+COLUMNA_DUPLEX = 'Dúplex'
+
+# Esquema fijo de los archivos de partición. Con tipos categóricos Arrow
+# elegiría un índice de diccionario distinto según cada CSV y el dataset no
+# podría leer particiones con anchos distintos; las cantidades se guardan
+# como float64 para admitir faltantes y decimales
+COLUMNAS_PARTICION = [
+    c for c in COLUMNAS_PROCESADAS if c not in ('Año', 'Mes', 'Impresora')
+] + [COLUMNA_DUPLEX]
+ESQUEMA_PARTICION = pa.schema([
+    (columna,
+     pa.bool_() if columna == COLUMNA_DUPLEX else
+     pa.float64() if columna in COLUMNAS_ENTERAS_PROCESADAS else
+     pa.string())
+    for columna in COLUMNAS_PARTICION
+]) if pa is not None else None
+
+# Cubos mensuales: un archivo por mes con las medidas sumadas por dimensión.
+# El prefijo '_' excluye la carpeta de la lectura del historial
+DIRECTORIO_CUBOS = os.path.join(DIRECTORIO_HISTORIAL, '_cubos')
+DIMENSIONES_CUBO = ['Impresora', 'Usuario', 'Cliente', 'Escala de grises', COLUMNA_DUPLEX]
+MEDIDAS_CUBO = ['Trabajos', 'Impresiones', 'Páginas', 'Copias']
+COLUMNAS_CUBO = ['Año', 'Mes'] + DIMENSIONES_CUBO + MEDIDAS_CUBO
+
+ESPERA_BLOQUEO = 0.05  # Segundos entre intentos de bloquear una partición
+BLOQUEO_VENCIDO = 300  # Segundos tras los que un bloqueo se considera abandonado
+
+# =============================================================================
+# ESCRITURA INCREMENTAL
+# =============================================================================
+
+
+def _ruta_particion(año, mes, impresora):
+    """Ruta del archivo Parquet de una partición."""
+    return os.path.join(
+        DIRECTORIO_HISTORIAL,
+        f"{CAMPO_AÑO}={año}",
+        f"{CAMPO_MES}={mes}",
+        f"{CAMPO_IMPRESORA}={quote(str(impresora), safe='')}",
+        'datos.parquet'
+    )
+
+
+@contextmanager
+def _bloquear_particion(ruta):
+    """Bloqueo entre procesos mediante un archivo creado en forma exclusiva."""
+    ruta_bloqueo = f"{ruta}.lock"
+    while True:
+        try:
+            descriptor = os.open(ruta_bloqueo, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(descriptor)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(ruta_bloqueo) > BLOQUEO_VENCIDO:
+                    os.unlink(ruta_bloqueo)
+                    continue
+            except OSError:
+                continue
+            time.sleep(ESPERA_BLOQUEO)
+    try:
+        yield
+    finally:
+        os.unlink(ruta_bloqueo)
+
+
+def _tabla_particion(df):
+    """Convierte los registros de una partición a ESQUEMA_PARTICION."""
+    columnas = []
+    for campo in ESQUEMA_PARTICION:
+        if campo.name in df.columns:
+            columnas.append(pa.Array.from_pandas(df[campo.name]).cast(campo.type))
+        else:
+            columnas.append(pa.nulls(len(df), campo.type))
+    return pa.Table.from_arrays(columnas, schema=ESQUEMA_PARTICION)
+
+
+def _escribir_particion(ruta, nuevos):
+    """Combina los registros nuevos con los existentes y reescribe la partición."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    with _bloquear_particion(ruta):
+        existentes = (pq.read_table(ruta).to_pandas()
+                      if os.path.exists(ruta) else None)
+        if existentes is not None:
+            combinados = pd.concat([existentes, nuevos], ignore_index=True)
+        else:
+            combinados = nuevos
+        combinados = combinados.drop_duplicates(
+            subset=[c for c in CLAVE_DEDUPLICACION if c in combinados.columns]
+        )
+        if COLUMNA_DUPLEX in combinados.columns:
+            # Las particiones anteriores a la columna la dejan vacía
+            combinados[COLUMNA_DUPLEX] = combinados[COLUMNA_DUPLEX].astype('boolean')
+        agregados = len(combinados) - (0 if existentes is None else len(existentes))
+
+        temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+        pq.write_table(_tabla_particion(combinados), temporal)
+        os.replace(temporal, ruta)
+
+    return agregados
+
+
+def agregar_al_historial(df, es_duplex=None):
+    """Agrega un DataFrame procesado al historial y devuelve las filas nuevas.
+
+    ``es_duplex`` indica por fila si el trabajo es dúplex (si falta, el dato
+    queda vacío). Las filas sin fecha válida no pueden ubicarse en una
+    partición y se omiten. Al terminar se recalculan los cubos de los meses
+    que recibieron filas nuevas.
+    """
+    if not HISTORIAL_HABILITADO or df.empty:
+        return 0
+
+    con_fecha_valida = (df['Año'].notna() & df['Mes'].notna()).to_numpy()
+    con_fecha = df[con_fecha_valida]
+    omitidas = len(df) - len(con_fecha)
+    if omitidas:
+        print(f"Historial: {omitidas} filas sin fecha válida no se agregaron")
+
+    numero_mes = pd.Series(pd.Categorical(con_fecha['Mes'], categories=MESES_ES).codes + 1,
+                           index=con_fecha.index)
+    datos = con_fecha.drop(columns=['Año', 'Mes', 'Impresora'])
+    datos[COLUMNA_DUPLEX] = (pd.array(es_duplex[con_fecha_valida], dtype='boolean')
+                             if es_duplex is not None
+                             else pd.array([pd.NA] * len(datos), dtype='boolean'))
+
+    agregados = 0
+    meses_nuevos = set()
+    grupos = con_fecha.groupby([con_fecha['Año'], numero_mes, con_fecha['Impresora']],
+                               observed=True, sort=False).indices
+    for (año, mes, impresora), posiciones in grupos.items():
+        # La impresora ya está en la ruta, así que se deduplica dentro de la partición
+        nuevos = datos.iloc[posiciones].reset_index(drop=True)
+        agregados_particion = _escribir_particion(
+            _ruta_particion(int(año), int(mes), impresora), nuevos
+        )
+        if agregados_particion:
+            meses_nuevos.add((int(año), int(mes)))
+        agregados += agregados_particion
+
+    for año, mes in sorted(meses_nuevos):
+        actualizar_cubo(año, mes)
+    return agregados
+
+
+def actualizar_historial(df, es_duplex=None):
+    """Agrega el CSV procesado al historial sin impedir que se genere el reporte."""
+    try:
+        agregados = agregar_al_historial(df, es_duplex)
+        print(f"Historial: {agregados} filas nuevas de {len(df)}")
+    except Exception as e:  # pylint: disable=broad-except
+        print(f"Error al actualizar el historial: {e}")
+
+# =============================================================================
+# LECTURA POR RANGO DE FECHAS
+# =============================================================================
+
+
+def _filtro_rango(desde, hasta):
+    """Expresión de partición para un rango (año, mes) inclusivo."""
+    año = ds.field(CAMPO_AÑO)
+    mes = ds.field(CAMPO_MES)
+    filtro = None
+    if desde is not None:
+        filtro = (año > desde[0]) | ((año == desde[0]) & (mes >= desde[1]))
+    if hasta is not None:
+        hasta_expr = (año < hasta[0]) | ((año == hasta[0]) & (mes <= hasta[1]))
+        filtro = hasta_expr if filtro is None else filtro & hasta_expr
+    return filtro
+
+
+def leer_historial(desde=None, hasta=None, columnas=None, impresoras=None):
+    """Lee el historial para un rango (año, mes) inclusivo.
+
+    Solo se abren las particiones del rango (y de las impresoras indicadas)
+    y solo se leen las columnas solicitadas. Devuelve un DataFrame con la
+    misma estructura que procesar_dataframe.
+    """
+    if not HISTORIAL_HABILITADO or not os.path.isdir(DIRECTORIO_HISTORIAL):
+        return pd.DataFrame(columns=columnas or COLUMNAS_PROCESADAS)
+
+    esquema_carpetas = pa.schema([(CAMPO_AÑO, pa.int16()), (CAMPO_MES, pa.int8()),
+                                  (CAMPO_IMPRESORA, pa.string())])
+    # El esquema explícito también convierte las particiones escritas antes
+    # del esquema fijo (columnas de diccionario)
+    dataset = ds.dataset(DIRECTORIO_HISTORIAL, format='parquet',
+                         schema=pa.unify_schemas([ESQUEMA_PARTICION, esquema_carpetas]),
+                         partitioning=ds.partitioning(esquema_carpetas, flavor='hive'),
+                         exclude_invalid_files=True)
+
+    filtro = _filtro_rango(desde, hasta)
+    if impresoras:
+        filtro_impresoras = ds.field(CAMPO_IMPRESORA).isin(list(impresoras))
+        filtro = filtro_impresoras if filtro is None else filtro & filtro_impresoras
+
+    columnas_datos = [
+        c for c in (columnas or COLUMNAS_PROCESADAS)
+        if c not in ('Año', 'Mes', 'Impresora')
+    ]
+    tabla = dataset.to_table(
+        columns=columnas_datos + [CAMPO_AÑO, CAMPO_MES, CAMPO_IMPRESORA],
+        filter=filtro
+    )
+    df = tabla.to_pandas()
+
+    df['Año'] = df.pop(CAMPO_AÑO).astype('Int16')
+    df['Mes'] = pd.Categorical.from_codes(df.pop(CAMPO_MES).astype('int8') - 1,
+                                          categories=MESES_ES, ordered=True)
+    df['Impresora'] = df.pop(CAMPO_IMPRESORA).astype('category')
+    df = compactar_dataframe(df.sort_values(['Año', 'Mes'], kind='stable', ignore_index=True))
+
+    return df[[c for c in (columnas or COLUMNAS_PROCESADAS) if c in df.columns]]
+
+# =============================================================================
+# CUBOS MENSUALES
+# =============================================================================
+
+
+def _ruta_cubo(año, mes):
+    """Ruta del archivo Parquet con el cubo de un mes."""
+    return os.path.join(DIRECTORIO_CUBOS, f"{año}-{mes:02d}.parquet")
+
+
+def _particiones_mes(año, mes):
+    """Rutas de los archivos del historial de un mes (uno por impresora)."""
+    return glob.glob(os.path.join(
+        glob.escape(DIRECTORIO_HISTORIAL), f"{CAMPO_AÑO}={año}", f"{CAMPO_MES}={mes}",
+        f"{CAMPO_IMPRESORA}=*", 'datos.parquet'
+    ))
+
+
+def calcular_cubo(df):
+    """Suma las medidas de los registros por DIMENSIONES_CUBO.
+
+    ``Trabajos`` cuenta los registros; los dúplex sin dato se cuentan como
+    impresiones a una cara.
+    """
+    medidas = pd.DataFrame({'Trabajos': np.ones(len(df), dtype='int64')}, index=df.index)
+    for columna in MEDIDAS_CUBO[1:]:
+        medidas[columna] = (pd.to_numeric(df[columna], errors='coerce').fillna(0)
+                            .to_numpy(dtype='int64'))
+    dimensiones = [df[columna] for columna in DIMENSIONES_CUBO[:-1]]
+    dimensiones.append(df[COLUMNA_DUPLEX].fillna(False).astype(bool))
+    return medidas.groupby(dimensiones, observed=True, dropna=False,
+                           sort=False).sum().reset_index()
+
+
+def _calcular_cubo_particion(ruta):
+    """Cubo de una partición del historial, leyendo solo las columnas necesarias."""
+    disponibles = pq.read_schema(ruta).names
+    columnas = [c for c in DIMENSIONES_CUBO + MEDIDAS_CUBO if c in disponibles]
+    registros = pq.read_table(ruta, columns=columnas).to_pandas()
+    if COLUMNA_DUPLEX not in registros.columns:
+        registros[COLUMNA_DUPLEX] = False
+    carpeta = os.path.basename(os.path.dirname(ruta))
+    registros['Impresora'] = unquote(carpeta.split('=', 1)[1])
+    return calcular_cubo(registros)
+
+
+def actualizar_cubo(año, mes):
+    """Recalcula el cubo de un mes a partir de sus particiones y lo devuelve.
+
+    Cada partición tiene una sola impresora, así que sus cubos se concatenan
+    sin volver a agrupar. El recálculo se serializa con un bloqueo para que
+    el último en escribir haya leído todas las particiones ya guardadas.
+    """
+    ruta = _ruta_cubo(año, mes)
+    os.makedirs(DIRECTORIO_CUBOS, exist_ok=True)
+
+    with _bloquear_particion(ruta):
+        particiones = _particiones_mes(año, mes)
+        if particiones:
+            cubo = pd.concat([_calcular_cubo_particion(particion) for particion in particiones],
+                             ignore_index=True)
+        else:
+            cubo = pd.DataFrame(columns=DIMENSIONES_CUBO + MEDIDAS_CUBO)
+
+        temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+        pq.write_table(pa.Table.from_pandas(cubo, preserve_index=False), temporal)
+        os.replace(temporal, ruta)
+    return cubo
+
+
+def _cubo_vigente(año, mes):
+    """Indica si el cubo del mes es posterior a todas sus particiones."""
+    try:
+        modificacion = os.stat(_ruta_cubo(año, mes)).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return all(os.stat(particion).st_mtime_ns <= modificacion
+               for particion in _particiones_mes(año, mes))
+
+
+def _meses_historial(desde=None, hasta=None):
+    """Meses (año, mes) del historial dentro del rango inclusivo, en orden."""
+    meses = []
+    for carpeta_mes in glob.glob(os.path.join(glob.escape(DIRECTORIO_HISTORIAL),
+                                              f"{CAMPO_AÑO}=*", f"{CAMPO_MES}=*")):
+        try:
+            año = int(os.path.basename(os.path.dirname(carpeta_mes)).split('=', 1)[1])
+            mes = int(os.path.basename(carpeta_mes).split('=', 1)[1])
+        except ValueError:
+            continue
+        if (desde is None or (año, mes) >= desde) and (hasta is None or (año, mes) <= hasta):
+            meses.append((año, mes))
+    return sorted(meses)
+
+
+def leer_cubos(desde=None, hasta=None):
+    """Lee los cubos de un rango (año, mes) inclusivo en un solo DataFrame.
+
+    Los cubos que faltan o son anteriores a alguna de sus particiones (por
+    ejemplo, tras una carga interrumpida) se recalculan antes de leerse. El
+    resultado tiene las columnas COLUMNAS_CUBO, con Año y Mes con los mismos
+    tipos que en procesar_dataframe.
+    """
+    if not HISTORIAL_HABILITADO or not os.path.isdir(DIRECTORIO_HISTORIAL):
+        return pd.DataFrame(columns=COLUMNAS_CUBO)
+
+    cubos = []
+    for año, mes in _meses_historial(desde, hasta):
+        if _cubo_vigente(año, mes):
+            cubo = pq.read_table(_ruta_cubo(año, mes)).to_pandas()
+        else:
+            cubo = actualizar_cubo(año, mes)
+        cubo.insert(0, 'Año', año)
+        cubo.insert(1, 'Mes', mes)
+        cubos.append(cubo)
+    if not cubos:
+        return pd.DataFrame(columns=COLUMNAS_CUBO)
+
+    df = pd.concat(cubos, ignore_index=True)
+    df['Año'] = df['Año'].astype('Int16')
+    df['Mes'] = pd.Categorical.from_codes(df['Mes'].astype('int8') - 1,
+                                          categories=MESES_ES, ordered=True)
+    for columna in ['Impresora', 'Usuario', 'Cliente']:
+        df[columna] = df[columna].astype('category')
+    df[COLUMNA_DUPLEX] = df[COLUMNA_DUPLEX].astype(bool)
+    return df[COLUMNAS_CUBO]
@@ -0,0 +1,234 @@
+"""
+Métricas de rendimiento en formato de texto de Prometheus.
+
+Registra la duración, las filas, los bytes y la memoria de cada etapa del
+reporte en histogramas acumulados en memoria, además de contadores
+e indicadores instantáneos (por ejemplo, la cola de Waitress). La ruta
+/metrics de la app expone todo con ``exponer_metricas``.
+"""
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# resource solo existe en sistemas tipo Unix; psutil es opcional
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# =============================================================================
+# CONFIGURACIÓN DE LAS MÉTRICAS
+# =============================================================================
+
+PREFIJO = 'reportes_impresiones'
+
+BUCKETS_SEGUNDOS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BUCKETS_FILAS = (100, 1_000, 10_000, 50_000, 100_000, 250_000, 500_000,
+                 1_000_000, 2_500_000, 5_000_000)
+BUCKETS_BYTES = tuple(1024 * 1024 * mb for mb in (
+    0.1, 0.5, 1, 5, 10, 25, 50, 100, 250, 500, 1024, 2048, 4096
+))
+
+# Descripción de cada métrica: nombre -> (tipo, ayuda, buckets)
+DEFINICIONES = {
+    'etapa_segundos': ('histogram', 'Duración de cada etapa del reporte', BUCKETS_SEGUNDOS),
+    'etapa_filas': ('histogram', 'Filas procesadas en cada etapa', BUCKETS_FILAS),
+    'etapa_memoria_residente_bytes': ('histogram',
+                                      'Memoria residente del proceso al terminar cada etapa',
+                                      BUCKETS_BYTES),
+    'etapa_memoria_datos_bytes': ('histogram',
+                                  'Memoria ocupada por el DataFrame al terminar cada etapa',
+                                  BUCKETS_BYTES),
+    'etapa_bytes': ('histogram', 'Bytes leídos o enviados en cada etapa', BUCKETS_BYTES),
+    'trabajo_segundos': ('histogram', 'Duración total de los trabajos de reporte',
+                         BUCKETS_SEGUNDOS),
+    'trabajos_total': ('counter', 'Trabajos de reporte finalizados por estado', None),
+    'admision_rechazos_total': ('counter', 'Solicitudes rechazadas por falta de capacidad',
+                                None),
+    'filas_sin_fecha_total': ('counter', 'Filas cuya Hora no es una fecha válida', None),
+    'pivote_excel_libros_total': ('counter',
+                                  'Libros enviados al servicio de Excel por resultado', None),
+    'pivote_excel_reinicios_total': ('counter', 'Instancias de Excel reiniciadas por motivo',
+                                     None),
+}
+
+_histogramas = {}
+_contadores = {}
+_indicadores = {}
+_bloqueo = threading.Lock()
+
+# =============================================================================
+# REGISTRO
+# =============================================================================
+
+
+def _clave_etiquetas(etiquetas):
+    """Etiquetas ordenadas para usarlas como clave de una serie."""
+    return tuple(sorted((nombre, str(valor)) for nombre, valor in etiquetas.items()))
+
+
+def observar(metrica, valor, **etiquetas):
+    """Agrega una observación al histograma ``metrica``."""
+    if valor is None:
+        return
+    buckets = DEFINICIONES[metrica][2]
+    with _bloqueo:
+        serie = _histogramas.setdefault(metrica, {}).setdefault(
+            _clave_etiquetas(etiquetas),
+            {'buckets': [0] * len(buckets), 'suma': 0.0, 'cantidad': 0}
+        )
+        for indice, limite in enumerate(buckets):
+            if valor <= limite:
+                serie['buckets'][indice] += 1
+        serie['suma'] += valor
+        serie['cantidad'] += 1
+
+
+def incrementar(metrica, cantidad=1, **etiquetas):
+    """Incrementa el contador ``metrica``."""
+    with _bloqueo:
+        series = _contadores.setdefault(metrica, {})
+        clave = _clave_etiquetas(etiquetas)
+        series[clave] = series.get(clave, 0) + cantidad
+
+
+def registrar_indicador(metrica, funcion, ayuda):
+    """Registra un indicador cuyo valor se obtiene con ``funcion`` al exponerlo."""
+    with _bloqueo:
+        _indicadores[metrica] = (funcion, ayuda)
+
+
+def memoria_pico_bytes():
+    """Pico de memoria residente del proceso desde que inició (None si no se puede medir).
+
+    Es un valor de toda la vida del proceso: en los procesos que se reutilizan
+    no indica cuánto usó una etapa en particular.
+    """
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa KB y macOS bytes
+        return pico if sys.platform == 'darwin' else pico * 1024
+    if psutil is not None:
+        memoria = psutil.Process().memory_info()
+        return getattr(memoria, 'peak_wset', memoria.rss)
+    return None
+
+
+def memoria_actual_bytes():
+    """Memoria residente actual del proceso (None si no se puede medir)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        # Linux sin psutil: la segunda cifra son las páginas residentes
+        with open('/proc/self/statm', encoding='ascii') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError, IndexError, ValueError):
+        return None
+
+
+def registrar_etapa(etapa, segundos, filas=None, bytes_=None, hoja=None,
+                    memoria_residente=None, memoria_datos=None):
+    """Registra las mediciones de una etapa del reporte.
+
+    ``memoria_residente`` es la memoria residente del proceso al terminar la
+    etapa y ``memoria_datos`` la que ocupa el DataFrame.
+    """
+    etiquetas = {'etapa': etapa}
+    if hoja is not None:
+        etiquetas['hoja'] = hoja
+    observar('etapa_segundos', segundos, **etiquetas)
+    observar('etapa_filas', filas, **etiquetas)
+    observar('etapa_bytes', bytes_, **etiquetas)
+    observar('etapa_memoria_residente_bytes', memoria_residente, **etiquetas)
+    observar('etapa_memoria_datos_bytes', memoria_datos, **etiquetas)
+
+
+@contextmanager
+def medir_etapa(etapa, **datos):
+    """Mide la duración de una etapa del proceso actual.
+
+    El diccionario entregado permite completar filas y bytes dentro del
+    bloque; la memoria se toma al terminar.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio,
+                        filas=datos.get('filas'), bytes_=datos.get('bytes'),
+                        memoria_residente=memoria_actual_bytes())
+
+# =============================================================================
+# EXPOSICIÓN EN FORMATO PROMETHEUS
+# =============================================================================
+
+
+def _escapar(valor):
+    """Escapa un valor de etiqueta según el formato de texto de Prometheus."""
+    return valor.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _etiquetas(clave, extra=()):
+    """Texto de las etiquetas de una serie."""
+    pares = list(clave) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+def _numero(valor):
+    """Formatea un número para Prometheus."""
+    if isinstance(valor, float):
+        if math.isinf(valor):
+            return '+Inf' if valor > 0 else '-Inf'
+        return repr(round(valor, 6))
+    return str(valor)
+
+
+def exponer_metricas():
+    """Devuelve todas las métricas en el formato de texto de Prometheus."""
+    lineas = []
+    with _bloqueo:
+        for metrica, series in _histogramas.items():
+            nombre = f"{PREFIJO}_{metrica}"
+            _, ayuda, buckets = DEFINICIONES[metrica]
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+            for clave, serie in sorted(series.items()):
+                for limite, cantidad in zip(buckets, serie['buckets']):
+                    lineas.append(f"{nombre}_bucket"
+                                  f"{_etiquetas(clave, [('le', _numero(float(limite)))])} "
+                                  f"{cantidad}")
+                lineas.append(f"{nombre}_bucket{_etiquetas(clave, [('le', '+Inf')])} "
+                              f"{serie['cantidad']}")
+                lineas.append(f"{nombre}_sum{_etiquetas(clave)} {_numero(serie['suma'])}")
+                lineas.append(f"{nombre}_count{_etiquetas(clave)} {serie['cantidad']}")
+
+        for metrica, series in _contadores.items():
+            nombre = f"{PREFIJO}_{metrica}"
+            lineas += [f"# HELP {nombre} {DEFINICIONES[metrica][1]}",
+                       f"# TYPE {nombre} counter"]
+            for clave, valor in sorted(series.items()):
+                lineas.append(f"{nombre}{_etiquetas(clave)} {_numero(valor)}")
+
+        indicadores = list(_indicadores.items())
+
+    for metrica, (funcion, ayuda) in indicadores:
+        try:
+            valor = funcion()
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Error al leer el indicador {metrica}: {e}")
+            continue
+        if valor is None:
+            continue
+        nombre = f"{PREFIJO}_{metrica}"
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge",
+                   f"{nombre} {_numero(valor)}"]
+
+    return '\n'.join(lineas) + '\n'
@@ -0,0 +1,441 @@
+"""
+Servicio de tablas dinámicas con Excel (xlwings).
+
+Iniciar Excel tarda varios segundos y dos llamadas COM simultáneas sobre la
+misma instancia se bloquean entre sí. Por eso cada proceso mantiene un grupo
+pequeño de instancias ya iniciadas, cada una atendida por su propio hilo,
+que toman los libros de una cola de a uno. Las instancias se reinician
+después de TRABAJOS_POR_INSTANCIA_EXCEL libros o cuando fallan, y cada
+libro tiene un tiempo máximo de espera.
+
+Excel trabaja sobre una copia del libro, que reemplaza al original solo si
+terminó bien. El libro se genera siempre con la tabla dinámica nativa
+(tabla_dinamica.py), así que si el servicio no está disponible, falla o no
+responde a tiempo, el reporte conserva esa tabla.
+
+Con BACKEND_PIVOTE_EXCEL=simulado se usa un backend que no requiere Excel,
+para probar el servicio en Linux.
+"""
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from multiprocessing import util
+
+from dotenv import load_dotenv
+
+from tabla_dinamica import NOMBRE_HOJA_PIVOTE
+
+# xlwings solo está disponible en equipos con Excel instalado (Windows)
+try:
+    import xlwings as xw
+except ImportError:
+    xw = None
+
+# pywin32 inicializa COM en los hilos que no son el principal
+try:
+    import pythoncom
+except ImportError:
+    pythoncom = None
+
+# =============================================================================
+# CONFIGURACIÓN DEL SERVICIO
+# =============================================================================
+
+load_dotenv()
+
+# Usar Excel (xlwings) para la tabla dinámica en lugar de la versión nativa
+USAR_EXCEL_PIVOTE = os.getenv('USAR_EXCEL_PIVOTE', 'False').lower() in ('1', 'true', 'si', 'sí')
+
+# 'xlwings' (Excel real) o 'simulado' (sin Excel, para pruebas)
+BACKEND_PIVOTE_EXCEL = os.getenv('BACKEND_PIVOTE_EXCEL', 'xlwings').lower()
+
+# Instancias de Excel por proceso y libros que procesa cada una antes de reiniciarse
+INSTANCIAS_EXCEL = int(os.getenv('INSTANCIAS_EXCEL') or '1')
+TRABAJOS_POR_INSTANCIA_EXCEL = int(os.getenv('TRABAJOS_POR_INSTANCIA_EXCEL') or '20')
+
+# Segundos que se espera la tabla de Excel (incluida la cola) antes de
+# conservar la nativa
+TIEMPO_MAXIMO_PIVOTE = float(os.getenv('TIEMPO_MAXIMO_PIVOTE_SEGUNDOS') or '300')
+
+# Segundos sin volver a intentar iniciar Excel después de que no pudo iniciarse
+ESPERA_REINICIO_EXCEL = 60
+
+# Hay con qué generar la tabla dinámica de Excel
+PIVOTE_EXCEL_DISPONIBLE = USAR_EXCEL_PIVOTE and (BACKEND_PIVOTE_EXCEL == 'simulado' or
+                                                 xw is not None)
+
+_servicio = None
+_bloqueo_servicio = threading.Lock()
+
+# =============================================================================
+# TABLA DINÁMICA CON EXCEL
+# =============================================================================
+
+
+def crear_tabla_dinamica(wb, sheet_datos):
+    """Crea una tabla dinámica de Excel en el libro abierto con xlwings."""
+    try:
+        # Crear nueva hoja para tabla dinámica
+        sheet_pivot = wb.sheets.add(NOMBRE_HOJA_PIVOTE)
+
+        # Obtener el rango de datos
+        data_range = sheet_datos.range('A1').expand()
+        sheet_name = sheet_datos.name
+        source_data = f"'{sheet_name}'!{data_range.address}"
+
+        # Crear PivotCache y PivotTable
+        pivot_cache = wb.api.PivotCaches().Create(
+            SourceType=1,  # xlDatabase
+            SourceData=source_data
+        )
+
+        pivot_table = pivot_cache.CreatePivotTable(
+            TableDestination=sheet_pivot.range('C3').api,
+            TableName='TablaDinamica1'
+        )
+
+        # Aplicar formato
+        pivot_range = pivot_table.TableRange2
+        pivot_range.Font.Name = "Calibri"
+        pivot_range.Font.Size = 14
+        pivot_table.TableStyle2 = "PivotStyleLight9"
+
+        # Autoajustar columnas y filas
+        pivot_range.Columns.AutoFit()
+        pivot_range.Rows.AutoFit()
+
+        # Configurar campos de COLUMNAS (AÑO y MES)
+        pivot_table.PivotFields('Año').Orientation = 2  # xlColumnField
+        pivot_table.PivotFields('Año').Position = 1
+
+        pivot_table.PivotFields('Mes').Orientation = 2  # xlColumnField
+        pivot_table.PivotFields('Mes').Position = 2
+
+        # Configurar campos de FILAS (Impresora y Usuario)
+        pivot_table.PivotFields('Impresora').Orientation = 1  # xlRowField
+        pivot_table.PivotFields('Impresora').Position = 1
+
+        pivot_table.PivotFields('Usuario').Orientation = 1  # xlRowField
+        pivot_table.PivotFields('Usuario').Position = 2
+
+        # Agregar campo de valor
+        data_field = pivot_table.AddDataField(
+            pivot_table.PivotFields('Impresiones'),
+            'Suma de Impresiones',
+            -4157  # xlSum
+        )
+        data_field.NumberFormat = "#,##0"
+
+        # Expandir campos
+        pivot_table.PivotFields('Impresora').ShowDetail = True
+        pivot_table.PivotFields('AÑO').ShowDetail = True
+
+        return True
+    except (AttributeError, KeyError, ValueError) as e:
+        print(f"Error al crear tabla dinámica: {e}")
+        return False
+
+# =============================================================================
+# BACKENDS
+# =============================================================================
+
+
+class BackendXlwings:
+    """Instancias reales de Excel manejadas con xlwings."""
+
+    disponible = xw is not None
+
+    def preparar_hilo(self):
+        """Inicializa COM en el hilo que va a usar las instancias."""
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+
+    def liberar_hilo(self):
+        if pythoncom is not None:
+            pythoncom.CoUninitialize()
+
+    def iniciar(self):
+        """Inicia una instancia de Excel oculta y sin libros."""
+        app_xw = xw.App(visible=False, add_book=False)
+        app_xw.display_alerts = False
+        app_xw.screen_updating = False
+        return app_xw
+
+    def agregar_tabla_dinamica(self, app_xw, ruta):
+        """Reemplaza la tabla dinámica nativa del libro por una de Excel."""
+        wb = app_xw.books.open(ruta)
+        try:
+            if NOMBRE_HOJA_PIVOTE in [sheet.name for sheet in wb.sheets]:
+                wb.sheets[NOMBRE_HOJA_PIVOTE].delete()
+            if not crear_tabla_dinamica(wb, wb.sheets['GENERAL']):
+                raise RuntimeError("Excel no pudo crear la tabla dinámica")
+            wb.save()
+        finally:
+            wb.close()
+
+    def cerrar(self, app_xw):
+        app_xw.quit()
+
+    def matar(self, app_xw):
+        """Termina el proceso de Excel; la llamada COM en curso falla."""
+        app_xw.kill()
+
+
+class BackendSimulado:
+    """Backend sin Excel que registra los libros recibidos, para pruebas.
+
+    ``demora_inicio`` y ``demora_libro`` simulan los tiempos de Excel en
+    segundos y ``fallar`` (ruta -> bool) indica qué libros deben fallar.
+    El libro no se modifica: conserva la tabla dinámica nativa.
+    """
+
+    disponible = True
+
+    def __init__(self, demora_inicio=0.0, demora_libro=0.0, fallar=None):
+        self.demora_inicio = demora_inicio
+        self.demora_libro = demora_libro
+        self.fallar = fallar
+        self.iniciadas = 0
+        self.libros = []
+        self._bloqueo = threading.Lock()
+
+    def preparar_hilo(self):
+        pass
+
+    def liberar_hilo(self):
+        pass
+
+    def iniciar(self):
+        time.sleep(self.demora_inicio)
+        with self._bloqueo:
+            self.iniciadas += 1
+            return {'numero': self.iniciadas, 'libros': 0, 'terminada': threading.Event()}
+
+    def agregar_tabla_dinamica(self, instancia, ruta):
+        if instancia['terminada'].wait(self.demora_libro):
+            raise RuntimeError("La instancia simulada fue terminada")
+        if self.fallar is not None and self.fallar(ruta):
+            raise RuntimeError("Fallo simulado de Excel")
+        instancia['libros'] += 1
+        with self._bloqueo:
+            self.libros.append(ruta)
+
+    def cerrar(self, instancia):
+        instancia['terminada'].set()
+
+    def matar(self, instancia):
+        instancia['terminada'].set()
+
+
+def crear_backend(nombre=BACKEND_PIVOTE_EXCEL):
+    """Backend configurado en BACKEND_PIVOTE_EXCEL."""
+    if nombre == 'simulado':
+        return BackendSimulado()
+    return BackendXlwings()
+
+# =============================================================================
+# GRUPO DE INSTANCIAS
+# =============================================================================
+
+
+class PedidoPivote:
+    """Libro en espera de la tabla dinámica de Excel.
+
+    ``resultado`` es 'ok', 'error', 'tiempo_agotado' o 'no_disponible' y
+    ``reinicio`` el motivo ('limite' o 'fallo') si la instancia que lo
+    atendió se reinició después.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.instancia = None
+        self.cancelado = False
+        self.resultado = 'no_disponible'
+        self.reinicio = None
+        self.terminado = threading.Event()
+
+    def informe(self):
+        """Resultado del pedido para el registro de progreso del trabajo."""
+        return {'resultado': self.resultado, 'reinicio': self.reinicio}
+
+
+class ServicioPivote:
+    """Instancias de Excel ya iniciadas que atienden libros de una cola.
+
+    Cada instancia pertenece a un hilo, que la inicia antes de recibir
+    libros, la reinicia después de ``trabajos_por_instancia`` libros o de un
+    fallo, y la cierra al terminar el servicio.
+    """
+
+    def __init__(self, backend, instancias=INSTANCIAS_EXCEL,
+                 trabajos_por_instancia=TRABAJOS_POR_INSTANCIA_EXCEL,
+                 tiempo_maximo=TIEMPO_MAXIMO_PIVOTE):
+        self.backend = backend
+        self.trabajos_por_instancia = max(1, trabajos_por_instancia)
+        self.tiempo_maximo = tiempo_maximo
+        self.pid = os.getpid()
+        self.cerrado = False
+        self.sin_excel_hasta = 0.0
+        self.cola = queue.Queue()
+        self._bloqueo = threading.Lock()
+        self.hilos = [
+            threading.Thread(target=self._atender, name=f"pivote-excel-{indice}", daemon=True)
+            for indice in range(max(1, instancias))
+        ]
+        for hilo in self.hilos:
+            hilo.start()
+
+    def disponible(self):
+        """El servicio acepta libros: está abierto y Excel se pudo iniciar."""
+        return (not self.cerrado and self.backend.disponible and
+                time.monotonic() >= self.sin_excel_hasta)
+
+    def agregar_tabla_dinamica(self, ruta, tiempo_maximo=None):
+        """Pide la tabla dinámica de Excel para el libro en ``ruta`` y la espera.
+
+        Devuelve el informe del pedido (PedidoPivote.informe). Salvo con
+        resultado 'ok', el libro queda sin cambios. Los procesos de trabajo
+        no comparten las métricas de la app, así que quien llama entrega el
+        informe con el progreso del trabajo.
+        """
+        pedido = PedidoPivote(ruta)
+        if not self.disponible():
+            return pedido.informe()
+
+        self.cola.put(pedido)
+        if pedido.terminado.wait(tiempo_maximo or self.tiempo_maximo):
+            return pedido.informe()
+
+        with self._bloqueo:
+            if pedido.terminado.is_set():
+                return pedido.informe()
+            pedido.cancelado = True
+            pedido.resultado = 'tiempo_agotado'
+            instancia = pedido.instancia
+        print(f"Excel no terminó la tabla dinámica a tiempo: {ruta}")
+        if instancia is not None:
+            # Terminar Excel libera al hilo, que inicia otra instancia
+            pedido.reinicio = 'fallo'
+            self._descartar(instancia, cerrar=False)
+        return pedido.informe()
+
+    def cerrar(self, espera=30):
+        """Deja de aceptar libros y cierra las instancias."""
+        if self.cerrado:
+            return
+        self.cerrado = True
+        for _ in self.hilos:
+            self.cola.put(None)
+        for hilo in self.hilos:
+            hilo.join(espera)
+
+    def _atender(self):
+        """Ciclo de un hilo: mantiene su instancia y procesa libros de la cola."""
+        self.backend.preparar_hilo()
+        instancia, libros = None, 0
+        try:
+            while True:
+                # La instancia se inicia antes de que llegue el libro
+                if instancia is None and self.disponible():
+                    instancia = self._iniciar()
+
+                pedido = self.cola.get()
+                if pedido is None:
+                    break
+                if instancia is None and self.disponible():
+                    instancia = self._iniciar()
+                with self._bloqueo:
+                    if pedido.cancelado or instancia is None:
+                        pedido.terminado.set()
+                        continue
+                    pedido.instancia = instancia
+
+                libros += 1
+                exito = self._procesar(instancia, pedido,
+                                       libros >= self.trabajos_por_instancia)
+                if not exito or libros >= self.trabajos_por_instancia:
+                    self._descartar(instancia, cerrar=exito)
+                    instancia, libros = None, 0
+        finally:
+            if instancia is not None:
+                self._descartar(instancia, cerrar=True)
+            self.backend.liberar_hilo()
+
+    def _iniciar(self):
+        """Inicia una instancia; si no se puede, pausa el servicio un tiempo."""
+        try:
+            return self.backend.iniciar()
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"No se pudo iniciar Excel: {e}")
+            self.sin_excel_hasta = time.monotonic() + ESPERA_REINICIO_EXCEL
+            return None
+
+    def _procesar(self, instancia, pedido, ultimo):
+        """Agrega la tabla a una copia del libro y la publica si no se canceló.
+
+        ``ultimo`` indica que la instancia se reinicia después de este libro.
+        """
+        base, _ = os.path.splitext(pedido.ruta)
+        copia = f"{base}.excel-{uuid.uuid4().hex}.xlsx"
+        try:
+            shutil.copyfile(pedido.ruta, copia)
+            self.backend.agregar_tabla_dinamica(instancia, copia)
+            exito = True
+        except Exception as e:  # pylint: disable=broad-except
+            # Los errores de COM no comparten una clase base propia
+            print(f"Error de Excel al crear la tabla dinámica: {e}")
+            exito = False
+
+        with self._bloqueo:
+            publicar = exito and not pedido.cancelado
+            if publicar:
+                os.replace(copia, pedido.ruta)
+            elif os.path.exists(copia):
+                os.remove(copia)
+            if not pedido.cancelado:
+                pedido.resultado = 'ok' if exito else 'error'
+                pedido.reinicio = 'fallo' if not exito else ('limite' if ultimo else None)
+            pedido.terminado.set()
+        return exito
+
+    def _descartar(self, instancia, cerrar):
+        """Cierra la instancia (o termina su proceso) sin propagar errores."""
+        try:
+            if cerrar:
+                self.backend.cerrar(instancia)
+            else:
+                self.backend.matar(instancia)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Error al cerrar Excel: {e}")
+
+# =============================================================================
+# SERVICIO DEL PROCESO
+# =============================================================================
+
+
+def obtener_servicio():
+    """Servicio del proceso actual, creado al primer uso.
+
+    Los procesos hijos creados con fork no heredan los hilos, así que cada
+    proceso crea el suyo. Las instancias se cierran al salir del proceso.
+    """
+    global _servicio
+
+    with _bloqueo_servicio:
+        if _servicio is None or _servicio.pid != os.getpid():
+            _servicio = ServicioPivote(crear_backend())
+            # Finalize también se ejecuta al salir de los procesos de trabajo
+            util.Finalize(_servicio, _servicio.cerrar, exitpriority=10)
+        return _servicio
+
+
+def crear_tabla_dinamica_excel(ruta):
+    """Reemplaza la tabla dinámica nativa del libro por la de Excel.
+
+    Devuelve el informe del pedido; salvo con resultado 'ok', el libro
+    conserva la tabla nativa.
+    """
+    return obtener_servicio().agregar_tabla_dinamica(ruta)
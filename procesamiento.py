@@ -0,0 +1,1239 @@
+"""
+Procesamiento de reportes de impresión.
+
+Este módulo contiene la lectura de los CSV exportados por los servidores
+de impresión, su transformación y la generación del archivo Excel con las
+hojas filtradas y la tabla dinámica. No depende de Flask ni de la base de
+datos, por lo que puede ejecutarse en procesos de trabajo separados.
+"""
+import codecs
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import warnings
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import chardet
+from dotenv import load_dotenv
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.filters import AutoFilter
+from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from filtros import (LARGO_MAXIMO_HOJA, TABLA_GENERAL, compilar_filtros,
+                     nombre_tabla, obtener_filtros)
+from metricas import incrementar
+from resumen import VALOR_DUPLEX, calcular_resumenes, calcular_resumenes_cubo, marcar_valor
+from pivote_excel import PIVOTE_EXCEL_DISPONIBLE, crear_tabla_dinamica_excel
+from tabla_dinamica import crear_tabla_dinamica_nativa
+
+# charset-normalizer es opcional y más rápido que chardet para la muestra
+try:
+    from charset_normalizer import from_bytes as detectar_charset
+except ImportError:
+    detectar_charset = None
+
+# pyarrow es opcional: permite compartir el DataFrame con los procesos que
+# escriben las hojas en paralelo y convierte las fechas con un formato
+# conocido mucho más rápido que pandas
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+except ImportError:
+    pa = pc = feather = None
+
+# =============================================================================
+# CONFIGURACIÓN DEL PROCESAMIENTO
+# =============================================================================
+
+# Cargar variables de entorno desde archivo .env
+load_dotenv()
+
+# Versión del contenido del reporte; incrementarla invalida los reportes en caché
+VERSION_REPORTE = 2
+
+# Modo de escritura del Excel: 'rapido' (solo escritura, memoria constante)
+# o 'completo' (pandas + openpyxl recorriendo todas las celdas)
+MODO_EXCEL = os.getenv('MODO_EXCEL', 'rapido').lower()
+
+# Tipos de reporte: 'detallado' escribe todas las filas en GENERAL y en cada
+# hoja filtrada; 'resumen' solo escribe los totales agregados
+TIPO_REPORTE_DETALLADO = 'detallado'
+TIPO_REPORTE_RESUMEN = 'resumen'
+TIPOS_REPORTE = (TIPO_REPORTE_DETALLADO, TIPO_REPORTE_RESUMEN)
+
+# Nombres de los meses en español (índice 0 = Enero)
+MESES_ES = [
+    'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+    'Agosto', 'Setiembre', 'Octubre', 'Noviembre', 'Diciembre'
+]
+
+# Encabezados requeridos para el CSV
+ENCABEZADOS_REQUERIDOS = [
+    'Hora', 'Usuario', 'Páginas', 'Copias', 'Impresora',
+    'Nombre Documento', 'Cliente', 'Formato Papel', 'Idioma',
+    'Altura', 'Anchura', 'Frente/reverso', 'Escala de grises', 'Formato'
+]
+
+# Configuración de lectura del CSV por bloques
+TAMAÑO_MUESTRA_ENCODING = 64 * 1024  # Bytes analizados por el detector estadístico
+TAMAÑO_VENTANA_UTF8 = 256 * 1024  # Bytes validados como UTF-8 en cada ventana
+VENTANAS_UTF8 = 4  # Ventanas repartidas entre el inicio y el final del archivo
+MAXIMO_CACHE_ENCODINGS = 128  # Formatos de exportación recordados
+
+# Marcas de orden de bytes (las de UTF-32 antes que las de UTF-16)
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+TAMAÑO_BLOQUE_CSV = int(os.getenv('TAMANO_BLOQUE_CSV') or '100000')  # Filas por bloque
+
+# Lotes de varios CSV (subidos juntos o dentro de un ZIP)
+MAX_ARCHIVOS_LOTE = int(os.getenv('MAX_ARCHIVOS_LOTE') or '50')
+MAX_PROCESOS_LECTURA = int(os.getenv('MAX_PROCESOS_LECTURA') or str(os.cpu_count() or 1))
+MAX_DESCOMPRIMIDO_ZIP = int(os.getenv('MAX_ZIP_DESCOMPRIMIDO_MB') or '2048') * 1024 * 1024
+
+# Esquema compacto de las columnas, aplicado al leer cada bloque: los textos
+# con pocos valores distintos se guardan como categorías (un código por fila)
+# y los contadores como enteros de 32 bits. Hora y Nombre Documento tienen
+# casi un valor distinto por fila y quedan como texto.
+COLUMNAS_CATEGORICAS = ['Impresora', 'Usuario', 'Cliente', 'Formato Papel', 'Idioma',
+                        'Altura', 'Anchura', 'Frente/reverso', 'Escala de grises', 'Formato']
+COLUMNAS_ENTERAS = ['Páginas', 'Copias']
+COLUMNAS_ENTERAS_PROCESADAS = COLUMNAS_ENTERAS + ['Impresiones']
+LIMITES_INT32 = np.iinfo(np.int32)
+
+# Formatos de la columna Hora en las exportaciones conocidas, en orden de
+# preferencia (día antes que mes, como en la configuración regional en
+# español). El formato se detecta con una muestra de valores distintos
+FORMATOS_FECHA = [
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y/%m/%d %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y %I:%M:%S %p', '%d/%m/%Y %I:%M %p',
+    '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %I:%M %p',
+    '%d-%m-%Y %H:%M:%S', '%d.%m.%Y %H:%M:%S', '%d/%m/%Y', '%Y-%m-%d',
+]
+MUESTRA_FECHAS = 1000  # Valores distintos usados para detectar el formato
+# "p. m." y variantes de la configuración regional en español (se
+# convierten a AM/PM); la expresión es válida en Python y en pyarrow (RE2)
+PATRON_AM_PM = r'\s*([aApP])\.?\s?[mM]\.?$'
+AM_PM_ES = re.compile(PATRON_AM_PM)
+
+# Configuración de escritura del Excel
+FILAS_POR_BLOQUE_EXCEL = 10000  # Filas convertidas a la vez en modo rápido
+# Hojas escritas en procesos separados (modo rápido, requiere pyarrow) y
+# filas a partir de las que conviene hacerlo
+MAX_PROCESOS_EXCEL = int(os.getenv('MAX_PROCESOS_EXCEL') or str(os.cpu_count() or 1))
+FILAS_EXCEL_PARALELO = int(os.getenv('FILAS_EXCEL_PARALELO') or '200000')
+HOJA_EN_PARALELO = '(en paralelo)'  # Nombre de la etapa de progreso
+# Una hoja de Excel admite 1.048.576 filas, incluido el encabezado; las
+# hojas más grandes siguen en 'Hoja (2)', 'Hoja (3)', ...
+LIMITE_FILAS_HOJA = 1_048_575
+ESTILO_TABLA = "TableStyleLight9"
+FUENTE_TABLA = Font(name="Calibri", size=14)
+
+# =============================================================================
+# FUNCIONES DE PROCESAMIENTO DE DATOS
+# =============================================================================
+
+
+def notificar_progreso(progreso, etapa, **datos):
+    """Informa el avance de una etapa si se proporcionó una función de progreso."""
+    if progreso is not None:
+        progreso(etapa, **datos)
+
+
+def normalizar_encabezado(header):
+    """Normaliza encabezados eliminando espacios y convirtiendo a minúsculas."""
+    return str(header).strip().lower()
+
+
+def validar_encabezados_csv(df):
+    """Valida que el DataFrame contenga todos los encabezados requeridos."""
+    encabezados_encontrados = [
+        normalizar_encabezado(col)
+        for col in df.columns.tolist()
+    ]
+    encabezados_requeridos_norm = [
+        normalizar_encabezado(header)
+        for header in ENCABEZADOS_REQUERIDOS
+    ]
+
+    encabezados_faltantes = [
+        ENCABEZADOS_REQUERIDOS[i]
+        for i, header_norm in enumerate(
+            encabezados_requeridos_norm
+        )
+        if header_norm not in encabezados_encontrados
+    ]
+
+    return encabezados_faltantes
+
+
+def guardar_archivo_temporal(archivo, sufijo=".csv"):
+    """Copia el archivo subido a disco por bloques y devuelve su ruta."""
+    with tempfile.NamedTemporaryFile(suffix=sufijo, delete=False) as temp_file:
+        shutil.copyfileobj(archivo.stream, temp_file, length=1024 * 1024)
+        return temp_file.name
+
+
+def extraer_csvs_zip(ruta_zip):
+    """Extrae los CSV de un ZIP a archivos temporales.
+
+    Devuelve una lista de (nombre, ruta) en el orden del ZIP. Los nombres de
+    las entradas no se usan como rutas, y se rechazan los ZIP con demasiados
+    archivos o cuyo contenido descomprimido supera MAX_DESCOMPRIMIDO_ZIP.
+    """
+    with zipfile.ZipFile(ruta_zip) as zip_file:
+        entradas = [
+            entrada for entrada in zip_file.infolist()
+            if not entrada.is_dir() and entrada.filename.lower().endswith('.csv')
+            and not os.path.basename(entrada.filename).startswith('.')
+            and not entrada.filename.startswith('__MACOSX/')
+        ]
+        if len(entradas) > MAX_ARCHIVOS_LOTE:
+            raise ValueError(f"El ZIP contiene más de {MAX_ARCHIVOS_LOTE} archivos CSV")
+        if sum(entrada.file_size for entrada in entradas) > MAX_DESCOMPRIMIDO_ZIP:
+            raise ValueError("El contenido del ZIP es demasiado grande")
+
+        extraidos = []
+        try:
+            for entrada in entradas:
+                with zip_file.open(entrada) as origen, tempfile.NamedTemporaryFile(
+                        suffix=".csv", delete=False) as destino:
+                    extraidos.append((os.path.basename(entrada.filename), destino.name))
+                    shutil.copyfileobj(origen, destino, length=1024 * 1024)
+        except Exception:
+            for _, ruta in extraidos:
+                os.unlink(ruta)
+            raise
+    return extraidos
+
+
+def _encoding_por_bom(inicio):
+    """Encoding indicado por la marca de orden de bytes, si existe."""
+    for bom, encoding in BOMS:
+        if inicio.startswith(bom):
+            return encoding
+    return None
+
+
+def _es_utf8(archivo, tamaño):
+    """Valida como UTF-8 estricto varias ventanas repartidas por el archivo.
+
+    Cada ventana se decodifica con un decodificador incremental, de modo que
+    un carácter cortado al final de la ventana no se considera inválido. El
+    costo depende del tamaño de las ventanas y no del archivo.
+    """
+    ultima = max(tamaño - TAMAÑO_VENTANA_UTF8, 0)
+    desplazamientos = sorted({
+        ultima * indice // (VENTANAS_UTF8 - 1) for indice in range(VENTANAS_UTF8)
+    })
+    for desplazamiento in desplazamientos:
+        archivo.seek(desplazamiento)
+        datos = archivo.read(TAMAÑO_VENTANA_UTF8)
+        if desplazamiento:
+            # Saltar los bytes de continuación de un carácter empezado antes
+            inicio = 0
+            while inicio < min(len(datos), 3) and 0x80 <= datos[inicio] <= 0xBF:
+                inicio += 1
+            datos = datos[inicio:]
+        decodificador = codecs.getincrementaldecoder('utf-8')('strict')
+        try:
+            decodificador.decode(datos, final=desplazamiento + TAMAÑO_VENTANA_UTF8 >= tamaño)
+        except UnicodeDecodeError:
+            return False
+    return True
+
+
+def _firma_exportacion(inicio):
+    """Huella de la línea descriptiva y los encabezados sin decodificar.
+
+    Identifica el formato de exportación de cada servidor de impresión: los
+    encabezados con tildes tienen bytes distintos en cada encoding.
+    """
+    lineas = inicio.split(b'\n', 2)
+    if len(lineas) < 3:
+        return None
+    return hashlib.blake2b(b'\n'.join(lineas[:2]), digest_size=16).hexdigest()
+
+
+def _detectar_con_muestra(muestra):
+    """Detector estadístico sobre una muestra acotada de un archivo no UTF-8."""
+    if detectar_charset is not None:
+        resultado = detectar_charset(muestra).best()
+        encoding = resultado.encoding if resultado is not None else None
+    else:
+        encoding = chardet.detect(muestra)['encoding']
+
+    # Sin UTF-8 válido, ASCII o ISO-8859-1 corresponden en la práctica a las
+    # exportaciones de Windows (cp1252 agrega comillas tipográficas y el euro)
+    if not encoding:
+        return 'cp1252'
+    nombre = codecs.lookup(encoding).name
+    if nombre in ('ascii', 'iso8859-1', 'latin-1'):
+        return 'cp1252'
+    return nombre
+
+
+_cache_encodings = OrderedDict()
+_bloqueo_encodings = threading.Lock()
+
+
+def detectar_encoding(ruta_csv):
+    """Detecta el encoding del CSV en un tiempo que no depende de su tamaño.
+
+    Se revisa la marca de orden de bytes, luego se valida UTF-8 estricto en
+    ventanas acotadas y, solo si falla, se consulta la decisión ya tomada
+    para el mismo formato de exportación o el detector estadístico sobre el
+    inicio del archivo.
+    """
+    with open(ruta_csv, 'rb') as f:
+        inicio = f.read(TAMAÑO_MUESTRA_ENCODING)
+        encoding = _encoding_por_bom(inicio)
+        if encoding:
+            return encoding
+        if _es_utf8(f, os.fstat(f.fileno()).st_size):
+            return 'utf-8'
+
+    firma = _firma_exportacion(inicio)
+    with _bloqueo_encodings:
+        encoding = _cache_encodings.get(firma)
+        if encoding:
+            _cache_encodings.move_to_end(firma)
+            return encoding
+
+    encoding = _detectar_con_muestra(inicio)
+    if firma is not None:
+        with _bloqueo_encodings:
+            _cache_encodings[firma] = encoding
+            while len(_cache_encodings) > MAXIMO_CACHE_ENCODINGS:
+                _cache_encodings.popitem(last=False)
+    return encoding
+
+
+def estimar_filas_csv(ruta_csv):
+    """Estima las filas del CSV a partir del largo medio de las primeras líneas."""
+    tamaño = os.path.getsize(ruta_csv)
+    with open(ruta_csv, 'rb') as archivo:
+        muestra = archivo.read(TAMAÑO_MUESTRA_ENCODING)
+    lineas = muestra.count(b'\n')
+    if not lineas or len(muestra) == tamaño:
+        return max(lineas - 1, 0)
+    return int(tamaño / (len(muestra) / lineas))
+
+
+def leer_encabezados_csv(ruta_csv, encoding):
+    """Lee solo la fila de encabezados del CSV (sin datos)."""
+    return pd.read_csv(
+        ruta_csv,
+        encoding=encoding,
+        sep=',',
+        skiprows=1,
+        nrows=0,
+        index_col=False
+    )
+
+
+def _entero_compacto(numeros):
+    """Devuelve la serie como int32 si no tiene faltantes ni decimales y cabe en 32 bits."""
+    if (numeros.notna().all() and (numeros % 1 == 0).all() and
+            (numeros.empty or (numeros.min() >= LIMITES_INT32.min and
+                               numeros.max() <= LIMITES_INT32.max))):
+        return numeros.astype('int32')
+    return numeros
+
+
+def compactar_dataframe(df):
+    """Aplica el esquema compacto a las columnas presentes que aún no lo tienen.
+
+    Sirve para los DataFrame que no vienen de leer_csv_por_bloques, como los
+    leídos del historial. Modifica y devuelve ``df``.
+    """
+    for columna in COLUMNAS_CATEGORICAS:
+        if columna in df.columns and not isinstance(df[columna].dtype, pd.CategoricalDtype):
+            df[columna] = df[columna].astype('category')
+    for columna in COLUMNAS_ENTERAS_PROCESADAS:
+        if columna in df.columns and pd.api.types.is_numeric_dtype(df[columna].dtype):
+            df[columna] = _entero_compacto(df[columna])
+    return df
+
+
+def memoria_dataframe(df):
+    """Bytes que ocupa el DataFrame, incluidos los textos."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _convertir_bloque(bloque):
+    """Convierte un bloque del CSV a tipos compactos."""
+    for columna in COLUMNAS_ENTERAS:
+        bloque[columna] = pd.to_numeric(bloque[columna], errors='coerce')
+    return compactar_dataframe(bloque)
+
+
+def _unir_bloques(bloques):
+    """Concatena los bloques conservando las columnas categóricas."""
+    if not bloques:
+        return pd.DataFrame(columns=ENCABEZADOS_REQUERIDOS)
+
+    df = pd.concat(
+        [bloque.drop(columns=COLUMNAS_CATEGORICAS) for bloque in bloques],
+        ignore_index=True
+    )
+    for columna in COLUMNAS_CATEGORICAS:
+        df[columna] = union_categoricals(
+            [bloque[columna] for bloque in bloques]
+        )
+    return df[ENCABEZADOS_REQUERIDOS]
+
+
+def leer_csv_por_bloques(ruta_csv, encoding, columnas_archivo, progreso=None):
+    """Lee el CSV por bloques conservando solo las columnas requeridas.
+
+    Las columnas se devuelven en el orden de ENCABEZADOS_REQUERIDOS y con
+    sus nombres estándar, aunque en el archivo varíen mayúsculas o espacios.
+    """
+    columnas_por_nombre = {
+        normalizar_encabezado(columna): columna
+        for columna in columnas_archivo
+    }
+    renombrar = {
+        columnas_por_nombre[normalizar_encabezado(header)]: header
+        for header in ENCABEZADOS_REQUERIDOS
+    }
+
+    tamaño_archivo = max(os.path.getsize(ruta_csv), 1)
+
+    try:
+        # El archivo se cierra aunque el lector falle al leer el encabezado
+        with open(ruta_csv, 'rb') as archivo:
+            lector = pd.read_csv(
+                archivo,
+                encoding=encoding,
+                sep=',',
+                skiprows=1,
+                on_bad_lines='skip',
+                index_col=False,
+                usecols=list(renombrar),
+                # El lector construye las categorías sin crear los textos de cada fila
+                dtype={
+                    columna: 'category' for columna, header in renombrar.items()
+                    if header in COLUMNAS_CATEGORICAS
+                },
+                chunksize=TAMAÑO_BLOQUE_CSV
+            )
+            with lector:
+                bloques = []
+                filas = 0
+                for bloque in lector:
+                    bloques.append(_convertir_bloque(bloque.rename(columns=renombrar)))
+                    filas += len(bloque)
+                    # La posición en el archivo permite estimar el avance
+                    notificar_progreso(progreso, 'lectura', filas=filas,
+                                       fraccion=archivo.tell() / tamaño_archivo)
+    except UnicodeDecodeError:
+        if encoding == 'latin1':
+            raise
+        # La muestra no representaba todo el archivo; latin1 acepta cualquier byte
+        print(f"Encoding {encoding} inválido en el archivo, usando latin1")
+        return leer_csv_por_bloques(ruta_csv, 'latin1', columnas_archivo,
+                                    progreso)
+
+    return _unir_bloques(bloques)
+
+
+def detectar_formato_fecha(valores):
+    """Devuelve el formato de FORMATOS_FECHA que reconoce más valores, o None."""
+    mejor_formato, mejor_cantidad = None, 0
+    for formato in FORMATOS_FECHA:
+        cantidad = pd.to_datetime(valores, format=formato, errors='coerce').notna().sum()
+        if cantidad > mejor_cantidad:
+            mejor_formato, mejor_cantidad = formato, cantidad
+            if cantidad == len(valores):
+                break
+    return mejor_formato
+
+
+def _convertir_con_formato(valores, formato):
+    """Convierte textos con un formato fijo en un arreglo datetime64[s] (NaT si no coincide)."""
+    if pc is not None:
+        try:
+            fechas = pc.strptime(pa.array(valores, type=pa.string()), format=formato,
+                                 unit='s', error_is_null=True)
+            return fechas.to_numpy(zero_copy_only=False).astype('datetime64[s]')
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass  # Directiva no disponible en este sistema: se usa pandas
+    return pd.to_datetime(valores, format=formato, errors='coerce').to_numpy(
+        dtype='datetime64[s]'
+    )
+
+
+def _normalizar_am_pm(valores):
+    """Reemplaza "a. m." y "p. m." por AM y PM en los textos de fecha."""
+    if pc is not None:
+        return pd.Index(pc.replace_substring_regex(
+            pa.array(valores, type=pa.string()), pattern=PATRON_AM_PM, replacement=r' \1M'
+        ).to_pandas())
+    return valores.str.replace(AM_PM_ES, lambda m: f" {m.group(1).upper()}M", regex=True)
+
+
+def _convertir_sin_formato(valores):
+    """Convierte los valores que no coinciden con ningún formato conocido.
+
+    Primero se prueba ISO 8601 (con fracciones de segundo o zona horaria,
+    que se lleva a UTC) y luego la inferencia de pandas valor por valor. El
+    día va antes que el mes solo en los valores que no empiezan con el año.
+    """
+    fechas = np.array(pd.to_datetime(valores, format='ISO8601', errors='coerce', utc=True)
+                      .tz_convert(None), dtype='datetime64[s]')
+    empieza_con_año = np.asarray(valores.str.match(r'\d{4}\D'), dtype=bool)
+    for dia_primero in (True, False):
+        grupo = np.isnat(fechas) & (empieza_con_año != dia_primero)
+        if grupo.any():
+            fechas[grupo] = (pd.to_datetime(valores[grupo], format='mixed',
+                                            dayfirst=dia_primero, errors='coerce', utc=True)
+                             .tz_convert(None).to_numpy(dtype='datetime64[s]'))
+    return fechas
+
+
+def convertir_fechas(serie):
+    """Convierte la columna Hora en fechas y cuenta las filas sin fecha válida.
+
+    Las fechas se repiten mucho, así que solo se convierten los valores
+    distintos: primero con el formato detectado en una muestra (con pyarrow
+    si está disponible) y, los que no coinciden, como ISO 8601 o con la
+    inferencia de pandas valor por valor. Devuelve la serie de fechas y la cantidad de filas que
+    quedaron sin fecha.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie, int(serie.isna().sum())
+
+    codigos, unicos = pd.factorize(serie)
+    unicos = pd.Index(unicos.astype(str)).str.strip()
+    muestra = unicos[:MUESTRA_FECHAS]
+    if any(AM_PM_ES.search(valor) for valor in muestra):
+        unicos = _normalizar_am_pm(unicos)
+
+    # Cada formato detectado convierte lo que puede; los valores restantes
+    # (exportaciones combinadas) se vuelven a muestrear con otro formato
+    fechas_unicas = np.full(len(unicos), np.datetime64('NaT'), dtype='datetime64[s]')
+    pendientes = unicos != ''
+    while pendientes.any():
+        formato = detectar_formato_fecha(unicos[pendientes][:MUESTRA_FECHAS])
+        if formato is None:
+            break
+        posiciones = np.flatnonzero(pendientes)
+        fechas_unicas[posiciones] = _convertir_con_formato(unicos[posiciones], formato)
+        pendientes = np.isnat(fechas_unicas) & (unicos != '')
+
+    if pendientes.any():
+        fechas_unicas[pendientes] = _convertir_sin_formato(unicos[pendientes])
+
+    # El código -1 (valor vacío) toma el último elemento, NaT
+    valores = np.append(fechas_unicas, np.datetime64('NaT', 's'))[codigos]
+    fechas = pd.Series(valores, index=serie.index)
+    return fechas, int(np.isnat(valores).sum())
+
+
+def procesar_dataframe(df, progreso=None):
+    """Procesa el DataFrame agregando columnas de Mes y Año por separado,
+     columna de impresiones y eliminando columnas innecesarias.
+
+    Todas las columnas se calculan de forma vectorizada: el mes se obtiene
+    como categoría con nombres en español, el año como entero compacto y
+    las impresiones como int32 cuando no tienen decimales.
+    Las filas cuya Hora no es una fecha válida quedan sin Mes ni Año y se
+    informan a ``progreso`` (filas_sin_fecha).
+    """
+    cantidad_columnas = len(df.columns)
+    if cantidad_columnas == 0:
+        return df
+
+    # Eliminar las columnas I, J, K, L originales en una sola operación
+    df = df.drop(columns=df.columns[8:12])
+
+    # Extraer mes y año de la columna A
+    fechas, sin_fecha = convertir_fechas(df.iloc[:, 0])
+    if sin_fecha:
+        print(f"{sin_fecha} filas sin fecha válida en la columna Hora")
+        incrementar('filas_sin_fecha_total', sin_fecha)
+    notificar_progreso(progreso, 'procesamiento', filas=len(df), filas_sin_fecha=sin_fecha)
+    codigos_mes = fechas.dt.month.fillna(0).astype('int8') - 1
+    meses = pd.Categorical.from_codes(codigos_mes, categories=MESES_ES,
+                                      ordered=True)
+    años = fechas.dt.year.astype('Int16')
+
+    # Insertar "Mes" en la posición B y "Año" en la posición C
+    df.insert(1, 'Mes', meses)
+    df.insert(2, 'Año', años)
+
+    # Las columnas C y D originales (Páginas y Copias) quedan en 4 y 5
+    if cantidad_columnas >= 4:
+        columna_c = pd.to_numeric(df.iloc[:, 4], errors='coerce').fillna(0)
+        columna_d = pd.to_numeric(df.iloc[:, 5], errors='coerce').fillna(0)
+
+        # Insertar "Impresiones" (C * D) después de las 6 primeras columnas
+        df.insert(6, 'Impresiones', _entero_compacto(columna_c * columna_d))
+
+    return df
+
+
+def _codigos_categoricos(serie):
+    """Devuelve los códigos por fila y las categorías de una columna.
+
+    Las columnas categóricas reutilizan sus códigos; las demás se
+    factorizan. Los valores vacíos tienen código -1.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    codigos, categorias = pd.factorize(serie)
+    return codigos, pd.Index(categorias)
+
+
+def indices_particiones(df, filtros):
+    """Calcula las filas de cada filtro agrupando el DataFrame una sola vez.
+
+    ``filtros`` es un diccionario de configuración o FiltrosCompilados. Las
+    filas se ordenan por el código de Impresora y los códigos de todas las
+    impresoras exactas se buscan en una sola operación. Los patrones de
+    subcadena se evalúan con una expresión combinada por columna: una vez
+    sobre los valores únicos de Impresora y una vez sobre los clientes de
+    las filas que coinciden, por lo que el costo depende de la cantidad de
+    valores distintos y no de la cantidad de filtros.
+    Devuelve un diccionario nombre -> posiciones de filas en orden original.
+    """
+    filtros = compilar_filtros(filtros)
+    codigos, categorias = _codigos_categoricos(df['Impresora'])
+
+    # Posiciones de filas agrupadas por impresora (el código -1 va primero)
+    orden = np.argsort(codigos, kind='stable')
+    limites = np.concatenate(
+        ([0], np.cumsum(np.bincount(codigos + 1, minlength=len(categorias) + 1)))
+    )
+    vacio = np.empty(0, dtype=np.intp)
+
+    def filas_de(codigo):
+        return orden[limites[codigo + 1]:limites[codigo + 2]]
+
+    codigos_exactos = dict(zip(filtros.impresoras_exactas,
+                               categorias.get_indexer(filtros.impresoras_exactas)))
+    particiones = {}
+    for nombre, regla in filtros.reglas.items():
+        if regla.impresora is not None:
+            codigo = codigos_exactos[regla.impresora]
+            particiones[nombre] = filas_de(codigo) if codigo >= 0 else vacio
+
+    if filtros.subcadenas:
+        # Una pasada de la expresión combinada por valor único de Impresora
+        impresora_coincide = filtros.patrones_impresora.coincidencias(categorias)
+        filas_regla = []
+        for posicion in range(len(filtros.subcadenas)):
+            coincidentes = np.flatnonzero(impresora_coincide[:, posicion])
+            filas_regla.append(np.sort(np.concatenate([filas_de(c) for c in coincidentes]))
+                               if len(coincidentes) else vacio)
+
+        # Los clientes se evalúan una vez, solo los de las filas que coinciden;
+        # la última fila (False) corresponde a los clientes vacíos (-1)
+        codigos_cliente, categorias_cliente = _codigos_categoricos(df['Cliente'])
+        clientes_filas = [codigos_cliente[indices] for indices in filas_regla]
+        presentes = np.unique(np.concatenate(clientes_filas))
+        presentes = presentes[presentes >= 0]
+        cliente_coincide = np.zeros((len(categorias_cliente) + 1, len(filtros.subcadenas)),
+                                    dtype=bool)
+        cliente_coincide[presentes] = filtros.patrones_cliente.coincidencias(
+            categorias_cliente[presentes])
+
+        for posicion, nombre in enumerate(filtros.subcadenas):
+            particiones[nombre] = filas_regla[posicion][
+                cliente_coincide[clientes_filas[posicion], posicion]]
+
+    # Mismo orden que la configuración
+    return {nombre: particiones[nombre] for nombre in filtros.reglas}
+
+
+def particionar_dataframe(df, filtros):
+    """Aplica todos los filtros en una sola pasada y devuelve un DataFrame por filtro."""
+    return {
+        nombre: df.iloc[indices]
+        for nombre, indices in indices_particiones(df, filtros).items()
+    }
+
+
+def filtrar_dataframe(df, config):
+    """Filtra el DataFrame según la configuración proporcionada."""
+    return particionar_dataframe(df, {'filtro': config})['filtro']
+
+# =============================================================================
+# FUNCIONES DE EXCEL
+# =============================================================================
+
+
+def _nombre_continuacion(nombre_hoja, numero):
+    """Nombre de la hoja ``numero`` de una hoja dividida, recortado al largo de Excel."""
+    sufijo = f" ({numero})"
+    return nombre_hoja[:LARGO_MAXIMO_HOJA - len(sufijo)] + sufijo
+
+
+def hojas_reporte(df, filtros):
+    """Hojas del reporte detallado como (nombre, tabla, filas).
+
+    ``filas`` es None para todo el DataFrame o las posiciones de las filas
+    de la hoja. Las hojas con más de LIMITE_FILAS_HOJA filas se dividen en
+    hojas de continuación, cada una con su propia tabla.
+    """
+    hojas = [('GENERAL', TABLA_GENERAL, None)] + [
+        (nombre_hoja, nombre_tabla(nombre_hoja), filas)
+        for nombre_hoja, filas in indices_particiones(df, filtros).items()
+    ]
+    if len(df) <= LIMITE_FILAS_HOJA:
+        return hojas
+
+    nombres_usados = {nombre.upper() for nombre, _, _ in hojas}
+    tablas_usadas = {tabla.upper() for _, tabla, _ in hojas}
+    divididas = []
+    for nombre_hoja, tabla, filas in hojas:
+        total = len(df) if filas is None else len(filas)
+        if total <= LIMITE_FILAS_HOJA:
+            divididas.append((nombre_hoja, tabla, filas))
+            continue
+        for numero, inicio in enumerate(range(0, total, LIMITE_FILAS_HOJA), start=1):
+            fin = min(inicio + LIMITE_FILAS_HOJA, total)
+            parte = np.arange(inicio, fin) if filas is None else filas[inicio:fin]
+            if numero == 1:
+                divididas.append((nombre_hoja, tabla, parte))
+                continue
+            nombre_parte = _nombre_continuacion(nombre_hoja, numero)
+            tabla_parte = nombre_tabla(nombre_parte)
+            if nombre_parte.upper() in nombres_usados or tabla_parte.upper() in tablas_usadas:
+                raise ValueError(f"La hoja '{nombre_hoja}' supera {LIMITE_FILAS_HOJA:,} filas "
+                                 f"y su continuación '{nombre_parte}' ya existe")
+            nombres_usados.add(nombre_parte.upper())
+            tablas_usadas.add(tabla_parte.upper())
+            divididas.append((nombre_parte, tabla_parte, parte))
+    return divididas
+
+
+def ajustar_ancho_columnas(sheet):
+    """Ajusta automáticamente el ancho de las columnas en una hoja de Excel."""
+    for column in sheet.columns:
+        max_length = 0
+        column_letter = column[0].column_letter
+
+        for cell in column:
+            try:
+                if cell.value:
+                    length = len(str(cell.value))
+                    max_length = max(max_length, length)
+            except (TypeError, AttributeError):
+                pass
+
+        adjusted_width = max_length + 2
+        sheet.column_dimensions[column_letter].width = adjusted_width
+
+
+def convertir_a_tabla(sheet, dataframe, nombre_tabla):
+    """Convierte un rango de datos en una tabla de Excel con formato."""
+    if dataframe.shape[0] == 0:
+        return None
+
+    max_row = dataframe.shape[0] + 1
+    max_col = dataframe.shape[1]
+
+    # Calcular la letra de la columna final
+    if max_col <= 26:
+        end_col = chr(64 + max_col)
+    else:
+        end_col = (chr(64 + (max_col - 1) // 26) +
+                   chr(65 + (max_col - 1) % 26))
+
+    rango_tabla = f"A1:{end_col}{max_row}"
+
+    # Crear tabla con estilo
+    tabla = Table(displayName=nombre_tabla, ref=rango_tabla)
+    style = TableStyleInfo(
+        name="TableStyleLight9",
+        showFirstColumn=False,
+        showLastColumn=False,
+        showRowStripes=True,
+        showColumnStripes=False
+    )
+    tabla.tableStyleInfo = style
+    sheet.add_table(tabla)
+
+    # Aplicar fuente Calibri 14
+    for row in range(1, max_row + 1):
+        for col in range(1, max_col + 1):
+            cell = sheet.cell(row=row, column=col)
+            cell.font = Font(name="Calibri", size=14)
+
+    # Autoajustar columnas
+    ajustar_ancho_columnas(sheet)
+
+    # Autoajustar altura de filas
+    for row in sheet.iter_rows():
+        sheet.row_dimensions[row[0].row].height = None
+
+    return True
+
+
+def calcular_anchos_columnas(df):
+    """Calcula el ancho de cada columna a partir del DataFrame, sin recorrer celdas."""
+    anchos = []
+    for columna in df.columns:
+        serie = df[columna].dropna()
+        max_length = len(str(columna))
+
+        if not serie.empty:
+            if pd.api.types.is_integer_dtype(serie.dtype):
+                # Para enteros basta con los extremos
+                longitud = max(len(str(serie.min())), len(str(serie.max())))
+            else:
+                if isinstance(serie.dtype, pd.CategoricalDtype):
+                    # Solo las categorías presentes, no cada fila
+                    serie = pd.Series(serie.unique())
+                longitud = serie.astype(str).str.len().max()
+            max_length = max(max_length, int(longitud))
+
+        anchos.append(max_length + 2)
+    return anchos
+
+
+def _filas_dataframe(df):
+    """Genera las filas del DataFrame como tuplas, con None en lugar de NaN."""
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE_EXCEL):
+        bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE_EXCEL].astype(object)
+        bloque = bloque.where(bloque.notna(), None)
+        yield from bloque.itertuples(index=False, name=None)
+
+
+def escribir_hoja_tabla(workbook, df, nombre_hoja, nombre_tabla, al_avanzar=None):
+    """Escribe el DataFrame como tabla con formato en un libro de solo escritura.
+
+    Cada columna reutiliza una única celda con el estilo compartido, que
+    el escritor de openpyxl serializa de inmediato al agregar la fila.
+    Si se indica ``al_avanzar``, se llama con las filas escritas cada
+    FILAS_POR_BLOQUE_EXCEL filas.
+    """
+    sheet = workbook.create_sheet(nombre_hoja)
+
+    # El ancho de columnas debe definirse antes de escribir filas
+    for indice, ancho in enumerate(calcular_anchos_columnas(df), start=1):
+        sheet.column_dimensions[get_column_letter(indice)].width = ancho
+
+    celdas = [WriteOnlyCell(sheet) for _ in df.columns]
+    for celda in celdas:
+        celda.font = FUENTE_TABLA
+
+    def agregar_fila(valores):
+        """Agrega una fila reutilizando las celdas con estilo."""
+        for celda, valor in zip(celdas, valores):
+            celda.value = valor
+        sheet.append(celdas)
+
+    agregar_fila([str(columna) for columna in df.columns])
+    for numero, fila in enumerate(_filas_dataframe(df), start=1):
+        agregar_fila(fila)
+        if al_avanzar is not None and numero % FILAS_POR_BLOQUE_EXCEL == 0:
+            al_avanzar(numero)
+
+    _agregar_tabla(sheet, df.columns, len(df), nombre_tabla)
+    return sheet
+
+
+def _agregar_tabla(sheet, columnas, total_filas, nombre_tabla):
+    """Declara la tabla con formato de una hoja de solo escritura."""
+    # Una tabla necesita al menos una fila de datos
+    if total_filas > 0:
+        rango_tabla = (f"A1:{get_column_letter(len(columnas))}"
+                       f"{total_filas + 1}")
+        tabla = Table(displayName=nombre_tabla, ref=rango_tabla)
+        # Sin acceso a las celdas escritas, las columnas se declaran aquí
+        tabla.tableColumns = [
+            TableColumn(id=indice, name=str(columna))
+            for indice, columna in enumerate(columnas, start=1)
+        ]
+        tabla.autoFilter = AutoFilter(ref=rango_tabla)
+        tabla.tableStyleInfo = TableStyleInfo(
+            name=ESTILO_TABLA,
+            showFirstColumn=False,
+            showLastColumn=False,
+            showRowStripes=True,
+            showColumnStripes=False
+        )
+        # openpyxl avisa siempre en modo solo escritura, aunque ya estén
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            sheet.add_table(tabla)
+
+
+def generar_excel_completo(df, progreso=None, destino=None):
+    """Genera el Excel con pandas y openpyxl en modo normal (recorre las celdas).
+
+    ``destino`` es como en generar_excel_rapido.
+    """
+    if destino is None:
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as temp_file:
+            destino = temp_file.name
+
+    # Hoja general y hojas filtradas, particionadas en una sola pasada; cada
+    # una se materializa solo mientras se escribe y se le da formato
+    hojas = hojas_reporte(df, obtener_filtros())
+
+    # Crear archivo Excel básico con pandas
+    with pd.ExcelWriter(destino, engine='openpyxl') as writer:
+        workbook = writer.book
+        for indice, (nombre_hoja, tabla, filas) in enumerate(hojas):
+            df_hoja = df if filas is None else df.iloc[filas]
+            notificar_progreso(progreso, 'hoja', hoja=nombre_hoja, indice=indice,
+                               total=len(hojas), filas=0, filas_hoja=len(df_hoja))
+            df_hoja.to_excel(writer, index=False, sheet_name=nombre_hoja)
+            convertir_a_tabla(workbook[nombre_hoja], df_hoja, tabla)
+            del df_hoja
+
+        # Tabla dinámica nativa calculada con pandas (sin Excel)
+        notificar_progreso(progreso, 'tabla_dinamica')
+        crear_tabla_dinamica_nativa(workbook, df)
+
+        notificar_progreso(progreso, 'guardado')
+
+    # Si está habilitada, el servicio de Excel reemplaza la tabla nativa (la
+    # de Excel usa la hoja GENERAL, que no puede estar dividida)
+    if (PIVOTE_EXCEL_DISPONIBLE and len(df) <= LIMITE_FILAS_HOJA and
+            isinstance(destino, (str, os.PathLike))):
+        notificar_progreso(progreso, 'tabla_dinamica')
+        notificar_progreso(progreso, 'tabla_dinamica',
+                           pivote_excel=crear_tabla_dinamica_excel(destino))
+
+    return destino
+
+
+def _escribir_hoja_con_progreso(workbook, df, nombre_hoja, nombre_tabla,
+                                indice, total_hojas, progreso):
+    """Escribe una hoja informando las filas escritas."""
+    def al_avanzar(filas):
+        notificar_progreso(progreso, 'hoja', hoja=nombre_hoja, indice=indice,
+                           total=total_hojas, filas=filas, filas_hoja=len(df))
+
+    al_avanzar(0)
+    escribir_hoja_tabla(workbook, df, nombre_hoja, nombre_tabla, al_avanzar)
+
+
+def _generar_libro_secuencial(df, hojas, progreso, destino):
+    """Escribe todas las hojas en un solo libro de solo escritura."""
+    workbook = Workbook(write_only=True)
+    for indice, (nombre_hoja, tabla, filas) in enumerate(hojas):
+        _escribir_hoja_con_progreso(workbook, df if filas is None else df.iloc[filas],
+                                    nombre_hoja, tabla, indice, len(hojas), progreso)
+
+    # Tabla dinámica nativa calculada con pandas (sin Excel)
+    notificar_progreso(progreso, 'tabla_dinamica')
+    crear_tabla_dinamica_nativa(workbook, df)
+
+    notificar_progreso(progreso, 'guardado')
+    workbook.save(destino)
+
+
+def _escribir_hoja_aparte(ruta_datos, filas, nombre_hoja, tabla, ruta_salida):
+    """Escribe una hoja en un libro propio, dentro de un proceso separado.
+
+    El DataFrame se lee del archivo Arrow con memoria mapeada en lugar de
+    recibir una copia serializada. Devuelve los estilos de celda del libro
+    para comprobar que coinciden con los del libro final.
+    """
+    datos = feather.read_table(ruta_datos, memory_map=True)
+    if filas is not None:
+        datos = datos.take(filas)
+    workbook = Workbook(write_only=True)
+    escribir_hoja_tabla(workbook, datos.to_pandas(), nombre_hoja, tabla)
+    workbook.save(ruta_salida)
+    return list(workbook._cell_styles)  # pylint: disable=protected-access
+
+
+def _reservar_hoja(workbook, columnas, total_filas, nombre_hoja, tabla):
+    """Crea una hoja provisional con el estilo y la tabla de la hoja definitiva.
+
+    El encabezado registra el estilo de celda de las tablas en el mismo
+    orden que en los libros de cada hoja, y la tabla queda declarada con su
+    rango final; al ensamblar solo se reemplaza el XML de la hoja.
+    """
+    sheet = workbook.create_sheet(nombre_hoja)
+    celda = WriteOnlyCell(sheet, value=str(columnas[0]))
+    celda.font = FUENTE_TABLA
+    sheet.append([celda])
+    _agregar_tabla(sheet, columnas, total_filas, tabla)
+
+
+def _ensamblar_libro(ruta_esqueleto, partes, destino):
+    """Copia el libro esqueleto reemplazando el XML de las hojas escritas aparte.
+
+    ``partes`` relaciona la ruta de cada hoja dentro del esqueleto con el
+    libro de una sola hoja que la contiene.
+    """
+    with zipfile.ZipFile(ruta_esqueleto) as esqueleto, \
+            zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as libro:
+        for info in esqueleto.infolist():
+            if info.filename not in partes:
+                libro.writestr(info, esqueleto.read(info.filename))
+                continue
+            with zipfile.ZipFile(partes[info.filename]) as parte, \
+                    parte.open('xl/worksheets/sheet1.xml') as origen, \
+                    libro.open(info.filename, 'w', force_zip64=True) as copia:
+                shutil.copyfileobj(origen, copia, 1024 * 1024)
+
+
+def _generar_libro_paralelo(df, hojas, max_procesos, progreso, destino):
+    """Escribe cada hoja en un proceso separado y ensambla el libro final.
+
+    Los procesos leen el DataFrame de un archivo Arrow sin comprimir con
+    memoria mapeada. Mientras tanto, este proceso arma un libro esqueleto
+    con las hojas provisionales y la tabla dinámica; al final se copia el
+    esqueleto reemplazando el XML de cada hoja por el escrito aparte.
+    """
+    directorio = tempfile.mkdtemp(prefix='reporte_')
+    try:
+        ruta_datos = os.path.join(directorio, 'datos.arrow')
+        feather.write_feather(df, ruta_datos, compression='uncompressed')
+
+        filas_por_hoja = [len(df) if filas is None else len(filas)
+                          for _, _, filas in hojas]
+        total_filas = sum(filas_por_hoja)
+        notificar_progreso(progreso, 'hoja', hoja=HOJA_EN_PARALELO, indice=0, total=1,
+                           filas=0, filas_hoja=total_filas)
+
+        with ProcessPoolExecutor(max_workers=max_procesos) as executor:
+            # Las hojas más grandes primero para repartir mejor la carga
+            futuros = {}
+            for posicion in sorted(range(len(hojas)), key=lambda p: -filas_por_hoja[p]):
+                nombre_hoja, tabla, filas = hojas[posicion]
+                ruta_parte = os.path.join(directorio, f"hoja{posicion}.xlsx")
+                futuro = executor.submit(_escribir_hoja_aparte, ruta_datos, filas,
+                                         nombre_hoja, tabla, ruta_parte)
+                futuros[futuro] = (posicion, ruta_parte)
+
+            esqueleto = Workbook(write_only=True)
+            for (nombre_hoja, tabla, _), filas in zip(hojas, filas_por_hoja):
+                _reservar_hoja(esqueleto, df.columns, filas, nombre_hoja, tabla)
+            crear_tabla_dinamica_nativa(esqueleto, df)
+            ruta_esqueleto = os.path.join(directorio, 'esqueleto.xlsx')
+            esqueleto.save(ruta_esqueleto)
+            estilos_esqueleto = list(esqueleto._cell_styles)  # pylint: disable=protected-access
+
+            # Los libros de hoja se escriben con openpyxl, que numera las hojas
+            # desde sheet1.xml en el orden en que se crean
+            partes = {}
+            escritas = 0
+            for futuro in as_completed(futuros):
+                posicion, ruta_parte = futuros[futuro]
+                estilos = futuro.result()
+                if estilos != estilos_esqueleto[:len(estilos)]:
+                    raise ValueError(f"La hoja {hojas[posicion][0]} usa estilos "
+                                     "distintos a los del libro final")
+                partes[f"xl/worksheets/sheet{posicion + 1}.xml"] = ruta_parte
+                escritas += filas_por_hoja[posicion]
+                notificar_progreso(progreso, 'hoja', hoja=HOJA_EN_PARALELO, indice=0,
+                                   total=1, filas=escritas, filas_hoja=total_filas)
+
+        notificar_progreso(progreso, 'guardado')
+        _ensamblar_libro(ruta_esqueleto, partes, destino)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def generar_excel_rapido(df, progreso=None, destino=None, max_procesos=None):
+    """Genera el Excel con openpyxl en modo de solo escritura (memoria constante).
+
+    ``destino`` puede ser una ruta o un archivo en memoria; sin él se crea un
+    archivo temporal. La tabla dinámica con Excel solo se aplica a rutas.
+    Con al menos FILAS_EXCEL_PARALELO filas y pyarrow instalado, las hojas
+    se escriben en hasta ``max_procesos`` procesos (MAX_PROCESOS_EXCEL).
+    Las hojas de más de LIMITE_FILAS_HOJA filas siguen en hojas de
+    continuación (hojas_reporte).
+    """
+    if destino is None:
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as temp_file:
+            destino = temp_file.name
+    # La tabla de Excel usa la hoja GENERAL, que no puede estar dividida
+    usar_excel_pivote = (PIVOTE_EXCEL_DISPONIBLE and len(df) <= LIMITE_FILAS_HOJA and
+                         isinstance(destino, (str, os.PathLike)))
+
+    # Hoja general y hojas filtradas: las filas de cada filtro se calculan en
+    # una sola pasada y cada hoja se materializa solo al escribirla
+    hojas = hojas_reporte(df, obtener_filtros())
+
+    max_procesos = min(len(hojas), max_procesos or MAX_PROCESOS_EXCEL)
+    if feather is not None and max_procesos > 1 and len(df) >= FILAS_EXCEL_PARALELO:
+        try:
+            _generar_libro_paralelo(df, hojas, max_procesos, progreso, destino)
+        except (OSError, ValueError, BrokenProcessPool) as e:
+            print(f"Error al generar las hojas en paralelo, se generan en secuencia: {e}")
+            if not isinstance(destino, (str, os.PathLike)):
+                destino.seek(0)
+                destino.truncate()
+            _generar_libro_secuencial(df, hojas, progreso, destino)
+    else:
+        _generar_libro_secuencial(df, hojas, progreso, destino)
+
+    # Si está habilitada, el servicio de Excel reemplaza la tabla nativa
+    if usar_excel_pivote:
+        notificar_progreso(progreso, 'tabla_dinamica')
+        notificar_progreso(progreso, 'tabla_dinamica',
+                           pivote_excel=crear_tabla_dinamica_excel(destino))
+
+    return destino
+
+
+def generar_excel(df, progreso=None, destino=None, max_procesos=None):
+    """Genera el archivo Excel completo con todas las hojas y formatos.
+
+    Devuelve la ruta del archivo generado, o ``destino`` si se indicó uno.
+    ``max_procesos`` limita los procesos que escriben las hojas en modo
+    rápido.
+    """
+    if MODO_EXCEL == 'completo':
+        return generar_excel_completo(df, progreso, destino)
+    return generar_excel_rapido(df, progreso, destino, max_procesos)
+
+
+def _escribir_libro_resumen(resumenes, df, progreso, destino):
+    """Escribe las hojas de resumen y la tabla dinámica calculada sobre ``df``."""
+    if destino is None:
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as temp_file:
+            destino = temp_file.name
+
+    workbook = Workbook(write_only=True)
+    for indice, (nombre_hoja, resumen) in enumerate(resumenes.items()):
+        _escribir_hoja_con_progreso(workbook, resumen, nombre_hoja,
+                                    nombre_tabla(nombre_hoja), indice,
+                                    len(resumenes), progreso)
+
+    notificar_progreso(progreso, 'tabla_dinamica')
+    crear_tabla_dinamica_nativa(workbook, df)
+
+    notificar_progreso(progreso, 'guardado')
+    workbook.save(destino)
+    return destino
+
+
+def generar_excel_resumen(df, es_duplex, progreso=None, destino=None):
+    """Genera un Excel con los resúmenes agregados y la tabla dinámica.
+
+    No incluye las filas del CSV, así que el libro es pequeño en cualquier
+    modo de Excel. ``destino`` funciona igual que en generar_excel_rapido.
+    """
+    notificar_progreso(progreso, 'resumen', filas=len(df))
+    return _escribir_libro_resumen(calcular_resumenes(df, es_duplex), df, progreso, destino)
+
+
+def generar_excel_resumen_cubo(cubo, progreso=None, destino=None):
+    """Genera el Excel de generar_excel_resumen a partir de los cubos del historial.
+
+    La tabla dinámica suma las impresiones ya agregadas de los cubos, con el
+    mismo resultado que sobre los registros.
+    """
+    notificar_progreso(progreso, 'resumen', filas=len(cubo))
+    return _escribir_libro_resumen(calcular_resumenes_cubo(cubo), cubo, progreso, destino)
+
+
+def leer_csvs(archivos, progreso=None, max_procesos=None):
+    """Lee uno o varios CSV ya validados y los une en un solo DataFrame.
+
+    ``archivos`` es una lista de (ruta, encoding, columnas del archivo). Con
+    más de un archivo, cada uno se lee en un proceso separado (hasta
+    ``max_procesos``) y las columnas categóricas se unen al final.
+    """
+    if len(archivos) == 1:
+        return leer_csv_por_bloques(*archivos[0], progreso)
+
+    max_procesos = min(len(archivos), max_procesos or MAX_PROCESOS_LECTURA)
+    executor = ProcessPoolExecutor(max_workers=max_procesos) if max_procesos > 1 else None
+    try:
+        if executor is not None:
+            futuros = [executor.submit(leer_csv_por_bloques, ruta, encoding, list(columnas))
+                       for ruta, encoding, columnas in archivos]
+            resultados = (futuro.result() for futuro in futuros)
+        else:
+            resultados = (leer_csv_por_bloques(ruta, encoding, columnas)
+                          for ruta, encoding, columnas in archivos)
+
+        notificar_progreso(progreso, 'lectura', filas=0, fraccion=0)
+        marcos = []
+        for leidos, marco in enumerate(resultados, start=1):
+            marcos.append(marco)
+            notificar_progreso(progreso, 'lectura',
+                               filas=sum(len(m) for m in marcos),
+                               fraccion=leidos / len(archivos))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return _unir_bloques(marcos)
+
+
+def _leer_y_procesar(archivos, progreso, max_procesos, al_procesar, con_duplex):
+    """Lee y procesa los CSV; devuelve el DataFrame y, si se pide, si cada fila es dúplex."""
+    df = leer_csvs(archivos, progreso, max_procesos)
+    notificar_progreso(progreso, 'lectura', filas=len(df), fraccion=1,
+                       memoria_datos=memoria_dataframe(df))
+    notificar_progreso(progreso, 'procesamiento', filas=len(df))
+    # procesar_dataframe descarta Frente/reverso, que el resumen y el historial necesitan
+    es_duplex = (marcar_valor(df['Frente/reverso'], VALOR_DUPLEX)
+                 if con_duplex or al_procesar is not None else None)
+    df = procesar_dataframe(df, progreso)
+    notificar_progreso(progreso, 'procesamiento', filas=len(df),
+                       memoria_datos=memoria_dataframe(df))
+    if al_procesar is not None:
+        notificar_progreso(progreso, 'historial', filas=len(df))
+        al_procesar(df, es_duplex)
+    return df, es_duplex
+
+
+def leer_y_procesar_csvs(archivos, progreso=None, max_procesos=None, al_procesar=None):
+    """Lee uno o varios CSV ya validados y devuelve el DataFrame procesado.
+
+    Es el contenido de la hoja GENERAL, sin generar el Excel. ``al_procesar``
+    es el de generar_reporte.
+    """
+    df, _ = _leer_y_procesar(archivos, progreso, max_procesos, al_procesar, False)
+    return df
+
+
+def generar_reporte_combinado(archivos, progreso=None, al_procesar=None,
+                              destino=None, max_procesos=None,
+                              tipo=TIPO_REPORTE_DETALLADO):
+    """Genera un solo reporte a partir de uno o varios CSV ya validados.
+
+    ``archivos`` es una lista de (ruta, encoding, columnas del archivo) y
+    ``max_procesos`` limita la lectura y la escritura de hojas en paralelo;
+    el resto de los parámetros son los de generar_reporte.
+    """
+    df, es_duplex = _leer_y_procesar(archivos, progreso, max_procesos, al_procesar,
+                                     tipo == TIPO_REPORTE_RESUMEN)
+    if tipo == TIPO_REPORTE_RESUMEN:
+        return generar_excel_resumen(df, es_duplex, progreso, destino)
+    return generar_excel(df, progreso, destino, max_procesos)
+
+
+def generar_reporte(ruta_csv, encoding, columnas_archivo, progreso=None,
+                    al_procesar=None, destino=None, tipo=TIPO_REPORTE_DETALLADO):
+    """Ejecuta el flujo completo sobre un CSV ya validado y devuelve la ruta del Excel.
+
+    ``progreso`` recibe el nombre de cada etapa y sus datos de avance
+    (filas, fracción, hoja) a medida que el flujo avanza. ``al_procesar``
+    recibe el DataFrame ya normalizado y un arreglo que indica si cada fila
+    es dúplex, antes de generar el Excel (por ejemplo, para agregarlo al
+    historial). ``destino`` se pasa a generar_excel.
+    ``tipo`` es uno de TIPOS_REPORTE.
+    """
+    return generar_reporte_combinado([(ruta_csv, encoding, columnas_archivo)],
+                                     progreso, al_procesar, destino, tipo=tipo)
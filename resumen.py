@@ -0,0 +1,119 @@
+"""
+Resúmenes agregados del reporte de impresiones.
+
+Calculan con agrupaciones vectorizadas de pandas los totales por impresora,
+por usuario y por mes (trabajos, páginas, impresiones en escala de grises y
+a color, y proporción de impresiones dúplex), sin escribir las filas
+individuales del CSV. Los mismos resúmenes se obtienen de los cubos
+mensuales del historial, que ya tienen las medidas sumadas.
+"""
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# CONFIGURACIÓN DE LOS RESÚMENES
+# =============================================================================
+
+# Hojas del reporte resumido: nombre -> columnas de agrupación
+AGRUPACIONES_RESUMEN = {
+    'RESUMEN IMPRESORAS': ['Impresora'],
+    'RESUMEN USUARIOS': ['Usuario'],
+    'RESUMEN MENSUAL': ['Año', 'Mes'],
+}
+
+# Valores del CSV que identifican impresiones en grises y dúplex
+VALOR_GRISES = 'GRAYSCALE'
+VALOR_DUPLEX = 'DUPLEX'
+
+COLUMNAS_TOTALES = ['Trabajos', 'Páginas', 'Impresiones', 'Impresiones B/N',
+                    'Impresiones color', 'Impresiones dúplex']
+
+# =============================================================================
+# CÁLCULO DE LOS RESÚMENES
+# =============================================================================
+
+
+def marcar_valor(serie, valor):
+    """Devuelve un arreglo booleano con las filas iguales a ``valor``.
+
+    La comparación (sin mayúsculas ni espacios) se hace una vez por valor
+    distinto de la columna y se expande con sus códigos categóricos.
+    """
+    categorica = serie.astype('category')
+    coincide = (categorica.cat.categories.astype(str).str.strip().str.upper() ==
+                valor)
+    # El código -1 (valor vacío) toma el último elemento, que nunca coincide
+    return np.append(coincide, False)[categorica.cat.codes.to_numpy()]
+
+
+def _totales(df, trabajos, es_duplex):
+    """Columnas numéricas a sumar en cada resumen, una fila por fila de ``df``."""
+    impresiones = pd.to_numeric(df['Impresiones'], errors='coerce').fillna(0).to_numpy()
+    es_grises = marcar_valor(df['Escala de grises'], VALOR_GRISES)
+    return pd.DataFrame({
+        'Trabajos': trabajos,
+        'Páginas': pd.to_numeric(df['Páginas'], errors='coerce').fillna(0).to_numpy(),
+        'Impresiones': impresiones,
+        'Impresiones B/N': np.where(es_grises, impresiones, 0),
+        'Impresiones color': np.where(es_grises, 0, impresiones),
+        'Impresiones dúplex': np.where(es_duplex, impresiones, 0),
+    }, index=df.index)
+
+
+def calcular_totales(df, es_duplex):
+    """Columnas numéricas a sumar en cada resumen, una fila por registro."""
+    return _totales(df, np.ones(len(df), dtype='int64'), es_duplex)
+
+
+def calcular_totales_cubo(cubo):
+    """Columnas numéricas a sumar en cada resumen a partir de un cubo mensual."""
+    return _totales(cubo, cubo['Trabajos'].to_numpy(), cubo['Dúplex'].to_numpy(dtype=bool))
+
+
+def _porcentaje(parte, total):
+    """Porcentaje con un decimal (0 si el total es cero)."""
+    return (parte / total.where(total != 0) * 100).round(1).fillna(0)
+
+
+def resumir(df, totales, columnas):
+    """Agrupa los totales por ``columnas`` y agrega los porcentajes."""
+    resumen = totales.groupby([df[columna] for columna in columnas],
+                              observed=True, dropna=False, sort=True).sum()
+    resumen['% Color'] = _porcentaje(resumen['Impresiones color'],
+                                     resumen['Impresiones'])
+    resumen['% Dúplex'] = _porcentaje(resumen.pop('Impresiones dúplex'),
+                                      resumen['Impresiones'])
+    resumen = resumen.reset_index()
+
+    # Igual que en la tabla dinámica, los valores faltantes se muestran en blanco
+    for columna in columnas:
+        resumen[columna] = resumen[columna].astype(object).where(
+            resumen[columna].notna(), '(en blanco)'
+        )
+    if columnas != ['Año', 'Mes']:
+        resumen = resumen.sort_values('Impresiones', ascending=False,
+                                      kind='stable', ignore_index=True)
+    return resumen
+
+
+def calcular_resumenes(df, es_duplex):
+    """Calcula las hojas del reporte resumido.
+
+    ``es_duplex`` indica por fila si el trabajo se imprimió a doble cara
+    (procesar_dataframe descarta la columna Frente/reverso). Devuelve un
+    diccionario nombre de hoja -> DataFrame.
+    """
+    totales = calcular_totales(df, es_duplex)
+    return {
+        nombre: resumir(df, totales, columnas)
+        for nombre, columnas in AGRUPACIONES_RESUMEN.items()
+    }
+
+
+def calcular_resumenes_cubo(cubo):
+    """Calcula las hojas del reporte resumido a partir de los cubos mensuales."""
+    totales = calcular_totales_cubo(cubo)
+    return {
+        nombre: resumir(cubo, totales, columnas)
+        for nombre, columnas in AGRUPACIONES_RESUMEN.items()
+    }
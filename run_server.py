@@ -12,7 +12,8 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Importar la aplicación
 try:
-    from app import app
+    from app import MAX_SUBIDA_BYTES, app
+    from admision import HILOS_SERVIDOR
 except ImportError as e:
     print(f"Error: No se pudo importar la aplicación Flask: {e}")
     print("Asegúrate de que el archivo 'app.py' esté en el mismo directorio.")
@@ -42,8 +43,9 @@ def main():
             app,
             host=HOST,
             port=PORT,
-            threads=4,
+            threads=HILOS_SERVIDOR,
             connection_limit=100,
+            max_request_body_size=MAX_SUBIDA_BYTES,
             cleanup_interval=30,
             channel_timeout=120
         )
@@ -8,8 +8,9 @@
 
 const CONFIG = {
     MAX_FILE_SIZE: 16 * 1024 * 1024, // 16MB
-    SAFETY_TIMEOUT: 30000, // 30 segundos
-    PROGRESS_INTERVAL: 300,
+    SAFETY_TIMEOUT: 120000, // 2 minutos para subir el archivo
+    MAX_JOB_WAIT: 30 * 60 * 1000, // 30 minutos de espera máxima del trabajo
+    POLL_INTERVAL: 1000,
     AUTO_DISMISS_DELAYS: {
         success: 5000,
         info: 5000,
@@ -23,7 +24,7 @@ const CONFIG = {
 // ===================================================================
 
 let elements = {};
-let progressInterval = null;
+let pollTimeout = null;
 let safetyTimeout = null;
 let formSubmitted = false;
 let abortController = null;
@@ -180,23 +181,28 @@ const preventGlobalDragDrop = (e) => e.preventDefault();
 // 5. VALIDACIÓN DE ARCHIVOS
 // ===================================================================
 
-const validateCSVFile = (file) => {
+const totalFileSize = (files) => Array.from(files).reduce((total, file) => total + file.size, 0);
+
+// Valida uno o varios archivos CSV (o ZIP con CSV) que se combinan en un reporte
+const validateCSVFiles = (files) => {
     // Limpiar mensajes de error previos
     flashManager.clearByType('danger');
     
-    if (!file.name.toLowerCase().endsWith('.csv')) {
-        showMessage('Por favor selecciona un archivo CSV válido (.csv)', 'danger');
+    const invalidFile = Array.from(files).find(file => !/\.(csv|zip)$/i.test(file.name));
+    if (invalidFile) {
+        showMessage(`"${invalidFile.name}" no es un archivo CSV (.csv) o ZIP (.zip) válido`, 'danger');
         return false;
     }
     
-    if (file.size > CONFIG.MAX_FILE_SIZE) {
+    if (totalFileSize(files) > CONFIG.MAX_FILE_SIZE) {
         const maxSizeMB = CONFIG.MAX_FILE_SIZE / (1024 * 1024);
-        showMessage(`El archivo es demasiado grande. Tamaño máximo permitido: ${maxSizeMB}MB`, 'danger');
+        showMessage(`Los archivos son demasiado grandes. Tamaño máximo permitido: ${maxSizeMB}MB`, 'danger');
         return false;
     }
     
-    if (file.size === 0) {
-        showMessage('El archivo está vacío. Por favor selecciona un archivo válido.', 'danger');
+    const emptyFile = Array.from(files).find(file => file.size === 0);
+    if (emptyFile) {
+        showMessage(`El archivo "${emptyFile.name}" está vacío. Por favor selecciona un archivo válido.`, 'danger');
         return false;
     }
     
@@ -207,9 +213,11 @@ const validateCSVFile = (file) => {
 // 6. GESTIÓN DE INFORMACIÓN DEL ARCHIVO
 // ===================================================================
 
-const showFileInfo = (file) => {
-    elements.fileName.textContent = file.name;
-    elements.fileSize.textContent = formatFileSize(file.size);
+const showFileInfo = (files) => {
+    elements.fileName.textContent = files.length === 1
+        ? files[0].name
+        : `${files.length} archivos: ${Array.from(files).map(file => file.name).join(', ')}`;
+    elements.fileSize.textContent = formatFileSize(totalFileSize(files));
     elements.fileInfo.classList.remove('d-none');
     elements.dropZone.style.display = 'none';
 };
@@ -262,9 +270,9 @@ const hideLoadingState = () => {
 // ===================================================================
 
 const clearProgressTimers = () => {
-    if (progressInterval) {
-        clearInterval(progressInterval);
-        progressInterval = null;
+    if (pollTimeout) {
+        clearTimeout(pollTimeout);
+        pollTimeout = null;
     }
     if (safetyTimeout) {
         clearTimeout(safetyTimeout);
@@ -272,64 +280,51 @@ const clearProgressTimers = () => {
     }
 };
 
-const startProgressSimulation = () => {
-    let progress = 0;
-    let currentPhase = 0;
-    
-    const phases = [
-        { end: 15, message: 'Validando archivo...', speed: 2 },
-        { end: 35, message: 'Leyendo datos CSV...', speed: 1.5 },
-        { end: 60, message: 'Procesando información...', speed: 1 },
-        { end: 85, message: 'Generando reporte Excel...', speed: 1.2 },
-        { end: 95, message: 'Finalizando proceso...', speed: 0.5 }
-    ];
-    
+const JOB_STATES = {
+    en_cola: 'En cola de procesamiento...',
+    procesando: 'Procesando información...',
+    completado: 'Descargando reporte...'
+};
+
+const startProgress = () => {
     const buttonText = elements.submitBtn.querySelector('.button-text');
     
     if (buttonText && !buttonText.hasAttribute('aria-live')) {
         buttonText.setAttribute('aria-live', 'polite');
     }
+    if (buttonText) buttonText.textContent = 'Subiendo archivo...';
     
     elements.progressBar.setAttribute('role', 'progressbar');
     elements.progressBar.setAttribute('aria-valuenow', '0');
     elements.progressBar.setAttribute('aria-valuemin', '0');
     elements.progressBar.setAttribute('aria-valuemax', '100');
-    
-    progressInterval = setInterval(() => {
-        if (!formSubmitted) {
-            clearInterval(progressInterval);
-            return;
-        }
-        
-        if (currentPhase < phases.length) {
-            const phase = phases[currentPhase];
-            const increment = phase.speed;
-            progress = Math.min(progress + increment, phase.end);
-            
-            if (Math.floor(progress) >= phase.end - 2) {
-                if (buttonText) buttonText.textContent = phase.message;
-            }
-        } else {
-            progress = Math.min(progress + 0.1, 98);
-        }
-        
-        if (currentPhase < phases.length && progress >= phases[currentPhase].end) {
-            currentPhase++;
-        }
-        
-        elements.progressBar.style.width = progress + '%';
-        elements.progressBar.setAttribute('aria-valuenow', Math.floor(progress));
-        
-    }, CONFIG.PROGRESS_INTERVAL);
+    elements.progressBar.style.width = '0%';
 
     safetyTimeout = setTimeout(() => {
         if (formSubmitted && elements.submitBtn.disabled) {
+            if (abortController) abortController.abort();
             clearProgressTimers();
             hideLoadingState();
             showMessage('El proceso está tomando más tiempo del esperado. Por favor, intenta nuevamente.', 'warning');
             formSubmitted = false;
         }
-    }, CONFIG.SAFETY_TIMEOUT);
+    }, CONFIG.MAX_JOB_WAIT);
+};
+
+// Muestra la etapa y el avance real informados por el servidor
+const updateJobProgress = (job) => {
+    if (!(job.estado in JOB_STATES)) return;
+    
+    const progress = Math.min(Math.max(job.progreso || 0, 0), 100);
+    elements.progressBar.style.width = progress + '%';
+    elements.progressBar.setAttribute('aria-valuenow', progress);
+    
+    const buttonText = elements.submitBtn.querySelector('.button-text');
+    if (buttonText) {
+        buttonText.textContent = job.estado === 'procesando' && job.mensaje
+            ? `${job.mensaje} - ${progress}%`
+            : JOB_STATES[job.estado];
+    }
 };
 
 const completeProgress = () => {
@@ -399,6 +394,16 @@ const handleHTMLResponse = (response) => {
 };
 
 const handleErrorResponse = (response) => {
+    if (response.headers.get('content-type')?.includes('application/json')) {
+        return response.json().then(data => {
+            if (data.error) {
+                handleProcessingError(data.error, 'danger');
+            } else {
+                handleGenericHttpError(response.status);
+            }
+        }).catch(() => handleGenericHttpError(response.status));
+    }
+    
     return response.text().then(html => {
         const flashMessages = extractFlashMessagesFromHTML(html);
         if (flashMessages.length > 0) {
@@ -478,6 +483,8 @@ const handleGenericHttpError = (status) => {
         errorMessage = 'Archivo CSV inválido o formato incorrecto';
     } else if (status === 413) {
         errorMessage = 'El archivo es demasiado grande';
+    } else if (status === 429) {
+        errorMessage = 'Servidor ocupado procesando otros archivos. Intenta nuevamente en unos segundos.';
     } else if (status === 422) {
         errorMessage = 'El archivo CSV no contiene los encabezados requeridos. Verifica que el archivo tenga la estructura correcta.';
     } else if (status >= 500) {
@@ -510,18 +517,65 @@ const submitFormWithAjax = () => {
         clearTimeout(timeoutId);
         console.log('Respuesta del servidor:', response.status, response.statusText);
         
-        if (response.ok) {
+        if (response.status === 202) {
+            return response.json().then(job => {
+                updateJobProgress(job);
+                pollJob(job);
+            });
+        } else if (response.ok) {
+            // Reportes pequeños: el servidor responde directamente con el archivo
+            abortController = null;
             return handleSuccessResponse(response);
         } else {
+            abortController = null;
             return handleErrorResponse(response);
         }
     })
     .catch(error => {
         clearTimeout(timeoutId);
+        abortController = null;
         handleNetworkError(error);
+    });
+};
+
+// Consulta el estado del trabajo hasta que termine
+const pollJob = (job) => {
+    if (!formSubmitted || !abortController) return;
+    
+    fetch(job.url_estado, { signal: abortController.signal })
+    .then(response => {
+        if (!response.ok) {
+            return handleErrorResponse(response).then(() => null);
+        }
+        return response.json();
     })
-    .finally(() => {
+    .then(currentJob => {
+        if (!currentJob || !formSubmitted) return null;
+        
+        updateJobProgress(currentJob);
+        
+        if (currentJob.estado === 'completado') {
+            if (currentJob.filas_sin_fecha > 0) {
+                showMessage(`${currentJob.filas_sin_fecha.toLocaleString()} filas no tienen una fecha válida en la columna Hora y quedaron sin Mes ni Año`, 'warning');
+            }
+            return fetch(currentJob.url_descarga, { signal: abortController.signal })
+                .then(response => response.ok ? handleSuccessResponse(response) : handleErrorResponse(response))
+                .finally(() => {
+                    abortController = null;
+                });
+        }
+        if (currentJob.estado === 'error') {
+            abortController = null;
+            handleProcessingError(currentJob.error || 'Error al generar el reporte', 'danger');
+            return null;
+        }
+        
+        pollTimeout = setTimeout(() => pollJob(currentJob), CONFIG.POLL_INTERVAL);
+        return null;
+    })
+    .catch(error => {
         abortController = null;
+        handleNetworkError(error);
     });
 };
 
@@ -578,22 +632,19 @@ const setupDragAndDropListeners = () => {
         elements.dropZone.classList.remove('dragover');
         
         const files = e.dataTransfer.files;
-        if (files.length > 0) {
-            const file = files[0];
-            if (validateCSVFile(file)) {
-                elements.fileInput.files = files;
-                showFileInfo(file);
-            }
+        if (files.length > 0 && validateCSVFiles(files)) {
+            elements.fileInput.files = files;
+            showFileInfo(files);
         }
     });
 };
 
 const setupFileInputListener = () => {
     elements.fileInput.addEventListener('change', (e) => {
-        const file = e.target.files[0];
-        if (file) {
-            if (validateCSVFile(file)) {
-                showFileInfo(file);
+        const files = e.target.files;
+        if (files.length > 0) {
+            if (validateCSVFiles(files)) {
+                showFileInfo(files);
             } else {
                 e.target.value = '';
             }
@@ -619,13 +670,12 @@ const setupFormSubmitListener = () => {
             return;
         }
 
-        const file = elements.fileInput.files[0];
-        if (!validateCSVFile(file)) return;
+        if (!validateCSVFiles(elements.fileInput.files)) return;
         
         formSubmitted = true;
         showLoadingState();
         elements.progressContainer.style.display = 'block';
-        startProgressSimulation();
+        startProgress();
         submitFormWithAjax();
     });
 };
@@ -722,6 +772,12 @@ const initializeDOMElements = () => {
         logoutBtn: document.getElementById('logoutBtn'),
         cancelBtn: document.getElementById('cancelBtn')
     };
+
+    // El servidor indica su límite de subida (MAX_SUBIDA_MB)
+    const maxBytes = parseInt(elements.uploadForm?.dataset.maxBytes, 10);
+    if (maxBytes > 0) {
+        CONFIG.MAX_FILE_SIZE = maxBytes;
+    }
 };
 
 const processExistingAlerts = () => {
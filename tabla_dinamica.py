@@ -0,0 +1,258 @@
+"""
+Generación nativa de la tabla dinámica del reporte de impresiones.
+
+Este módulo calcula la suma de Impresiones por Año/Mes (columnas) e
+Impresora/Usuario (filas) con pandas y la escribe como una hoja con
+formato usando openpyxl, sin depender de Excel ni de xlwings.
+"""
+import numpy as np
+import pandas as pd
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+# =============================================================================
+# CONFIGURACIÓN DE LA TABLA DINÁMICA
+# =============================================================================
+
+NOMBRE_HOJA_PIVOTE = 'TABLA DINAMICA'
+
+# Celda de inicio de la tabla (equivalente a C3 en la versión con Excel)
+FILA_INICIO = 3
+COLUMNA_INICIO = 3
+
+CAMPOS_FILAS = ['Impresora', 'Usuario']
+CAMPOS_COLUMNAS = ['Año', 'Mes']
+CAMPO_VALOR = 'Impresiones'
+
+ORDEN_MESES = [
+    'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+    'Agosto', 'Setiembre', 'Octubre', 'Noviembre', 'Diciembre'
+]
+
+FORMATO_NUMERO = '#,##0'
+EN_BLANCO = '(en blanco)'
+
+# Estilos compartidos (equivalentes a PivotStyleLight9)
+FUENTE = Font(name='Calibri', size=14)
+FUENTE_NEGRITA = Font(name='Calibri', size=14, bold=True)
+RELLENO_ENCABEZADO = PatternFill('solid', fgColor='DDEBF7')
+RELLENO_SUBTOTAL = PatternFill('solid', fgColor='F2F2F2')
+BORDE_SUPERIOR = Border(top=Side(style='thin', color='9BC2E6'))
+SANGRIA_USUARIO = Alignment(indent=1)
+
+# =============================================================================
+# CÁLCULO DE LA TABLA DINÁMICA
+# =============================================================================
+
+
+def _clave_columna(columna):
+    """Orden de una columna (Año, Mes): años en orden, meses del calendario y
+    "(en blanco)" al final, como en la tabla dinámica de Excel."""
+    año, mes = columna
+    try:
+        posicion_mes = ORDEN_MESES.index(mes)
+    except ValueError:
+        posicion_mes = len(ORDEN_MESES) + (mes == EN_BLANCO)
+    if año == EN_BLANCO:
+        return (1, 0, posicion_mes)
+    return (0, año, posicion_mes)
+
+
+def _etiquetas(serie, vacio_en_blanco=False):
+    """Convierte una columna agrupada en etiquetas, con "(en blanco)" si falta."""
+    presentes = serie.notna()
+    if vacio_en_blanco:
+        presentes &= serie.astype(str) != ''
+    return serie.astype(object).where(presentes, EN_BLANCO).astype(str)
+
+
+def calcular_tabla_dinamica(df):
+    """Calcula la suma de impresiones por Impresora/Usuario y Año/Mes.
+
+    Devuelve un DataFrame con índice (Impresora, Usuario) y columnas
+    (Año, Mes) ordenadas cronológicamente, o None si faltan columnas. Los
+    años quedan como números y las fechas no reconocidas se agrupan en
+    "(en blanco)" al final, igual que en Excel.
+    """
+    campos = CAMPOS_FILAS + CAMPOS_COLUMNAS + [CAMPO_VALOR]
+    if df.empty or any(campo not in df.columns for campo in campos):
+        return None
+
+    # Se agrupan las columnas originales y solo el resultado (pocas filas)
+    # se convierte en etiquetas
+    valores = pd.to_numeric(df[CAMPO_VALOR], errors='coerce').fillna(0)
+    agrupado = (
+        valores.groupby([df[campo] for campo in CAMPOS_FILAS + CAMPOS_COLUMNAS],
+                        dropna=False, observed=True, sort=False)
+        .sum()
+        .reset_index()
+    )
+    for campo in CAMPOS_FILAS:
+        agrupado[campo] = _etiquetas(agrupado[campo])
+    año = pd.to_numeric(agrupado['Año'], errors='coerce')
+    agrupado['Año'] = año.astype('Int64').astype(object).where(año.notna(), EN_BLANCO)
+    agrupado['Mes'] = _etiquetas(agrupado['Mes'], vacio_en_blanco=True)
+
+    claves_filas = pd.MultiIndex.from_frame(agrupado[CAMPOS_FILAS])
+    claves_columnas = list(zip(agrupado['Año'].tolist(), agrupado['Mes'].tolist()))
+    indice = claves_filas.unique().sort_values()
+    columnas = sorted(set(claves_columnas), key=_clave_columna)
+    posicion_columna = {columna: posicion for posicion, columna in enumerate(columnas)}
+
+    matriz = np.zeros((len(indice), len(columnas)), dtype=agrupado[CAMPO_VALOR].dtype)
+    np.add.at(matriz,
+              (indice.get_indexer(claves_filas),
+               [posicion_columna[columna] for columna in claves_columnas]),
+              agrupado[CAMPO_VALOR].to_numpy())
+    return pd.DataFrame(matriz, index=indice,
+                        columns=pd.MultiIndex.from_tuples(columnas, names=CAMPOS_COLUMNAS))
+
+# =============================================================================
+# ESCRITURA EN EL LIBRO DE EXCEL
+# =============================================================================
+
+
+def _estilo(sheet, fuente=FUENTE, relleno=None, borde=None, formato=None,
+            alineacion=None):
+    """Registra una combinación de estilos una sola vez y devuelve sus índices.
+
+    Las celdas creadas con ``_celda`` comparten esos índices, así que no se
+    vuelven a buscar la fuente, el relleno y el borde por cada valor.
+    """
+    modelo = WriteOnlyCell(sheet)
+    modelo.font = fuente
+    if relleno is not None:
+        modelo.fill = relleno
+    if borde is not None:
+        modelo.border = borde
+    if formato is not None:
+        modelo.number_format = formato
+    if alineacion is not None:
+        modelo.alignment = alineacion
+    return modelo._style  # pylint: disable=protected-access
+
+
+def _celda(sheet, valor, estilo):
+    """Crea una celda con un estilo registrado por ``_estilo``."""
+    return Cell(sheet, row=1, column=1, value=valor, style_array=estilo)
+
+
+def _con_totales(matriz, bloques_años):
+    """Agrega a cada fila el total de cada año y el total general."""
+    partes = []
+    for inicio, fin in bloques_años:
+        partes += [matriz[:, inicio:fin], matriz[:, inicio:fin].sum(axis=1, keepdims=True)]
+    partes.append(matriz.sum(axis=1, keepdims=True))
+    return np.hstack(partes)
+
+
+def escribir_tabla_dinamica(sheet, tabla):
+    """Escribe la tabla dinámica calculada con el diseño compacto de Excel.
+
+    Las filas se agregan en orden con ``append`` para que funcione tanto en
+    hojas normales como en libros de solo escritura. Cada combinación de
+    estilos se registra una vez y las celdas comparten sus índices.
+    """
+    años = list(dict.fromkeys(año for año, _ in tabla.columns))
+    meses_por_año = {
+        año: [mes for a, mes in tabla.columns if a == año] for año in años
+    }
+    bloques_años = []
+    inicio = 0
+    for año in años:
+        bloques_años.append((inicio, inicio + len(meses_por_año[año])))
+        inicio += len(meses_por_año[año])
+    total_columnas = len(tabla.columns) + len(años) + 2
+    sangria = [None] * (COLUMNA_INICIO - 1)
+
+    # Ancho de columnas y paneles inmovilizados (antes de escribir filas)
+    ancho_etiquetas = max(
+        [len(str(valor)) for valor in tabla.index.get_level_values(0)] +
+        [len(str(valor)) + 2 for valor in tabla.index.get_level_values(1)] +
+        [len('Suma de ' + CAMPO_VALOR)]
+    )
+    sheet.column_dimensions[get_column_letter(COLUMNA_INICIO)].width = (
+        ancho_etiquetas + 4
+    )
+    for columna in range(COLUMNA_INICIO + 1, COLUMNA_INICIO + total_columnas):
+        sheet.column_dimensions[get_column_letter(columna)].width = 16
+    sheet.freeze_panes = (
+        f"{get_column_letter(COLUMNA_INICIO + 1)}{FILA_INICIO + 3}"
+    )
+
+    for _ in range(FILA_INICIO - 1):
+        sheet.append([])
+
+    estilo_encabezado = _estilo(sheet, FUENTE_NEGRITA, RELLENO_ENCABEZADO)
+    estilo_impresora = _estilo(sheet, FUENTE_NEGRITA, RELLENO_SUBTOTAL)
+    estilo_subtotal = _estilo(sheet, FUENTE_NEGRITA, RELLENO_SUBTOTAL, formato=FORMATO_NUMERO)
+    estilo_usuario = _estilo(sheet, alineacion=SANGRIA_USUARIO)
+    estilo_valor = _estilo(sheet, formato=FORMATO_NUMERO)
+    estilo_total = _estilo(sheet, FUENTE_NEGRITA, RELLENO_ENCABEZADO, BORDE_SUPERIOR)
+    estilo_valor_total = _estilo(sheet, FUENTE_NEGRITA, RELLENO_ENCABEZADO, BORDE_SUPERIOR,
+                                 FORMATO_NUMERO)
+
+    def encabezado(valor):
+        """Celda de encabezado de la tabla."""
+        return _celda(sheet, valor, estilo_encabezado)
+
+    def celdas(valores, estilo):
+        """Celdas con formato numérico para los valores de una fila."""
+        return [_celda(sheet, valor, estilo) for valor in valores]
+
+    # Encabezados: valor y etiquetas de columna
+    fila_valor = [encabezado(f'Suma de {CAMPO_VALOR}'),
+                  encabezado('Etiquetas de columna')]
+    fila_años = [encabezado(None)]
+    fila_meses = [encabezado('Etiquetas de fila')]
+    for año in años:
+        meses = meses_por_año[año]
+        fila_años += [encabezado(año)] + [encabezado(None) for _ in meses[1:]]
+        fila_años.append(encabezado(f'Total {año}'))
+        fila_meses += [encabezado(mes) for mes in meses] + [encabezado(None)]
+    fila_años.append(encabezado('Total general'))
+    fila_meses.append(encabezado(None))
+    fila_valor += [encabezado(None) for _ in range(total_columnas - 2)]
+
+    for fila in (fila_valor, fila_años, fila_meses):
+        sheet.append(sangria + fila)
+
+    # Filas: subtotal por impresora seguido del detalle por usuario. El
+    # índice está ordenado, así que cada impresora ocupa filas contiguas.
+    valores = tabla.to_numpy()
+    impresoras = tabla.index.get_level_values(0)
+    usuarios = tabla.index.get_level_values(1)
+    inicios = np.flatnonzero(np.r_[True, impresoras[1:] != impresoras[:-1]])
+    finales = np.r_[inicios[1:], len(tabla)]
+    detalle = _con_totales(valores, bloques_años).tolist()
+    subtotales = _con_totales(np.add.reduceat(valores, inicios, axis=0),
+                              bloques_años).tolist()
+
+    for inicio, fin, subtotal in zip(inicios, finales, subtotales):
+        sheet.append(sangria + [_celda(sheet, impresoras[inicio], estilo_impresora)] +
+                     celdas(subtotal, estilo_subtotal))
+
+        for posicion in range(inicio, fin):
+            sheet.append(sangria + [_celda(sheet, usuarios[posicion], estilo_usuario)] +
+                         celdas(detalle[posicion], estilo_valor))
+
+    # Fila de total general
+    total = _con_totales(valores.sum(axis=0, keepdims=True), bloques_años)[0]
+    sheet.append(sangria + [_celda(sheet, 'Total general', estilo_total)] +
+                 celdas(total.tolist(), estilo_valor_total))
+
+
+def crear_tabla_dinamica_nativa(workbook, df):
+    """Agrega la hoja 'TABLA DINAMICA' al libro de openpyxl a partir del DataFrame."""
+    try:
+        tabla = calcular_tabla_dinamica(df)
+        if tabla is None or tabla.empty:
+            return False
+
+        sheet = workbook.create_sheet(NOMBRE_HOJA_PIVOTE)
+        escribir_tabla_dinamica(sheet, tabla)
+        return True
+    except (KeyError, ValueError, TypeError) as e:
+        print(f"Error al crear tabla dinámica: {e}")
+        return False
@@ -0,0 +1,80 @@
+"""
+Pruebas del esquema compacto: columnas categóricas y enteros de 32 bits.
+"""
+import pandas as pd
+import pytest
+
+import procesamiento
+from procesamiento import (
+    COLUMNAS_CATEGORICAS, ENCABEZADOS_REQUERIDOS, _entero_compacto, compactar_dataframe,
+    leer_csv_por_bloques, procesar_dataframe
+)
+
+
+def crear_csv(ruta, filas):
+    """CSV de PaperCut con los registros dados como diccionarios parciales."""
+    lineas = ['PaperCut Print Logger : http://www.papercut.com/', ','.join(ENCABEZADOS_REQUERIDOS)]
+    for fila in filas:
+        valores = {'Hora': '2024-03-19 02:16:00', 'Páginas': '1', 'Copias': '1', **fila}
+        lineas.append(','.join(valores.get(columna, '') for columna in ENCABEZADOS_REQUERIDOS))
+    ruta.write_text('\n'.join(lineas), encoding='utf-8')
+    return str(ruta)
+
+
+def test_bloques_con_categorias_distintas(tmp_path, monkeypatch):
+    monkeypatch.setattr(procesamiento, 'TAMAÑO_BLOQUE_CSV', 2)
+    ruta = crear_csv(tmp_path / 'reporte.csv', [
+        {'Usuario': 'ana', 'Impresora': 'HP', 'Páginas': '3', 'Copias': '2'},
+        {'Usuario': 'luis', 'Impresora': 'HP'},
+        {'Usuario': 'eva', 'Impresora': 'Canon'},
+    ])
+
+    df = leer_csv_por_bloques(ruta, 'utf-8', ENCABEZADOS_REQUERIDOS)
+
+    for columna in COLUMNAS_CATEGORICAS:
+        assert isinstance(df[columna].dtype, pd.CategoricalDtype), columna
+    assert df['Usuario'].tolist() == ['ana', 'luis', 'eva']
+    assert df['Impresora'].tolist() == ['HP', 'HP', 'Canon']
+    assert df['Páginas'].dtype == 'int32' and df['Copias'].dtype == 'int32'
+
+    procesado = procesar_dataframe(df)
+    assert procesado['Impresiones'].dtype == 'int32'
+    assert procesado['Impresiones'].tolist() == [6, 1, 1]
+
+
+def test_faltantes_y_decimales_quedan_como_float(tmp_path):
+    ruta = crear_csv(tmp_path / 'reporte.csv', [
+        {'Usuario': 'ana', 'Páginas': '2.5'},
+        {'Usuario': 'luis', 'Copias': ''},
+    ])
+
+    df = leer_csv_por_bloques(ruta, 'utf-8', ENCABEZADOS_REQUERIDOS)
+
+    assert df['Páginas'].dtype == 'float64'
+    assert df['Páginas'].tolist() == [2.5, 1.0]
+    assert df['Copias'].dtype == 'float64'
+    assert pd.isna(df['Copias'].iloc[1])
+
+
+@pytest.mark.parametrize('valores, tipo', [
+    ([0, 2 ** 31 - 1], 'int32'),
+    ([-2 ** 31, 5.0], 'int32'),
+    ([0, 2 ** 31], 'int64'),
+    ([1.0, 1.5], 'float64'),
+    ([], 'int32'),
+])
+def test_entero_compacto_respeta_los_limites(valores, tipo):
+    numeros = pd.Series(valores, dtype='int64' if tipo == 'int64' else 'float64')
+
+    assert _entero_compacto(numeros).dtype == tipo
+
+
+def test_compactar_datos_leidos_del_historial():
+    df = pd.DataFrame({'Usuario': pd.Categorical(['ana']), 'Impresiones': [4.0],
+                       'Nombre Documento': ['informe.pdf']})
+
+    compactar_dataframe(df)
+
+    assert isinstance(df['Usuario'].dtype, pd.CategoricalDtype)
+    assert df['Impresiones'].dtype == 'int32'
+    assert not isinstance(df['Nombre Documento'].dtype, pd.CategoricalDtype)
@@ -0,0 +1,56 @@
+"""
+Pruebas de la conversión de la columna Hora de las exportaciones.
+"""
+import pandas as pd
+import pytest
+
+from procesamiento import convertir_fechas
+
+
+def convertir(valores):
+    """Fechas convertidas como texto y filas sin fecha."""
+    fechas, sin_fecha = convertir_fechas(pd.Series(valores))
+    return [None if pd.isna(fecha) else str(fecha) for fecha in fechas], sin_fecha
+
+
+def test_dia_antes_que_mes():
+    assert convertir(['25/12/2024 10:00:00', '05/01/2024 11:00:00']) == (
+        ['2024-12-25 10:00:00', '2024-01-05 11:00:00'], 0)
+
+
+def test_mes_antes_que_dia():
+    assert convertir(['12/25/2024 10:00:00', '01/05/2024 11:00:00']) == (
+        ['2024-12-25 10:00:00', '2024-01-05 11:00:00'], 0)
+
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('05/01/2024 10:00:00 p. m.', '2024-01-05 22:00:00'),
+    ('05/01/2024 10:00:00 a.m.', '2024-01-05 10:00:00'),
+    ('05/01/2024 12:30:00 AM', '2024-01-05 00:30:00'),
+])
+def test_a_m_y_p_m(valor, esperado):
+    assert convertir([valor, '25/01/2024 09:15:00 p. m.']) == (
+        [esperado, '2024-01-25 21:15:00'], 0)
+
+
+@pytest.mark.parametrize('valor', [
+    '2024-01-05 10:00:00.123',
+    '2024-01-05T10:00:00Z',
+    '2024-01-05T10:00:00.5+00:00',
+])
+def test_iso_con_fracciones_o_zona_horaria(valor):
+    # El día 05 no debe leerse como mes
+    assert convertir([valor]) == (['2024-01-05 10:00:00'], 0)
+
+
+def test_formatos_combinados_y_valores_invalidos():
+    fechas, sin_fecha = convertir(['2024-01-05 10:00:00', '2024-01-05 10:00:00.123',
+                                   '05/02/2024 10:00', 'no es fecha'])
+    assert fechas == ['2024-01-05 10:00:00', '2024-01-05 10:00:00',
+                      '2024-02-05 10:00:00', None]
+    assert sin_fecha == 1
+
+
+def test_solo_valores_invalidos_en_la_inferencia():
+    assert convertir(['no es fecha', '2024-02-16 00:57:00']) == (
+        [None, '2024-02-16 00:57:00'], 1)
@@ -0,0 +1,62 @@
+"""
+Pruebas de los filtros por hoja: validación y cálculo de las particiones.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filtros import PatronesCombinados, compilar_filtros
+from procesamiento import indices_particiones
+
+
+@pytest.fixture
+def registros():
+    return pd.DataFrame({
+        'Impresora': pd.Categorical(['HP Piso1', 'HP Piso2', 'Canon Piso1', 'Xerox', 'HP Piso1']),
+        'Cliente': pd.Categorical(['PC-ADM-1', 'PC-VEN-2', 'PC-ADM-3', 'PC-ADM-4', None]),
+    })
+
+
+def test_patrones_superpuestos_coinciden_todos():
+    patrones = PatronesCombinados([re.compile(patron, re.IGNORECASE)
+                                   for patron in ('hp', 'piso1', 'canon', '^x')])
+
+    assert patrones.coincidencias(['HP Piso1', 'Canon Piso1', 'Xerox']).tolist() == [
+        [True, True, False, False],
+        [False, True, True, False],
+        [False, False, False, True],
+    ]
+
+
+def test_patrones_que_no_se_combinan_se_evaluan_aparte():
+    # Las referencias cambiarían de número, (?i) solo vale al inicio y 'c'
+    # distingue mayúsculas
+    patrones = PatronesCombinados([re.compile(r'(p)\1', re.IGNORECASE),
+                                   re.compile('(?i)hp'), re.compile('c'),
+                                   re.compile('x', re.IGNORECASE)])
+
+    assert patrones.combinados == [3]
+    assert patrones.coincidencias(['HPP', 'Cx']).tolist() == [[True, True, False, False],
+                                                              [False, False, False, True]]
+    assert patrones.coincidencias([]).shape == (0, 4)
+
+
+def test_particiones_de_reglas_exactas_y_de_subcadena(registros):
+    particiones = indices_particiones(registros, {
+        'HP': {'impresora': 'hp', 'cliente': 'pc', 'solo_impresora': False},
+        'Xerox': {'impresora': 'Xerox'},
+        'Piso1 ADM': {'impresora': 'piso1', 'cliente': 'adm', 'solo_impresora': False},
+        'Ninguna': {'impresora': 'brother', 'cliente': '.', 'solo_impresora': False},
+    })
+
+    assert list(particiones) == ['HP', 'Xerox', 'Piso1 ADM', 'Ninguna']
+    # La última fila no tiene cliente y no entra en las reglas de subcadena
+    assert [particiones[nombre].tolist() for nombre in particiones] == [[0, 1], [3], [0, 2], []]
+    assert all(indices.dtype == np.intp for indices in particiones.values())
+
+
+def test_rechaza_hojas_repetidas_sin_distinguir_mayusculas():
+    with pytest.raises(ValueError):
+        compilar_filtros({'Ventas': {'impresora': 'HP'}, 'VENTAS': {'impresora': 'Canon'}})
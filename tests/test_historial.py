@@ -0,0 +1,75 @@
+"""
+Pruebas del historial Parquet: escritura incremental, lectura por rango y cubos.
+"""
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import historial  # noqa: E402  pylint: disable=wrong-import-position
+from procesamiento import (  # noqa: E402  pylint: disable=wrong-import-position
+    ENCABEZADOS_REQUERIDOS, compactar_dataframe, procesar_dataframe
+)
+
+
+def crear_subida(filas, usuarios, impresora, inicio):
+    """DataFrame procesado como el de un CSV subido."""
+    crudo = pd.DataFrame({columna: '' for columna in ENCABEZADOS_REQUERIDOS},
+                         index=range(filas))
+    crudo['Hora'] = pd.date_range(inicio, periods=filas, freq='min').strftime('%Y-%m-%d %H:%M:%S')
+    crudo['Usuario'] = [f"usuario{n % usuarios}" for n in range(filas)]
+    crudo['Impresora'] = impresora
+    crudo['Páginas'] = 1
+    crudo['Copias'] = 2
+    crudo['Nombre Documento'] = [f"documento{n}" for n in range(filas)]
+    crudo['Cliente'] = 'Cliente'
+    return procesar_dataframe(compactar_dataframe(crudo))
+
+
+@pytest.fixture(autouse=True)
+def directorio_historial(tmp_path, monkeypatch):
+    monkeypatch.setattr(historial, 'HISTORIAL_HABILITADO', True)
+    monkeypatch.setattr(historial, 'DIRECTORIO_HISTORIAL', str(tmp_path))
+    monkeypatch.setattr(historial, 'DIRECTORIO_CUBOS', str(tmp_path / '_cubos'))
+
+
+def test_lee_subidas_de_distinto_tamaño():
+    # Con muchos usuarios un esquema categórico usaría índices int16 y con
+    # pocos int8; la partición más chica ('Alfa') se lee primero
+    assert historial.agregar_al_historial(crear_subida(2000, 500, 'Zeta', '2024-01-01')) == 2000
+    assert historial.agregar_al_historial(crear_subida(10, 2, 'Alfa', '2024-01-02')) == 10
+
+    df = historial.leer_historial()
+
+    assert len(df) == 2010
+    assert df['Usuario'].nunique() == 500
+    assert set(df['Impresora']) == {'Alfa', 'Zeta'}
+    assert df['Impresiones'].dtype == 'int32'
+    assert int(df['Impresiones'].sum()) == 2010 * 2
+
+
+def test_no_duplica_registros_ya_cargados():
+    subida = crear_subida(50, 5, 'Zeta', '2024-03-01')
+    assert historial.agregar_al_historial(subida) == 50
+    assert historial.agregar_al_historial(subida) == 0
+    assert len(historial.leer_historial()) == 50
+
+
+def test_lee_solo_el_rango_pedido():
+    historial.agregar_al_historial(crear_subida(10, 2, 'Zeta', '2024-01-31 23:55'))
+
+    df = historial.leer_historial(desde=(2024, 2), hasta=(2024, 2))
+
+    assert len(df) == 5
+    assert set(df['Mes']) == {'Febrero'}
+    assert list(df.columns) == historial.COLUMNAS_PROCESADAS
+
+
+def test_cubo_suma_los_registros_del_mes():
+    historial.agregar_al_historial(crear_subida(30, 3, 'Zeta', '2024-05-01'))
+    historial.agregar_al_historial(crear_subida(20, 4, 'Alfa', '2024-05-02'))
+
+    cubo = historial.leer_cubos((2024, 5), (2024, 5))
+
+    assert int(cubo['Trabajos'].sum()) == 50
+    assert int(cubo['Impresiones'].sum()) == 100
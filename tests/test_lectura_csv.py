@@ -0,0 +1,46 @@
+"""
+Pruebas de la lectura por bloques de los CSV exportados.
+"""
+import builtins
+
+import procesamiento
+from procesamiento import ENCABEZADOS_REQUERIDOS, leer_csv_por_bloques
+
+FILA = ('2024-03-19 02:16:00,usuario7,16,2,Canon iR,Documento 0.pdf,PC-21,A4,PCL6,'
+        'Altura: 297mm,Anchura: 210mm,NOT DUPLEX,GRAYSCALE,1 kb')
+
+
+def crear_csv(ruta, encoding, encabezados=ENCABEZADOS_REQUERIDOS, filas=3):
+    """CSV con la línea de PaperCut, los encabezados y ``filas`` registros."""
+    contenido = '\n'.join(['PaperCut Print Logger : http://www.papercut.com/',
+                           ','.join(encabezados)] + [FILA] * filas)
+    ruta.write_bytes(contenido.encode(encoding))
+    return str(ruta)
+
+
+def test_encoding_invalido_en_el_encabezado_cierra_el_archivo(tmp_path, monkeypatch):
+    # 'Páginas' en latin1 no es UTF-8 válido: el lector falla al construirse
+    ruta = crear_csv(tmp_path / 'latin1.csv', 'latin1')
+    abiertos = []
+
+    def abrir(*argumentos, **opciones):
+        archivo = builtins.open(*argumentos, **opciones)
+        abiertos.append(archivo)
+        return archivo
+    monkeypatch.setattr(procesamiento, 'open', abrir, raising=False)
+
+    df = leer_csv_por_bloques(ruta, 'utf-8', ENCABEZADOS_REQUERIDOS)
+
+    assert len(df) == 3
+    assert len(abiertos) == 2
+    assert all(archivo.closed for archivo in abiertos)
+
+
+def test_columnas_en_orden_estandar(tmp_path):
+    columnas_archivo = [f" {columna.upper()} " for columna in ENCABEZADOS_REQUERIDOS]
+    ruta = crear_csv(tmp_path / 'reporte.csv', 'utf-8', columnas_archivo)
+
+    df = leer_csv_por_bloques(ruta, 'utf-8', columnas_archivo)
+
+    assert list(df.columns) == ENCABEZADOS_REQUERIDOS
+    assert df['Usuario'].tolist() == ['usuario7'] * 3
@@ -0,0 +1,59 @@
+"""
+Pruebas del libro escrito en paralelo: debe quedar igual al secuencial.
+"""
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+pytest.importorskip('pyarrow')
+
+import procesamiento  # noqa: E402  pylint: disable=wrong-import-position
+from procesamiento import (  # noqa: E402  pylint: disable=wrong-import-position
+    ENCABEZADOS_REQUERIDOS, HOJA_EN_PARALELO, compactar_dataframe, generar_excel_rapido,
+    procesar_dataframe
+)
+
+IMPRESORAS = ['HP LJ300-400 color M351-M451 PCL 6', 'Xerox WorkCentre 3225', 'Canon iR']
+
+
+@pytest.fixture
+def registros():
+    filas = 120
+    crudo = pd.DataFrame({columna: '' for columna in ENCABEZADOS_REQUERIDOS},
+                         index=range(filas))
+    crudo['Hora'] = pd.date_range('2024-01-01', periods=filas, freq='6h').strftime(
+        '%Y-%m-%d %H:%M:%S')
+    crudo['Usuario'] = [f"usuario{n % 7}" for n in range(filas)]
+    crudo['Impresora'] = [IMPRESORAS[n % 3] for n in range(filas)]
+    crudo['Páginas'] = [n % 5 + 1 for n in range(filas)]
+    crudo['Copias'] = 1
+    crudo['Nombre Documento'] = [f"documento{n}" for n in range(filas)]
+    return procesar_dataframe(compactar_dataframe(crudo))
+
+
+def contenido(ruta):
+    """Nombre y valores de cada hoja del libro."""
+    libro = load_workbook(ruta)
+    return [(hoja.title, list(hoja.values)) for hoja in libro.worksheets]
+
+
+def test_libro_paralelo_igual_al_secuencial(registros, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(procesamiento, 'PIVOTE_EXCEL_DISPONIBLE', False)
+    monkeypatch.setattr(procesamiento, 'FILAS_EXCEL_PARALELO', 0)
+    # La hoja general sigue en una hoja de continuación
+    monkeypatch.setattr(procesamiento, 'LIMITE_FILAS_HOJA', 100)
+    etapas = []
+
+    paralelo = generar_excel_rapido(registros, destino=str(tmp_path / 'paralelo.xlsx'),
+                                    max_procesos=2,
+                                    progreso=lambda etapa, **datos: etapas.append(datos))
+    secuencial = generar_excel_rapido(registros, destino=str(tmp_path / 'secuencial.xlsx'),
+                                      max_procesos=1)
+
+    assert any(datos.get('hoja') == HOJA_EN_PARALELO for datos in etapas)
+    # Sin volver a la escritura secuencial por un error
+    assert 'Error al generar las hojas en paralelo' not in capsys.readouterr().out
+    hojas = contenido(paralelo)
+    assert hojas == contenido(secuencial)
+    assert len(hojas) > 3
+    assert sum(len(filas) - 1 for nombre, filas in hojas if nombre.startswith('GENERAL')) == 120
@@ -0,0 +1,116 @@
+"""
+Pruebas del servicio de tablas dinámicas con el backend simulado (sin Excel).
+"""
+import os
+
+import pytest
+
+from pivote_excel import BackendSimulado, ServicioPivote
+
+
+class BackendQueEscribe(BackendSimulado):
+    """Backend simulado que marca la copia del libro que recibe."""
+
+    def agregar_tabla_dinamica(self, instancia, ruta):
+        super().agregar_tabla_dinamica(instancia, ruta)
+        with open(ruta, 'a', encoding='utf-8') as libro:
+            libro.write('+excel')
+
+
+@pytest.fixture
+def crear_libro(tmp_path):
+    def crear(nombre='libro'):
+        ruta = tmp_path / f"{nombre}.xlsx"
+        ruta.write_text('nativa', encoding='utf-8')
+        return str(ruta)
+    return crear
+
+
+@pytest.fixture
+def servicios():
+    creados = []
+
+    def crear(backend, **opciones):
+        servicio = ServicioPivote(backend, **opciones)
+        creados.append(servicio)
+        return servicio
+    yield crear
+    for servicio in creados:
+        servicio.cerrar()
+
+
+def _restos(ruta):
+    """Copias de trabajo que quedaron junto al libro."""
+    directorio = os.path.dirname(ruta)
+    return [nombre for nombre in os.listdir(directorio) if '.excel-' in nombre]
+
+
+def test_reemplaza_el_libro_con_la_copia_de_excel(crear_libro, servicios):
+    servicio = servicios(BackendQueEscribe(), instancias=1)
+    ruta = crear_libro()
+
+    informe = servicio.agregar_tabla_dinamica(ruta, tiempo_maximo=5)
+
+    assert informe == {'resultado': 'ok', 'reinicio': None}
+    with open(ruta, encoding='utf-8') as libro:
+        assert libro.read() == 'nativa+excel'
+    assert _restos(ruta) == []
+
+
+def test_fallo_conserva_el_libro_y_reinicia_la_instancia(crear_libro, servicios):
+    backend = BackendQueEscribe(fallar=lambda ruta: 'malo' in ruta)
+    servicio = servicios(backend, instancias=1)
+    ruta = crear_libro('malo')
+
+    informe = servicio.agregar_tabla_dinamica(ruta, tiempo_maximo=5)
+
+    assert informe == {'resultado': 'error', 'reinicio': 'fallo'}
+    with open(ruta, encoding='utf-8') as libro:
+        assert libro.read() == 'nativa'
+    assert _restos(ruta) == []
+    assert servicio.agregar_tabla_dinamica(crear_libro(), 5)['resultado'] == 'ok'
+    assert backend.iniciadas == 2
+
+
+def test_reinicia_la_instancia_tras_el_limite_de_libros(crear_libro, servicios):
+    backend = BackendSimulado()
+    servicio = servicios(backend, instancias=1, trabajos_por_instancia=2)
+
+    informes = [servicio.agregar_tabla_dinamica(crear_libro(f"libro{n}"), 5)
+                for n in range(5)]
+
+    assert [informe['reinicio'] for informe in informes] == [None, 'limite', None,
+                                                            'limite', None]
+    assert len(backend.libros) == 5
+    # Dos reinicios, y la instancia siguiente ya se inició antes del quinto libro
+    assert backend.iniciadas == 3
+
+
+def test_tiempo_agotado_termina_la_instancia(crear_libro, servicios):
+    backend = BackendQueEscribe(demora_libro=30)
+    servicio = servicios(backend, instancias=1)
+    ruta = crear_libro()
+
+    informe = servicio.agregar_tabla_dinamica(ruta, tiempo_maximo=0.2)
+
+    assert informe == {'resultado': 'tiempo_agotado', 'reinicio': 'fallo'}
+    with open(ruta, encoding='utf-8') as libro:
+        assert libro.read() == 'nativa'
+
+    # El hilo se libera al terminar la instancia y atiende con una nueva
+    backend.demora_libro = 0
+    assert servicio.agregar_tabla_dinamica(crear_libro('otro'), 5)['resultado'] == 'ok'
+    assert backend.iniciadas == 2
+    assert _restos(ruta) == []
+
+
+def test_sin_excel_devuelve_no_disponible(crear_libro, servicios):
+    class BackendSinExcel(BackendSimulado):
+        def iniciar(self):
+            raise OSError('Excel no está instalado')
+
+    servicio = servicios(BackendSinExcel(), instancias=1)
+    ruta = crear_libro()
+
+    assert servicio.agregar_tabla_dinamica(ruta, 5)['resultado'] == 'no_disponible'
+    assert not servicio.disponible()
@@ -0,0 +1,49 @@
+"""
+Pruebas de la tabla dinámica nativa (cálculo con pandas y escritura con openpyxl).
+"""
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from tabla_dinamica import (
+    FORMATO_NUMERO, NOMBRE_HOJA_PIVOTE, calcular_tabla_dinamica, crear_tabla_dinamica_nativa
+)
+
+
+@pytest.fixture
+def registros():
+    return pd.DataFrame({
+        'Impresora': ['HP', 'HP', 'HP', 'Xerox'],
+        'Usuario': ['ana', 'ana', 'luis', 'ana'],
+        'Año': pd.array([2024, 2023, None, 2024], dtype='Int16'),
+        'Mes': ['Febrero', 'Diciembre', None, 'Enero'],
+        'Impresiones': [1500, 2, 3, 4],
+    })
+
+
+def test_años_numericos_y_en_blanco_al_final(registros):
+    tabla = calcular_tabla_dinamica(registros)
+
+    assert list(tabla.columns) == [(2023, 'Diciembre'), (2024, 'Enero'), (2024, 'Febrero'),
+                                   ('(en blanco)', '(en blanco)')]
+    assert tabla.loc[('HP', 'ana')].tolist() == [2, 0, 1500, 0]
+    assert int(tabla.to_numpy().sum()) == 1509
+
+
+@pytest.mark.parametrize('solo_escritura', [True, False])
+def test_escribe_valores_con_formato(registros, tmp_path, solo_escritura):
+    libro = Workbook(write_only=solo_escritura)
+    assert crear_tabla_dinamica_nativa(libro, registros)
+    libro.save(tmp_path / 'pivote.xlsx')
+
+    hoja = load_workbook(tmp_path / 'pivote.xlsx')[NOMBRE_HOJA_PIVOTE]
+    assert [hoja.cell(4, columna).value for columna in (4, 5, 6, 8)] == [
+        2023, 'Total 2023', 2024, 'Total 2024']
+    # Subtotal de HP: 2 en 2023, 1500 en 2024 y 3 en blanco
+    assert [hoja.cell(6, columna).value for columna in range(3, 12)] == [
+        'HP', 2, 2, 0, 1500, 1500, 3, 3, 1505]
+    for celda in (hoja['D6'], hoja['G7'], hoja.cell(hoja.max_row, 11)):
+        assert celda.number_format == FORMATO_NUMERO
+        assert celda.font.sz == 14
+    assert hoja['C7'].alignment.indent == 1
+    assert hoja.cell(hoja.max_row, 11).value == 1509
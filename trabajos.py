@@ -0,0 +1,576 @@
+"""
+Cola de trabajos en segundo plano para la generación de reportes.
+
+Los reportes se generan en un grupo acotado de procesos para que las
+solicitudes HTTP respondan de inmediato con un identificador de trabajo,
+que luego se consulta para conocer el estado y descargar el resultado.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from admision import ServidorOcupado, verificar_cola
+from cache_reportes import guardar_en_cache, obtener_de_cache
+from historial import HISTORIAL_HABILITADO, actualizar_historial, leer_cubos, leer_historial
+from metricas import (
+    incrementar, memoria_actual_bytes, memoria_pico_bytes, observar, registrar_etapa,
+    registrar_indicador
+)
+from procesamiento import (
+    TIPO_REPORTE_DETALLADO, TIPO_REPORTE_RESUMEN, generar_excel, generar_excel_resumen_cubo,
+    generar_reporte_combinado, notificar_progreso
+)
+
+# =============================================================================
+# CONFIGURACIÓN DE TRABAJOS
+# =============================================================================
+
+MAX_PROCESOS_TRABAJOS = int(os.getenv('MAX_PROCESOS_TRABAJOS') or '2')
+TTL_TRABAJOS = int(os.getenv('TTL_TRABAJOS_SEGUNDOS') or '3600')
+INTERVALO_LIMPIEZA = 60  # Segundos entre revisiones de trabajos vencidos
+DIRECTORIO_TRABAJOS = (os.getenv('DIRECTORIO_TRABAJOS') or
+                       os.path.join(tempfile.gettempdir(), 'reportes_impresiones'))
+
+INTERVALO_PROGRESO = 0.5  # Segundos mínimos entre escrituras del progreso
+
+ESTADO_EN_COLA = 'en_cola'
+ESTADO_PROCESANDO = 'procesando'
+ESTADO_COMPLETADO = 'completado'
+ESTADO_ERROR = 'error'
+
+# Etapas del procesamiento: (porcentaje inicial, porcentaje final, mensaje)
+ETAPAS_PROGRESO = {
+    'decodificacion': (0, 5, 'Validando archivo'),
+    'lectura': (5, 35, 'Leyendo datos CSV'),
+    'procesamiento': (35, 40, 'Procesando información'),
+    'historial': (40, 45, 'Actualizando historial'),
+    'resumen': (45, 50, 'Calculando resumen'),
+    'hoja': (45, 90, 'Generando hoja'),
+    'tabla_dinamica': (90, 97, 'Creando tabla dinámica'),
+    'guardado': (97, 100, 'Guardando reporte'),
+}
+
+_trabajos = {}
+_datos_api = {}
+_memoria_pico_trabajos = None
+_bloqueo = threading.Lock()
+_executor = None
+_hilo_limpieza = None
+
+# =============================================================================
+# PROGRESO DE LOS TRABAJOS
+# =============================================================================
+
+
+def calcular_avance(etapa, datos):
+    """Devuelve el porcentaje global y el mensaje para una etapa y sus datos."""
+    inicio, fin, mensaje = ETAPAS_PROGRESO.get(etapa, (0, 0, etapa))
+    fraccion = 0
+
+    if etapa == 'lectura':
+        fraccion = datos.get('fraccion', 0)
+        mensaje = f"{mensaje} ({datos.get('filas', 0):,} filas)"
+    elif etapa == 'hoja':
+        filas_hoja = datos.get('filas_hoja') or 1
+        fraccion = ((datos['indice'] + min(datos.get('filas', 0) / filas_hoja, 1)) /
+                    datos['total'])
+        mensaje = (f"{mensaje} {datos['hoja']} "
+                   f"({datos.get('filas', 0):,} de {datos.get('filas_hoja', 0):,} filas)")
+
+    return round(inicio + (fin - inicio) * min(fraccion, 1)), mensaje
+
+
+class RegistroProgreso:
+    """Publica el avance de un trabajo en un archivo JSON junto a su resultado.
+
+    Se ejecuta dentro del proceso de trabajo; el proceso principal lee el
+    archivo al consultar el estado. También mide la duración de cada etapa
+    y registra sus filas, la memoria residente del proceso al cerrarla y la
+    que ocupa el DataFrame cuando la etapa la informa. Al finalizar agrega
+    el pico de memoria del proceso.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.etapa_actual = None
+        self.inicio_etapa = None
+        self.ultimo_guardado = 0
+        self.duraciones = {}
+        self.detalles = {}
+        self.datos = {}
+
+    def __call__(self, etapa, **datos):
+        ahora = time.time()
+        nombre = f"{etapa}:{datos['hoja']}" if 'hoja' in datos else etapa
+
+        cambio_etapa = nombre != self.etapa_actual
+        if cambio_etapa:
+            self._cerrar_etapa(ahora)
+            self.etapa_actual = nombre
+            self.inicio_etapa = ahora
+
+        filas = datos.get('filas_hoja', datos.get('filas'))
+        if filas is not None:
+            self.detalles.setdefault(nombre, {})['filas'] = filas
+        if datos.get('filas_sin_fecha'):
+            self.detalles.setdefault(nombre, {})['filas_sin_fecha'] = datos['filas_sin_fecha']
+        if datos.get('memoria_datos') is not None:
+            self.detalles.setdefault(nombre, {})['memoria_datos'] = datos['memoria_datos']
+        if datos.get('pivote_excel') is not None:
+            self.detalles.setdefault(nombre, {})['pivote_excel'] = datos['pivote_excel']
+
+        progreso, mensaje = calcular_avance(etapa, datos)
+        self.datos = {
+            'etapa': etapa,
+            'mensaje': mensaje,
+            'progreso': progreso,
+            'filas': datos.get('filas'),
+        }
+
+        if cambio_etapa or ahora - self.ultimo_guardado >= INTERVALO_PROGRESO:
+            self._guardar(ahora)
+
+    def _cerrar_etapa(self, ahora):
+        """Acumula la duración de la etapa en curso."""
+        if self.etapa_actual is not None:
+            self.duraciones[self.etapa_actual] = round(
+                self.duraciones.get(self.etapa_actual, 0) +
+                ahora - self.inicio_etapa, 3
+            )
+            detalles = self.detalles.setdefault(self.etapa_actual, {})
+            detalles['memoria_residente'] = memoria_actual_bytes()
+
+    def _guardar(self, ahora):
+        """Escribe el progreso de forma atómica."""
+        self.ultimo_guardado = ahora
+        temporal = f"{self.ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.datos, etapas=self.duraciones,
+                           detalles=self.detalles), f)
+        os.replace(temporal, self.ruta)
+
+    def finalizar(self):
+        """Cierra la última etapa y guarda las duraciones finales."""
+        ahora = time.time()
+        self._cerrar_etapa(ahora)
+        self.etapa_actual = None
+        self.datos['memoria_pico'] = memoria_pico_bytes()
+        self._guardar(ahora)
+
+
+def leer_progreso(ruta):
+    """Lee el último progreso publicado por el proceso de trabajo."""
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# =============================================================================
+# EJECUCIÓN EN PROCESOS DE TRABAJO
+# =============================================================================
+
+
+def _ejecutar_trabajo(archivos, tipo_reporte, ruta_resultado, ruta_progreso):
+    """Genera el reporte en un proceso de trabajo directamente en su ruta final.
+
+    ``archivos`` es una lista de (ruta, encoding, columnas); con varios CSV
+    se genera un único reporte combinado del tipo ``tipo_reporte``.
+    """
+    progreso = RegistroProgreso(ruta_progreso)
+    try:
+        return generar_reporte_combinado(
+            archivos, progreso,
+            al_procesar=actualizar_historial if HISTORIAL_HABILITADO else None,
+            destino=ruta_resultado, tipo=tipo_reporte
+        )
+    finally:
+        progreso.finalizar()
+        for ruta_csv, _, _ in archivos:
+            os.unlink(ruta_csv)
+
+
+def _ejecutar_trabajo_historial(desde, hasta, tipo_reporte, ruta_resultado, ruta_progreso):
+    """Genera el reporte de un rango (año, mes) leyendo solo el historial.
+
+    El resumen se calcula con los cubos mensuales, sin leer los registros.
+    """
+    progreso = RegistroProgreso(ruta_progreso)
+    try:
+        notificar_progreso(progreso, 'lectura', fraccion=0, filas=0)
+        if tipo_reporte == TIPO_REPORTE_RESUMEN:
+            return generar_excel_resumen_cubo(leer_cubos(desde, hasta), progreso,
+                                              ruta_resultado)
+        df = leer_historial(desde, hasta)
+        notificar_progreso(progreso, 'procesamiento', filas=len(df))
+        return generar_excel(df, progreso, ruta_resultado)
+    finally:
+        progreso.finalizar()
+
+
+def _obtener_executor():
+    """Devuelve el grupo de procesos, creándolo si no existe o está roto."""
+    global _executor, _hilo_limpieza
+
+    if _executor is None:
+        os.makedirs(DIRECTORIO_TRABAJOS, exist_ok=True)
+        _executor = ProcessPoolExecutor(max_workers=MAX_PROCESOS_TRABAJOS)
+
+    if _hilo_limpieza is None:
+        _hilo_limpieza = threading.Thread(target=_limpiar_periodicamente,
+                                          daemon=True)
+        _hilo_limpieza.start()
+
+    return _executor
+
+
+def _reiniciar_executor():
+    """Descarta un grupo de procesos roto (por ejemplo, si un proceso murió)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+# =============================================================================
+# REGISTRO DE TRABAJOS
+# =============================================================================
+
+
+def _registrar_metricas_etapas(etapas, detalles):
+    """Registra las etapas medidas en el proceso de trabajo."""
+    for nombre, segundos in etapas.items():
+        etapa, _, hoja = nombre.partition(':')
+        datos = detalles.get(nombre, {})
+        registrar_etapa(etapa, segundos, filas=datos.get('filas'),
+                        hoja=hoja or None,
+                        memoria_residente=datos.get('memoria_residente'),
+                        memoria_datos=datos.get('memoria_datos'))
+        if datos.get('filas_sin_fecha'):
+            incrementar('filas_sin_fecha_total', datos['filas_sin_fecha'])
+        # El servicio de Excel corre en el proceso de trabajo
+        pivote = datos.get('pivote_excel')
+        if pivote:
+            incrementar('pivote_excel_libros_total', resultado=pivote['resultado'])
+            if pivote.get('reinicio'):
+                incrementar('pivote_excel_reinicios_total', motivo=pivote['reinicio'])
+
+
+def _al_finalizar(id_trabajo, future):
+    """Registra el resultado del trabajo cuando el proceso termina.
+
+    La lectura del progreso, la copia a la caché y la eliminación del
+    resultado fallido se hacen fuera de ``_bloqueo``; con el bloqueo solo se
+    actualiza el registro del trabajo.
+    """
+    global _memoria_pico_trabajos
+
+    with _bloqueo:
+        trabajo = _trabajos.get(id_trabajo)
+        if trabajo is None:
+            return
+        ruta_progreso = trabajo['ruta_progreso']
+        ruta_resultado = trabajo['ruta_resultado']
+        clave_cache = trabajo['clave_cache']
+
+    # Conservar las duraciones por etapa y descartar el archivo de progreso
+    progreso = leer_progreso(ruta_progreso)
+    try:
+        os.unlink(ruta_progreso)
+    except OSError:
+        pass
+
+    try:
+        future.result()
+        error = None
+    except Exception as e:  # pylint: disable=broad-except
+        error = e
+        # El libro a medio escribir no se puede descargar
+        try:
+            os.unlink(ruta_resultado)
+        except OSError:
+            pass
+
+    if error is None and clave_cache:
+        guardar_en_cache(clave_cache, ruta_resultado)
+
+    with _bloqueo:
+        trabajo['finalizado'] = time.time()
+        if progreso and progreso.get('memoria_pico') is not None:
+            _memoria_pico_trabajos = max(_memoria_pico_trabajos or 0, progreso['memoria_pico'])
+        if progreso:
+            trabajo['etapas'].update(progreso['etapas'])
+            detalles = progreso.get('detalles', {})
+            trabajo['filas_sin_fecha'] = detalles.get('procesamiento', {}).get('filas_sin_fecha', 0)
+        if error is None:
+            trabajo['estado'] = ESTADO_COMPLETADO
+            trabajo['progreso'] = 100
+        else:
+            trabajo['estado'] = ESTADO_ERROR
+            trabajo['error'] = 'No se pudo generar el reporte. Verifica el formato de tu archivo CSV.'
+            if isinstance(error, BrokenProcessPool):
+                _reiniciar_executor()
+        duracion = trabajo['finalizado'] - trabajo['creado']
+        etapas = dict(trabajo['etapas'])
+
+    if progreso:
+        _registrar_metricas_etapas(progreso['etapas'], progreso.get('detalles', {}))
+    if error is None:
+        incrementar('trabajos_total', estado=ESTADO_COMPLETADO)
+        observar('trabajo_segundos', duracion)
+        print(f"Trabajo {id_trabajo} completado en {duracion:.1f} s: {etapas}")
+    else:
+        print(f"Error en el trabajo {id_trabajo}: {error}")
+        incrementar('trabajos_total', estado=ESTADO_ERROR)
+
+
+def memoria_pico_trabajos():
+    """Mayor pico de memoria informado por los procesos de trabajo (None si no hubo)."""
+    with _bloqueo:
+        return _memoria_pico_trabajos
+
+
+def _nuevo_trabajo(usuario, etapas=None, clave_cache=None, costo=0):
+    """Crea el registro de un trabajo en cola con sus rutas de resultado y progreso."""
+    id_trabajo = uuid.uuid4().hex
+    ruta_resultado = os.path.join(DIRECTORIO_TRABAJOS, f"{id_trabajo}.xlsx")
+    ruta_progreso = os.path.join(DIRECTORIO_TRABAJOS, f"{id_trabajo}.progreso.json")
+    os.makedirs(DIRECTORIO_TRABAJOS, exist_ok=True)
+    return {
+        'id': id_trabajo,
+        'usuario': usuario,
+        'estado': ESTADO_EN_COLA,
+        'creado': time.time(),
+        'finalizado': None,
+        'error': None,
+        'progreso': 0,
+        'mensaje': None,
+        'filas': None,
+        'filas_sin_fecha': 0,
+        'etapas': dict(etapas or {}),
+        'clave_cache': clave_cache,
+        'desde_cache': False,
+        'descargas': 0,
+        'costo': costo,
+        'ruta_resultado': ruta_resultado,
+        'ruta_progreso': ruta_progreso,
+        'future': None
+    }
+
+
+def _encolar(trabajo, funcion, *argumentos):
+    """Envía el trabajo al grupo de procesos y devuelve su identificador."""
+    id_trabajo = trabajo['id']
+    argumentos = argumentos + (trabajo['ruta_resultado'], trabajo['ruta_progreso'])
+    with _bloqueo:
+        try:
+            future = _obtener_executor().submit(funcion, *argumentos)
+        except BrokenProcessPool:
+            _reiniciar_executor()
+            future = _obtener_executor().submit(funcion, *argumentos)
+
+        trabajo['future'] = future
+        _trabajos[id_trabajo] = trabajo
+
+    future.add_done_callback(lambda f: _al_finalizar(id_trabajo, f))
+    return id_trabajo
+
+
+def crear_trabajo(usuario, archivos, etapas=None, clave_cache=None,
+                  tipo_reporte=TIPO_REPORTE_DETALLADO, costo=0):
+    """Encola la generación del reporte y devuelve el identificador del trabajo.
+
+    ``archivos`` es una lista de (ruta, encoding, columnas del archivo) de
+    uno o varios CSV que se combinan en un solo reporte. El trabajo se hace
+    cargo de los CSV temporales y los elimina al terminar.
+    ``etapas`` permite registrar duraciones medidas antes de encolarlo. Si
+    ``clave_cache`` corresponde a un reporte ya generado, el trabajo se crea
+    completado sin volver a procesar los archivos. ``tipo_reporte`` es uno
+    de TIPOS_REPORTE de procesamiento. ``costo`` (filas estimadas) se suma a
+    la cola; si la excede se lanza ServidorOcupado y los CSV se eliminan.
+    """
+    trabajo = _nuevo_trabajo(usuario, etapas, clave_cache, costo)
+    archivos = [(ruta, encoding, list(columnas)) for ruta, encoding, columnas in archivos]
+
+    if clave_cache and obtener_de_cache(clave_cache, trabajo['ruta_resultado']):
+        for ruta_csv, _, _ in archivos:
+            os.unlink(ruta_csv)
+        trabajo.update(estado=ESTADO_COMPLETADO, finalizado=time.time(),
+                       progreso=100, desde_cache=True)
+        incrementar('trabajos_total', estado='cache')
+        with _bloqueo:
+            _trabajos[trabajo['id']] = trabajo
+        return trabajo['id']
+
+    try:
+        verificar_cola(costo, costo_trabajos_pendientes())
+    except ServidorOcupado:
+        for ruta_csv, _, _ in archivos:
+            os.unlink(ruta_csv)
+        raise
+    return _encolar(trabajo, _ejecutar_trabajo, archivos, tipo_reporte)
+
+
+def crear_trabajo_historial(usuario, desde=None, hasta=None,
+                            tipo_reporte=TIPO_REPORTE_DETALLADO):
+    """Encola un reporte del historial para el rango (año, mes) inclusivo."""
+    return _encolar(_nuevo_trabajo(usuario), _ejecutar_trabajo_historial,
+                    desde, hasta, tipo_reporte)
+
+
+def obtener_trabajo(id_trabajo, usuario):
+    """Devuelve una copia del trabajo si existe y pertenece al usuario."""
+    with _bloqueo:
+        trabajo = _trabajos.get(id_trabajo)
+        if trabajo is None or trabajo['usuario'] != usuario:
+            return None
+
+        copia = {clave: valor for clave, valor in trabajo.items()
+                 if clave != 'future'}
+
+    # El progreso publicado por el proceso indica que el trabajo ya empezó
+    if copia['estado'] == ESTADO_EN_COLA:
+        progreso = leer_progreso(copia['ruta_progreso'])
+        if progreso:
+            copia['estado'] = ESTADO_PROCESANDO
+            copia['progreso'] = progreso['progreso']
+            copia['mensaje'] = progreso['mensaje']
+            copia['filas'] = progreso['filas']
+            copia['etapas'] = dict(copia['etapas'], **progreso['etapas'])
+
+    return copia
+
+
+def describir_trabajo(trabajo):
+    """Datos públicos del trabajo para la respuesta JSON."""
+    return {
+        'id': trabajo['id'],
+        'estado': trabajo['estado'],
+        'error': trabajo['error'],
+        'progreso': trabajo['progreso'],
+        'mensaje': trabajo['mensaje'],
+        'filas': trabajo['filas'],
+        'filas_sin_fecha': trabajo['filas_sin_fecha'],
+        'etapas': trabajo['etapas'],
+        'desde_cache': trabajo['desde_cache'],
+        'segundos': round((trabajo['finalizado'] or time.time()) -
+                          trabajo['creado'], 1)
+    }
+
+
+def iniciar_descarga(id_trabajo):
+    """Marca el resultado como en envío para que la limpieza lo conserve."""
+    with _bloqueo:
+        if id_trabajo in _trabajos:
+            _trabajos[id_trabajo]['descargas'] += 1
+
+
+def finalizar_descarga(id_trabajo):
+    """Libera el resultado cuando la respuesta termina de enviarse."""
+    with _bloqueo:
+        if id_trabajo in _trabajos:
+            _trabajos[id_trabajo]['descargas'] -= 1
+
+
+def contar_trabajos_pendientes():
+    """Cantidad de trabajos en cola o en proceso."""
+    with _bloqueo:
+        return sum(1 for trabajo in _trabajos.values()
+                   if trabajo['future'] is not None and not trabajo['future'].done())
+
+
+def costo_trabajos_pendientes():
+    """Filas estimadas de los trabajos en cola o en proceso."""
+    with _bloqueo:
+        return sum(trabajo['costo'] for trabajo in _trabajos.values()
+                   if trabajo['future'] is not None and not trabajo['future'].done())
+
+
+registrar_indicador('trabajos_pendientes', contar_trabajos_pendientes,
+                    'Trabajos de reporte en cola o en proceso')
+
+# =============================================================================
+# DATOS PROCESADOS DE LA API
+# =============================================================================
+
+
+def guardar_datos_api(usuario, df):
+    """Guarda el DataFrame procesado de una subida a la API y devuelve su id.
+
+    Las páginas siguientes se leen de este archivo sin volver a subir ni a
+    procesar los CSV. Vence igual que los trabajos (TTL_TRABAJOS).
+    """
+    id_datos = uuid.uuid4().hex
+    ruta = os.path.join(DIRECTORIO_TRABAJOS, f"{id_datos}.datos.pkl")
+    os.makedirs(DIRECTORIO_TRABAJOS, exist_ok=True)
+    # pickle conserva los tipos categóricos sin depender de pyarrow
+    df.to_pickle(ruta)
+    with _bloqueo:
+        _datos_api[id_datos] = {'usuario': usuario, 'ruta': ruta, 'creado': time.time()}
+    return id_datos
+
+
+def leer_datos_api(id_datos, usuario):
+    """DataFrame guardado con guardar_datos_api, o None si venció o es de otro usuario."""
+    if not re.fullmatch(r'[0-9a-f]{32}', id_datos):
+        return None
+    with _bloqueo:
+        datos = _datos_api.get(id_datos)
+        if (datos is None or datos['usuario'] != usuario or
+                datos['creado'] < time.time() - TTL_TRABAJOS):
+            return None
+    try:
+        return pd.read_pickle(datos['ruta'])
+    except OSError:
+        return None
+
+# =============================================================================
+# LIMPIEZA DE RESULTADOS VENCIDOS
+# =============================================================================
+
+
+def limpiar_trabajos_vencidos():
+    """Elimina los trabajos finalizados, los datos de la API y los archivos
+    con más de TTL_TRABAJOS."""
+    limite = time.time() - TTL_TRABAJOS
+
+    with _bloqueo:
+        vencidos = [
+            id_trabajo for id_trabajo, trabajo in _trabajos.items()
+            if trabajo['finalizado'] is not None and trabajo['finalizado'] < limite
+            # Un resultado que se está enviando se elimina al terminar el envío
+            and not trabajo['descargas']
+        ]
+        for id_trabajo in vencidos:
+            del _trabajos[id_trabajo]
+        for id_datos in [id_datos for id_datos, datos in _datos_api.items()
+                         if datos['creado'] < limite]:
+            del _datos_api[id_datos]
+        activos = {ruta for trabajo in _trabajos.values()
+                   for ruta in (trabajo['ruta_resultado'], trabajo['ruta_progreso'])}
+        activos.update(datos['ruta'] for datos in _datos_api.values())
+
+    # También se eliminan resultados huérfanos de ejecuciones anteriores
+    if not os.path.isdir(DIRECTORIO_TRABAJOS):
+        return
+    for nombre in os.listdir(DIRECTORIO_TRABAJOS):
+        ruta = os.path.join(DIRECTORIO_TRABAJOS, nombre)
+        try:
+            if ruta not in activos and os.path.getmtime(ruta) < limite:
+                os.unlink(ruta)
+        except OSError as e:
+            print(f"No se pudo eliminar el resultado {ruta}: {e}")
+
+
+def _limpiar_periodicamente():
+    """Bucle del hilo de limpieza."""
+    while True:
+        time.sleep(INTERVALO_LIMPIEZA)
+        limpiar_trabajos_vencidos()
@@ -4,19 +4,22 @@ Este archivo permite ejecutar la aplicación en un servidor de producción.
 """
 import os
 import sys
-from waitress import serve
+from waitress import create_server
 
 # Asegurarse de que el directorio actual esté en el path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
 # Importar la aplicación Flask
-from app import app  # Asumiendo que tu archivo principal se llama app.py
+from app import MAX_SUBIDA_BYTES, app  # Asumiendo que tu archivo principal se llama app.py
+from admision import HILOS_SERVIDOR
+from metricas import registrar_indicador
 
 # Configuración del servidor
 HOST = '0.0.0.0'  # Permite conexiones desde cualquier IP
 PORT = 5001       # Puerto por defecto
-THREADS = 4       # Número de hilos para manejar requests
+THREADS = HILOS_SERVIDOR  # Número de hilos para manejar requests (HILOS_SERVIDOR)
+CONNECTION_LIMIT = 100
 
 def create_app():
     """Función factory para crear la aplicación."""
@@ -26,6 +29,21 @@ def create_app():
     
     return app
 
+def registrar_metricas_servidor(server):
+    """Expone en /metrics la cola y los hilos de Waitress."""
+    dispatcher = server.task_dispatcher
+    registrar_indicador('waitress_cola_tareas', lambda: len(dispatcher.queue),
+                        'Solicitudes en espera de un hilo libre')
+    registrar_indicador('waitress_hilos_activos', lambda: dispatcher.active_count,
+                        'Hilos de Waitress atendiendo una solicitud')
+    registrar_indicador('waitress_hilos', lambda: len(dispatcher.threads),
+                        'Hilos de Waitress disponibles')
+    registrar_indicador('waitress_conexiones',
+                        lambda: len(getattr(server, 'active_channels', {})),
+                        'Conexiones abiertas con el servidor')
+    registrar_indicador('waitress_limite_conexiones', lambda: CONNECTION_LIMIT,
+                        'Máximo de conexiones simultáneas (connection_limit)')
+
 if __name__ == '__main__':
     application = create_app()
     
@@ -35,14 +53,16 @@ if __name__ == '__main__':
     print("Presiona Ctrl+C para detener el servidor")
     
     try:
-        serve(
+        server = create_server(
             application,
             host=HOST,
             port=PORT,
             threads=THREADS,
             url_scheme='http',
+            # Rechaza cuerpos mayores antes de leerlos completos
+            max_request_body_size=MAX_SUBIDA_BYTES,
             # Configuraciones adicionales de Waitress
-            connection_limit=100,
+            connection_limit=CONNECTION_LIMIT,
             cleanup_interval=30,
             channel_timeout=120,
             log_socket_errors=True,
@@ -52,6 +72,9 @@ if __name__ == '__main__':
             recv_bytes=65536,
             send_bytes=18000
         )
+        registrar_metricas_servidor(server)
+        server.print_listen("Serving on http://{}:{}")
+        server.run()
     except KeyboardInterrupt:
         print("\nServidor detenido.")
     except Exception as e: